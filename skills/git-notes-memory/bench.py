@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+GitNotesMemory benchmarks
+
+    python3 bench.py search [--sizes 1000 10000 100000] [--queries 50]
+    python3 bench.py encoding [--size 10000]
+    python3 bench.py writers [--writers 8] [--ops 25]
+    python3 bench.py topic [--size 5000] [--queries 20]
+
+search: inverted-index BM25 search() against the previous linear scan
+over every memory, on synthetic stores built in a temporary repo.
+encoding: blob bytes and parse time of JSON against packed blobs.
+writers: parallel processes calling remember() on one branch; every
+memory must survive the compare-and-swap retries.
+topic: get_topic() through the name index against the previous scan
+over every entity, topic and memory, one fresh session per query.
+"""
+
+import argparse
+import json
+import multiprocessing
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import memory
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "zen", "par", "dex", "qua", "bel", "tor"]
+
+def _vocabulary(size: int = 5000, seed: int = 0):
+    """Pseudo-words with Zipf weights, like word frequencies in real text."""
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    words = sorted(words)
+    rng.shuffle(words)
+    weights = [1 / (rank + 1) ** 1.1 for rank in range(len(words))]
+    return words, weights
+
+WORDS, WEIGHTS = _vocabulary()
+
+def _words(rng: random.Random, k: int):
+    return rng.choices(WORDS, WEIGHTS, k=k)
+
+def _content(rng: random.Random, i: int):
+    words = " ".join(_words(rng, 12))
+    if i % 2:
+        return {"topic": _words(rng, 1)[0], "note": words, "n": i}
+    return f"{words} #{_words(rng, 1)[0]} item{i}"
+
+def _populate(path: str, size: int, seed: int = 0):
+    rng = random.Random(seed)
+    with memory.session(path):
+        for i in range(size):
+            tags = ",".join(_words(rng, 2))
+            memory.remember(_content(rng, i), tags=tags, cwd=path)
+
+def scan_search(mem, query: str):
+    """The previous search(): substring counts over every memory's JSON."""
+    query_terms = [t.strip() for t in query.lower().split() if t.strip()]
+    results = []
+    for mid, entry in mem.items():
+        score = 0
+        content_str = json.dumps(entry.get("d", "")).lower()
+        for term in query_terms:
+            if term in content_str:
+                score += content_str.count(term)
+        entities_str = " ".join(entry.get("e", [])).lower()
+        for term in query_terms:
+            if term in entities_str:
+                score += 2
+        tags_str = " ".join(entry.get("g", [])).lower()
+        for term in query_terms:
+            if term in tags_str:
+                score += 2
+        if score > 0:
+            results.append((mid, score))
+    results.sort(key=lambda x: -x[1])
+    return results[:15]
+
+def bench_search(sizes, queries: int):
+    rng = random.Random(1)
+    qs = [" ".join(_words(rng, rng.randint(1, 3))) for _ in range(queries)]
+    print(f"{'memories':>9} {'build s':>8} {'index ms/q':>11} {'scan ms/q':>10} {'speedup':>8}")
+    for size in sizes:
+        path = tempfile.mkdtemp()
+        try:
+            t = time.perf_counter()
+            _populate(path, size)
+            build = time.perf_counter() - t
+
+            with memory.session(path):
+                for q in qs:
+                    memory.search(q, cwd=path)  # load idx and the touched shards
+                t = time.perf_counter()
+                for q in qs:
+                    memory.search(q, cwd=path)
+                index_ms = (time.perf_counter() - t) * 1000 / len(qs)
+
+                mem = memory._mem(path)
+                mem.load_all()
+                t = time.perf_counter()
+                for q in qs:
+                    scan_search(mem, q)
+                scan_ms = (time.perf_counter() - t) * 1000 / len(qs)
+
+            print(f"{size:>9} {build:>8.1f} {index_ms:>11.2f} {scan_ms:>10.2f} {scan_ms / index_ms:>7.1f}x")
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+def _parse_ms(blobs, repeat: int = 5) -> float:
+    t = time.perf_counter()
+    for _ in range(repeat):
+        for blob in blobs:
+            memory._parse(blob)
+    return (time.perf_counter() - t) * 1000 / repeat
+
+def bench_encoding(size: int):
+    path = tempfile.mkdtemp()
+    try:
+        _populate(path, size)
+        print(f"{'blob':>5} {'json KB':>8} {'packed KB':>10} {'ratio':>6} {'json ms':>8} {'packed ms':>10} {'ratio':>6}")
+        with memory.session(path) as store:
+            for name in ["mem", "ent", "idx", "fts"]:
+                data = store.load(name)
+                smap = data[memory.NESTED[name]] if name in memory.NESTED else data
+                if name in memory.SHARDED:
+                    smap.load_all()
+                    parts = [part for part in smap.shards.values() if part]
+                else:
+                    parts = [data]
+                memory.ENCODING = "json"
+                plain = [memory._dump(part) for part in parts]
+                memory.ENCODING = "packed"
+                packed = [memory._dump(part) for part in parts]
+                memory.ENCODING = "json"
+                sizes = [sum(map(len, blobs)) / 1024 for blobs in (plain, packed)]
+                times = [_parse_ms(blobs) for blobs in (plain, packed)]
+                print(f"{name:>5} {sizes[0]:>8.0f} {sizes[1]:>10.0f} {sizes[0] / sizes[1]:>5.1f}x "
+                      f"{times[0]:>8.1f} {times[1]:>10.1f} {times[0] / times[1]:>5.1f}x")
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+def _writer(path: str, k: int, ops: int, retries):
+    flush = memory.MemoryStore.flush
+
+    def counted(store):
+        ok = flush(store)
+        if not ok:
+            with retries.get_lock():
+                retries.value += 1
+        return ok
+
+    memory.MemoryStore.flush = counted
+    rng = random.Random(k)
+    for i in range(ops):
+        memory.remember(f"writer {k} op {i} " + " ".join(_words(rng, 6)), tags=f"w{k}", cwd=path)
+
+def bench_writers(writers: int, ops: int):
+    path = tempfile.mkdtemp()
+    try:
+        memory.sync_start(path)  # repo, root commit and auto-init memory
+        before = len(memory._mem(path))
+        retries = multiprocessing.Value("i", 0)
+        procs = [multiprocessing.Process(target=_writer, args=(path, k, ops, retries))
+                 for k in range(writers)]
+        t = time.perf_counter()
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+        elapsed = time.perf_counter() - t
+
+        stored = len(memory._mem(path)) - before
+        expected = writers * ops
+        failed = sum(1 for proc in procs if proc.exitcode)
+        print(f"{writers} writers x {ops} remember(): {stored}/{expected} stored, "
+              f"{retries.value} retried writes, {failed} failed writers, "
+              f"{expected / elapsed:.0f} writes/s")
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+def bench_topic(size: int, queries: int):
+    path = tempfile.mkdtemp()
+    try:
+        _populate(path, size)
+        rng = random.Random(2)
+        qs = [rng.choice(WORDS) for _ in range(queries)]
+
+        def scan(q):
+            mids = memory._topic_scan(q, memory._idx(path), memory._ent(path), memory._mem(path))
+            return sorted(mids)
+
+        print(f"{'memories':>9} {'index ms/q':>11} {'scan ms/q':>10} {'speedup':>8}")
+        times = []
+        for fn in (lambda q: memory.get_topic(q, cwd=path), scan):
+            t = time.perf_counter()
+            for q in qs:
+                with memory.session(path):
+                    fn(q)
+            times.append((time.perf_counter() - t) * 1000 / len(qs))
+        print(f"{size:>9} {times[0]:>11.1f} {times[1]:>10.1f} {times[1] / times[0]:>7.1f}x")
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+def main():
+    p = argparse.ArgumentParser(description="GitNotesMemory benchmarks")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    s = sub.add_parser("search", help="BM25 index vs linear scan")
+    s.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    s.add_argument("--queries", type=int, default=50)
+
+    e = sub.add_parser("encoding", help="JSON vs packed blobs")
+    e.add_argument("--size", type=int, default=10000)
+
+    w = sub.add_parser("writers", help="parallel remember() on one branch")
+    w.add_argument("--writers", type=int, default=8)
+    w.add_argument("--ops", type=int, default=25)
+
+    t = sub.add_parser("topic", help="get_topic name index vs scan")
+    t.add_argument("--size", type=int, default=5000)
+    t.add_argument("--queries", type=int, default=20)
+
+    args = p.parse_args()
+    if args.cmd == "search":
+        bench_search(args.sizes, args.queries)
+    elif args.cmd == "encoding":
+        bench_encoding(args.size)
+    elif args.cmd == "writers":
+        bench_writers(args.writers, args.ops)
+    elif args.cmd == "topic":
+        bench_topic(args.size, args.queries)
+
+if __name__ == "__main__":
+    main()
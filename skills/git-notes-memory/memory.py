@@ -10,13 +10,35 @@ A persistent, branch-aware memory system using git notes:
 - Tiered retrieval for token efficiency
 """
 
+import atexit
 import subprocess
 import json
 import hashlib
+import heapq
+import math
+import os
+import random
 import re
-from datetime import datetime
+import sys
+import functools
+import inspect
+import io
+import tempfile
+import zlib
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from collections.abc import MutableMapping
+from itertools import accumulate
+from typing import Optional, List, Dict, Any, Callable, Iterable, Iterator
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
 
 # =============================================================================
 # GIT OPS - BRANCH AWARE
@@ -35,17 +57,14 @@ def _branch(cwd: str = ".") -> str:
     branch = _git(["rev-parse", "--abbrev-ref", "HEAD"], cwd)
     return branch if branch and branch != "HEAD" else "main"
 
-def _ref(name: str, cwd: str = ".") -> str:
-    """Get branch-specific ref name."""
-    branch = _branch(cwd)
-    # Sanitize branch name for ref (replace / with -)
-    safe_branch = branch.replace("/", "-")
-    return f"refs/notes/{name}-{safe_branch}"
+_roots: Dict[Path, str] = {}  # root commit per repository, fixed once it exists
 
 def _ensure_git(cwd: str = ".") -> str:
     """Ensure git repo exists and has at least one commit, return root commit."""
     path = Path(cwd).resolve()
-    
+    if path in _roots:
+        return _roots[path]
+
     # Check if git repo exists
     if subprocess.run(["git", "rev-parse", "--git-dir"], cwd=path, capture_output=True).returncode != 0:
         subprocess.run(["git", "init"], cwd=path, capture_output=True)
@@ -59,46 +78,881 @@ def _ensure_git(cwd: str = ".") -> str:
     if not root:
         subprocess.run(["git", "commit", "--allow-empty", "-m", "init"], cwd=path, capture_output=True)
         root = _git(["rev-list", "--max-parents=0", "HEAD"], cwd=str(path))
-    
+
+    if root:
+        _roots[path] = root
     return root
 
-def _load(name: str, cwd: str = ".") -> Dict:
-    """Load notes for current branch, with fallback to parent branches."""
-    root = _ensure_git(cwd)
-    ref = _ref(name, cwd)
+# =============================================================================
+# GIT READS - LONG-LIVED CAT-FILE WORKERS
+# =============================================================================
+
+# Readers kept open per repository; 0 spawns one cat-file per read instead
+POOL_SIZE = int(os.environ.get("GIT_NOTES_MEMORY_POOL", "2"))
+_OID_BYTES = 20  # binary object ids in raw trees (SHA-1 repositories)
+_BATCH_INPUT = 32 * 1024  # spec bytes written before reading replies: stays below the pipe buffer
+
+def _read_batch(out, count: int) -> List[Optional[bytes]]:
+    """Read count cat-file --batch replies from a binary stream."""
+    result = []
+    for _ in range(count):
+        line = out.readline()
+        if not line:
+            raise EOFError("cat-file exited")
+        header = line.split()
+        if len(header) != 3:
+            # "<spec> missing" / "<spec> ambiguous"
+            result.append(None)
+            continue
+        size = int(header[2])
+        result.append(out.read(size + 1)[:size])
+    return result
+
+class CatFile:
+    """One `git cat-file --batch` coprocess answering object reads."""
+
+    def __init__(self, cwd: str = "."):
+        self.proc = subprocess.Popen(["git", "cat-file", "--batch"], cwd=cwd,
+                                     stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     stderr=subprocess.DEVNULL)
+
+    def read(self, specs: List[str]) -> List[Optional[bytes]]:
+        result, chunk, size = [], [], 0
+        for spec in specs:
+            chunk.append(spec)
+            size += len(spec) + 1
+            if size >= _BATCH_INPUT:
+                result += self._read(chunk)
+                chunk, size = [], 0
+        return result + self._read(chunk) if chunk else result
+
+    def _read(self, specs: List[str]) -> List[Optional[bytes]]:
+        self.proc.stdin.write("".join(spec + "\n" for spec in specs).encode())
+        self.proc.stdin.flush()
+        return _read_batch(self.proc.stdout, len(specs))
+
+    def close(self):
+        if self.proc.poll() is None:
+            self.proc.stdin.close()
+            try:
+                self.proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        self.proc.stdout.close()
+
+class CatFilePool:
+    """Up to size CatFile workers per repository, shared by all threads.
+
+    A caller takes an idle worker (or starts one, or waits for one) for
+    the duration of a read. A worker whose pipe breaks is dropped and the
+    read retried on a fresh one.
+    """
+
+    def __init__(self, size: int = POOL_SIZE):
+        self.size = size
+        self._idle: Dict[str, List[CatFile]] = {}
+        self._busy: Dict[str, int] = {}
+        self._cond = threading.Condition()
+
+    def _acquire(self, key: str) -> CatFile:
+        with self._cond:
+            while True:
+                if self._idle.get(key):
+                    worker = self._idle[key].pop()
+                    break
+                if self._busy.get(key, 0) < self.size or self.size <= 0:
+                    worker = None
+                    break
+                self._cond.wait()
+            self._busy[key] = self._busy.get(key, 0) + 1
+        try:
+            return worker or CatFile(key)
+        except OSError:
+            self._release(key, None)
+            raise
+
+    def _release(self, key: str, worker: Optional[CatFile]):
+        with self._cond:
+            self._busy[key] -= 1
+            self._cond.notify()
+            if worker is not None and self.size > 0:
+                self._idle.setdefault(key, []).append(worker)
+                return
+        if worker is not None:
+            worker.close()
+
+    def read(self, specs: List[str], cwd: str = ".") -> List[Optional[bytes]]:
+        key = str(Path(cwd).resolve())
+        for attempt in range(2):
+            worker = self._acquire(key)
+            try:
+                result = worker.read(specs)
+            except (OSError, ValueError, EOFError):
+                worker.close()
+                self._release(key, None)
+                if attempt:
+                    raise
+                continue
+            self._release(key, worker)
+            return result
+
+    def close(self):
+        """Stop every worker; later reads spawn one cat-file each until
+        the size is set again. Busy workers stop when released."""
+        with self._cond:
+            idle, self._idle = self._idle, {}
+            self.size = 0
+            self._cond.notify_all()
+        for workers in idle.values():
+            for worker in workers:
+                worker.close()
+
+    def forget_workers(self):
+        """Drop workers inherited through fork(); they belong to the parent."""
+        self._idle, self._busy = {}, {}
+        self._cond = threading.Condition()
+
+_pool = CatFilePool()
+atexit.register(_pool.close)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_pool.forget_workers)
+
+def configure_pool(size: int):
+    """Set how many cat-file workers each repository keeps (0: none)."""
+    _pool.close()
+    _pool.size = size
+
+def _cat_blobs(specs: List[str], cwd: str = ".") -> List[Optional[bytes]]:
+    """Read several objects (e.g. "<commit>:<path>"), None for missing ones."""
+    if not specs:
+        return []
+    if _pool.size > 0:
+        return _pool.read(specs, cwd)
+    r = subprocess.run(["git", "cat-file", "--batch"], cwd=cwd, capture_output=True,
+                       input="".join(spec + "\n" for spec in specs).encode())
+    return _read_batch(io.BytesIO(r.stdout), len(specs))
+
+# =============================================================================
+# NOTES WRITER - PLUMBING, ONE TRANSACTION PER FLUSH
+# =============================================================================
+
+NOTES_MESSAGE = "Notes added by 'git-notes-memory'"
+
+def _git_in(args: List[str], data: bytes, cwd: str = ".") -> Optional[str]:
+    """Run git with data on stdin."""
+    r = subprocess.run(["git"] + args, cwd=cwd, input=data, capture_output=True)
+    return r.stdout.decode().strip() if r.returncode == 0 else None
+
+def _hash_blobs(blobs: List[bytes], cwd: str = ".") -> Optional[List[str]]:
+    """Write blobs to the object store, return their ids in order."""
+    if len(blobs) == 1:
+        oid = _git_in(["hash-object", "-w", "--stdin"], blobs[0], cwd)
+        return [oid] if oid else None
+
+    # Many blobs: one hash-object process reading paths instead of one per blob
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i, blob in enumerate(blobs):
+            path = os.path.join(tmp, str(i))
+            with open(path, "wb") as f:
+                f.write(blob)
+            paths.append(path)
+        out = _git_in(["hash-object", "-w", "--no-filters", "--stdin-paths"],
+                      "\n".join(paths).encode(), cwd)
+    return out.split("\n") if out else None
+
+def _notes_heads(cwd: str = ".") -> Dict[str, str]:
+    """Current commit of every notes ref."""
+    out = _git(["for-each-ref", "--format=%(refname) %(objectname)", "refs/notes/"], cwd)
+    heads = {}
+    for line in (out or "").split("\n"):
+        if line:
+            ref, oid = line.split(" ", 1)
+            heads[ref] = oid
+    return heads
+
+def _notes_tree(commit: Optional[str], cwd: str = ".") -> Dict[str, str]:
+    """Entries of a notes commit as path -> "mode type oid", fanout folded flat."""
+    if not commit:
+        return {}
+    entries = {}
+    pending = [("", f"{commit}:")]
+    while pending:
+        trees = _cat_blobs([spec for _, spec in pending], cwd)
+        subtrees = []
+        for (prefix, _), tree in zip(pending, trees):
+            for mode, name, oid in _tree_entries(tree or b""):
+                if mode == "40000":
+                    # Fanout directory of plain `git notes`
+                    subtrees.append((prefix + name, oid))
+                else:
+                    entries[prefix + name] = f"{mode} blob {oid}"
+        pending = subtrees
+    return entries
+
+def _tree_entries(tree: bytes):
+    """(mode, name, oid) of each entry of a raw tree object."""
+    pos = 0
+    while pos < len(tree):
+        space = tree.index(b" ", pos)
+        nul = tree.index(b"\0", space)
+        yield (tree[pos:space].decode(), tree[space + 1:nul].decode(),
+               tree[nul + 1:nul + 1 + _OID_BYTES].hex())
+        pos = nul + 1 + _OID_BYTES
+
+def _tree_sizes(commit: Optional[str], cwd: str = ".") -> Dict[str, int]:
+    """Blob sizes of the top-level entries of a notes commit."""
+    if not commit:
+        return {}
+    sizes = {}
+    for line in (_git(["ls-tree", "-l", commit], cwd) or "").split("\n"):
+        if line:
+            info, path = line.split("\t", 1)
+            size = info.split()[3]
+            if size != "-":
+                sizes[path] = int(size)
+    return sizes
+
+def _write_notes(notes: Dict[str, Dict[str, Optional[bytes]]], cwd: str = ".",
+                 heads: Optional[Dict[str, str]] = None,
+                 parents: Optional[Dict[str, List[str]]] = None) -> Optional[Dict[str, str]]:
+    """Commit notes to several refs and move them in one update-ref transaction.
+
+    notes maps ref -> {path: content}, where a path is an annotated object
+    id (or a shard entry) and None content removes it; other entries on
+    the ref are kept. heads gives the expected current commit of each ref
+    (read now if omitted); the transaction fails if any ref has moved.
+    parents adds parent commits after the current head (merged or
+    inherited notes), so refs of different branches share history.
+    Returns the new commit of each ref, or None on failure.
+    """
+    if heads is None:
+        heads = _notes_heads(cwd)
+
+    refs = sorted(notes)
+    keys = [(ref, path) for ref in refs for path in sorted(notes[ref])
+            if notes[ref][path] is not None]
+    oids = _hash_blobs([notes[ref][path] for ref, path in keys], cwd) if keys else []
+    if oids is None:
+        return None
+    blobs = dict(zip(keys, oids))
+
+    trees = []
+    for ref in refs:
+        entries = _notes_tree(heads.get(ref), cwd)
+        for path, content in notes[ref].items():
+            if content is None:
+                entries.pop(path, None)
+            else:
+                entries[path] = f"100644 blob {blobs[(ref, path)]}"
+        trees.append("".join(f"{info}\t{path}\n" for path, info in sorted(entries.items())))
+    out = _git_in(["mktree", "--batch"], "\n".join(trees).encode(), cwd)
+    if not out:
+        return None
+
+    tx, new_heads = [], {}
+    for ref, tree in zip(refs, out.split("\n")):
+        args = ["commit-tree", tree, "-m", NOTES_MESSAGE]
+        for parent in ([heads[ref]] if heads.get(ref) else []) + (parents or {}).get(ref, []):
+            args += ["-p", parent]
+        commit = _git(args, cwd)
+        if not commit:
+            return None
+        if heads.get(ref):
+            tx.append(f"update {ref} {commit} {heads[ref]}\n")
+        else:
+            tx.append(f"create {ref} {commit}\n")
+        new_heads[ref] = commit
+
+    if _git_in(["update-ref", "--stdin"], "".join(tx).encode(), cwd) is None:
+        return None
+    return new_heads
+
+# =============================================================================
+# SHARDS - PREFIX PARTITIONS OF mem, ent, idx, fts AND lex
+# =============================================================================
 
-    # Try current branch
-    content = _git(["notes", "--ref", ref, "show", root], cwd)
-    if content:
+SHARD_CHARS = 2
+
+def _shard(key: str) -> str:
+    """Shard of a memory id or entity name (hash prefix)."""
+    return hashlib.md5(key.encode()).hexdigest()[:SHARD_CHARS]
+
+def _prefix_shard(token: str) -> str:
+    """Shard of a search token (its first characters, hex encoded), so a
+    prefix lookup touches one shard."""
+    return token[:SHARD_CHARS].encode().hex()
+
+# Blobs stored as one note per shard: the root note holds a manifest
+# {"_v": 2, "n": {shard: entries}} and each shard is a "shard.<prefix>"
+# entry in the same notes tree. Other blobs stay a single root note.
+SHARDED = {"mem": _shard, "ent": _shard, "idx": _shard, "fts": _prefix_shard, "lex": _prefix_shard}
+
+# Sharded blobs where only one key holds the per-entry map; their other
+# keys are small and ride along in the manifest as "x".
+NESTED = {"ent": "e", "idx": "m"}
+
+def _shard_path(shard: str) -> str:
+    return f"shard.{shard}"
+
+STATS_PATH = "stats"  # per-branch stats entry in the mem notes tree
+
+def _is_manifest(note: Any) -> bool:
+    return isinstance(note, dict) and note.get("_v") == 2 and isinstance(note.get("n"), dict)
+
+def _dump(data: Any) -> bytes:
+    if ENCODING == "packed":
+        return _pack(data)
+    return json.dumps(data, separators=(',', ':')).encode()
+
+def _parse(blob) -> Any:
+    if isinstance(blob, bytes) and blob.startswith(PACKED_MAGIC):
+        return _unpack(blob)
+    return json.loads(blob)
+
+# =============================================================================
+# PACKED ENCODING - OPTIONAL COMPACT BLOBS
+# =============================================================================
+
+# Blobs are written as "json" (default) or "packed"; both are always read.
+# Packed blobs are PACKED_MAGIC + zlib(JSON {"s": strings, "r": node}) where
+# a node is {"~": 0, "v": {key: value}, "n": [keys of nested nodes]} for
+# a plain dict (dicts without nested dicts stay as they are), or
+# {"~": 1, "i": keys, "f": fields, "k": kinds, "c": columns, "p": present}
+# for a dict of records (memories, entities, index entries) stored as one
+# column per field. Column kinds: "t" ISO timestamps as delta-coded
+# integer microseconds, "s" strings and "l" string lists as indexes into
+# the string table, "" values as they are. "p" lists the records holding
+# a field when not all of them do.
+ENCODING = os.environ.get("GIT_NOTES_MEMORY_ENCODING", "json")
+PACKED_MAGIC = b"GNM1"
+RECORD_FIELDS = 16  # most distinct fields for a dict of dicts to be stored as columns
+_EPOCH = datetime(1970, 1, 1)
+_USEC = timedelta(microseconds=1)
+
+def _stamp(value: Any) -> Optional[int]:
+    """Naive ISO timestamp as integer microseconds, None unless it round-trips."""
+    if not isinstance(value, str) or value[10:11] != "T":
+        return None
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if dt.tzinfo is not None or dt.isoformat() != value:
+        return None
+    return (dt - _EPOCH) // _USEC
+
+class _Packer:
+    def __init__(self):
+        self.strings: List[str] = []
+        self._ids: Dict[str, int] = {}
+
+    def intern(self, text: str) -> int:
+        i = self._ids.get(text)
+        if i is None:
+            i = self._ids[text] = len(self.strings)
+            self.strings.append(text)
+        return i
+
+    def node(self, data: Dict) -> Dict:
+        if data and all(isinstance(v, dict) for v in data.values()):
+            fields: Dict[str, None] = {}
+            for record in data.values():
+                fields.update(dict.fromkeys(record))
+                if len(fields) > RECORD_FIELDS:
+                    break
+            else:
+                return self.records(data, list(fields))
+        values, nested = {}, []
+        for k, v in data.items():
+            if isinstance(v, dict) and any(isinstance(x, dict) for x in v.values()):
+                v = self.node(v)
+                nested.append(k)
+            values[k] = v
+        return {"~": 0, "v": values, "n": nested}
+
+    def records(self, data: Dict[str, Dict], fields: List[str]) -> Dict:
+        rows = list(data.values())
+        kinds, columns, present = [], [], {}
+        for f in fields:
+            has = [i for i, row in enumerate(rows) if f in row]
+            if len(has) < len(rows):
+                present[f] = has
+            kind, column = self.column([rows[i][f] for i in has])
+            kinds.append(kind)
+            columns.append(column)
+        return {"~": 1, "i": list(data), "f": fields, "k": kinds, "c": columns, "p": present}
+
+    def column(self, values: List[Any]):
+        stamps = [_stamp(v) for v in values]
+        if values and None not in stamps:
+            return "t", [b - a for a, b in zip([0] + stamps, stamps)]
+        # Strings go to the table only when they repeat enough to pay off
+        if all(isinstance(v, str) for v in values) and len(set(values)) * 2 <= len(values):
+            return "s", [self.intern(v) for v in values]
+        if values and all(isinstance(v, list) and all(isinstance(x, str) for x in v) for v in values):
+            items = [x for v in values for x in v]
+            if len(set(items)) * 2 <= len(items):
+                return "l", [[self.intern(x) for x in v] for v in values]
+        return "", values
+
+def _pack(data: Any) -> bytes:
+    packer = _Packer()
+    node = packer.node(data) if isinstance(data, dict) else data
+    payload = json.dumps({"s": packer.strings, "r": node}, separators=(',', ':'))
+    return PACKED_MAGIC + zlib.compress(payload.encode())
+
+def _unpack_column(kind: str, column: List[Any], strings: List[str]) -> List[Any]:
+    if kind == "t":
+        epoch = _EPOCH
+        return [(epoch + timedelta(microseconds=n)).isoformat() for n in accumulate(column)]
+    if kind == "s":
+        return [strings[i] for i in column]
+    if kind == "l":
+        return [[strings[i] for i in v] for v in column]
+    return column
+
+def _unpack_node(node: Dict, strings: List[str]) -> Dict:
+    if node["~"] == 0:
+        values = node["v"]
+        for k in node["n"]:
+            values[k] = _unpack_node(values[k], strings)
+        return values
+
+    present = node["p"]
+    full, full_columns, partial = [], [], []
+    for f, kind, column in zip(node["f"], node["k"], node["c"]):
+        column = _unpack_column(kind, column, strings)
+        if f in present:
+            partial.append((f, column))
+        else:
+            full.append(f)
+            full_columns.append(column)
+    if full:
+        records = [dict(zip(full, row)) for row in zip(*full_columns)]
+    else:
+        records = [{} for _ in node["i"]]
+    for f, column in partial:
+        for i, value in zip(present[f], column):
+            records[i][f] = value
+    return dict(zip(node["i"], records))
+
+def _unpack(blob: bytes) -> Any:
+    payload = json.loads(zlib.decompress(blob[len(PACKED_MAGIC):]))
+    root = payload["r"]
+    return _unpack_node(root, payload["s"]) if isinstance(root, dict) else root
+
+class ShardedMap(MutableMapping):
+    """Dict whose entries live in hash-prefix shards fetched on first touch.
+
+    counts holds the entries per shard as last written; shards not in it
+    do not exist on disk and start empty without a read. fetch(shards,
+    keep) reads shards; keep=False reads them for a one-off scan.
+    """
+
+    def __init__(self, fetch: Callable[..., Dict[str, Dict]], counts: Dict[str, int],
+                 shard_of: Callable[[str], str] = _shard):
+        self._fetch = fetch
+        self._shard_of = shard_of
+        self.counts = counts
+        self.shards: Dict[str, Dict] = {}
+
+    @classmethod
+    def of(cls, data: Dict, shard_of: Callable[[str], str] = _shard) -> "ShardedMap":
+        """Fully loaded map holding a plain dict."""
+        smap = cls(lambda shards, keep=True: {}, {}, shard_of)
+        for key, value in data.items():
+            smap.shards.setdefault(shard_of(key), {})[key] = value
+        return smap
+
+    def _load(self, shards):
+        missing = sorted(s for s in set(shards) if s not in self.shards)
+        stored = [s for s in missing if s in self.counts]
+        fetched = self._fetch(stored) if stored else {}
+        for s in missing:
+            self.shards[s] = fetched.get(s, {})
+
+    def shard(self, key: str) -> Dict:
+        s = self._shard_of(key)
+        if s not in self.shards:
+            self._load([s])
+        return self.shards[s]
+
+    def prefetch(self, keys):
+        """Load the shards of several keys with one read."""
+        self._load(self._shard_of(k) for k in keys)
+
+    def select(self, match: Callable[[str], bool]) -> List[Dict]:
+        """Load and return the shards whose name matches."""
+        names = [s for s in set(self.counts) | set(self.shards) if match(s)]
+        self._load(names)
+        return [self.shards[s] for s in sorted(names)]
+
+    def load_all(self):
+        self._load(self.counts)
+
+    def scan(self, batch: int = 16) -> Iterator[tuple]:
+        """Yield every (key, value) a shard at a time; shards not loaded
+        yet are read batch at a time and not kept."""
+        for s in sorted(self.shards):
+            yield from list(self.shards[s].items())
+        pending = sorted(s for s in self.counts if s not in self.shards)
+        for i in range(0, len(pending), batch):
+            parts = self._fetch(pending[i:i + batch], False)
+            for s in sorted(parts):
+                yield from parts[s].items()
+
+    def __getitem__(self, key):
+        return self.shard(key)[key]
+
+    def __setitem__(self, key, value):
+        self.shard(key)[key] = value
+
+    def __delitem__(self, key):
+        del self.shard(key)[key]
+
+    def __contains__(self, key):
+        return isinstance(key, str) and key in self.shard(key)
+
+    def __iter__(self):
+        self.load_all()
+        for s in sorted(self.shards):
+            yield from list(self.shards[s])
+
+    def __len__(self):
+        loaded = sum(len(part) for part in self.shards.values())
+        return loaded + sum(n for s, n in self.counts.items() if s not in self.shards)
+
+    def items(self):
+        self.load_all()
+        return [(k, v) for s in sorted(self.shards) for k, v in self.shards[s].items()]
+
+    def to_dict(self) -> Dict:
+        return dict(self.items())
+
+def _plain(data: Any) -> Any:
+    """Copy of a loaded blob with sharded maps materialized as dicts."""
+    if isinstance(data, ShardedMap):
+        return data.to_dict()
+    if isinstance(data, dict):
+        return {k: _plain(v) for k, v in data.items()}
+    return data
+
+# =============================================================================
+# STORE - ONE LOAD PER SESSION
+# =============================================================================
+
+class MemoryStore:
+    """Branch notes held in memory for the length of a session.
+
+    Resolves the root commit, branch and notes heads once, loads each blob
+    (or shard) on first use and writes back only what changed.
+    """
+
+    def __init__(self, cwd: str = "."):
+        self.cwd = cwd
+        self.root = _ensure_git(cwd)
+        self.branch = _branch(cwd)
+        self.heads = _notes_heads(cwd)  # every read in the session sees this snapshot
+        self._data: Dict[str, Any] = {}
+        self._maps: Dict[str, ShardedMap] = {}
+        self._raw: Dict[tuple, Optional[bytes]] = {}  # (name, shard) -> blob as read
+        self._written: Dict[str, Dict[str, int]] = {}  # name -> manifest counts on disk
+        self._extras: Dict[str, bytes] = {}  # name -> manifest "x" on disk, dumped
+        self._rewrite = set()  # sharded blobs to write out in full
+        self._parents: Dict[str, List[str]] = {}  # ref -> extra parents of its next commit
+        self._dirty = set()
+        self.saves = 0  # save() calls, to tell which API calls wrote
+        self.ops: List[tuple] = []  # (function, args, kwargs) of API calls that wrote
+        self.depth = 0  # API calls in progress
+        self.replayed: Optional[List[Any]] = None  # results of the calls replayed on commit
+
+    def ref(self, name: str) -> str:
+        """Branch-specific ref name (/ replaced with -)."""
+        return f"refs/notes/{name}-{self.branch.replace('/', '-')}"
+
+    def _cat(self, ref: str, paths: List[str], commit: Optional[str] = None) -> List[Optional[bytes]]:
+        head = commit or self.heads.get(ref)
+        if not head:
+            return [None] * len(paths)
+        return _cat_blobs([f"{head}:{p}" for p in paths], self.cwd)
+
+    def _root_note(self, ref: str, commit: Optional[str] = None) -> Any:
+        """Parsed note on the root commit of ref (or of a notes commit), None if absent."""
+        head = commit or self.heads.get(ref)
+        if not head:
+            return None
+        content = self._cat(ref, [self.root], head)[0]
+        if content is None:
+            # Fanned-out tree written by plain `git notes`
+            info = _notes_tree(head, self.cwd).get(self.root)
+            content = _cat_blobs([info.split()[2]], self.cwd)[0] if info else None
         try:
-            return json.loads(content)
+            return _parse(content) if content else None
         except:
-            pass
+            return None
+
+    def _fetch(self, name: str, ref: str, shards: List[str], track: bool = True,
+               commit: Optional[str] = None) -> Dict[str, Dict]:
+        blobs = self._cat(ref, [_shard_path(s) for s in shards], commit)
+        parts = {}
+        for s, blob in zip(shards, blobs):
+            if track:
+                self._raw[(name, s)] = blob
+            parts[s] = _parse(blob) if blob else {}
+        return parts
+
+    def read(self, name: str, ref: str, commit: Optional[str] = None) -> Optional[Dict]:
+        """Read a blob of any ref (at its head or a given commit) as plain
+        dicts, bypassing the cache."""
+        note = self._root_note(ref, commit)
+        if name not in SHARDED or not _is_manifest(note):
+            return note
+        data = {}
+        for part in self._fetch(name, ref, sorted(note["n"]), False, commit).values():
+            data.update(part)
+        key = NESTED.get(name)
+        return {**note.get("x", {}), key: data} if key else data
+
+    def _adopt(self, name: str, data: Dict):
+        """Hold a plain blob as a fully loaded sharded map, rewritten on flush."""
+        key = NESTED.get(name)
+        smap = self._maps[name] = ShardedMap.of(data.get(key, {}) if key else data,
+                                                SHARDED[name])
+        self._data[name] = {**data, key: smap} if key else smap
+        self._rewrite.add(name)
+
+    def _extra(self, name: str) -> Dict:
+        """Keys of a NESTED blob besides its sharded map."""
+        key = NESTED.get(name)
+        return {k: v for k, v in self._data[name].items() if k != key} if key else {}
+
+    def load(self, name: str) -> Any:
+        """Load notes for current branch, with fallback to parent branches."""
+        if name in self._data:
+            return self._data[name]
+
+        ref = self.ref(name)
+        note = self._root_note(ref)
+        if note is None:
+            # Try to inherit from parent branch (main/master)
+            for parent in ["main", "master"]:
+                if parent != self.branch:
+                    parent_ref = f"refs/notes/{name}-{parent}"
+                    inherited = self.read(name, parent_ref)
+                    if inherited is not None:
+                        # Auto-copy to current branch on flush, on top of the
+                        # parent's notes so later merges find a merge base
+                        self._parents[ref] = [self.heads[parent_ref]]
+                        self.save(name, inherited)
+                        return self._data[name]
+
+        if name not in SHARDED:
+            self._data[name] = note if note is not None else {}
+        elif _is_manifest(note):
+            self._written[name] = dict(note["n"])
+            smap = self._maps[name] = ShardedMap(
+                lambda shards, keep=True: self._fetch(name, ref, shards, keep),
+                dict(note["n"]), SHARDED[name])
+            key = NESTED.get(name)
+            self._data[name] = {**note.get("x", {}), key: smap} if key else smap
+            self._extras[name] = _dump(self._extra(name))
+        else:
+            # Legacy single blob: migrated to shards on first save
+            self._adopt(name, note if note is not None else {})
+        return self._data[name]
+
+    def tip(self, name: str) -> Optional[str]:
+        """Notes commit the branch's next write of name builds on."""
+        ref = self.ref(name)
+        return self.heads.get(ref) or (self._parents.get(ref) or [None])[0]
+
+    def merged(self, name: str, commit: str):
+        """Record commit as merged into name: a parent of its next notes commit."""
+        self._parents.setdefault(self.ref(name), []).append(commit)
+
+    def save(self, name: str, data: Dict):
+        """Replace a blob and mark it for write-back."""
+        key = NESTED.get(name)
+        smap = data.get(key) if key else data
+        if name in SHARDED and smap is not self._maps.get(name):
+            self._adopt(name, _plain(data))
+        else:
+            self._data[name] = data
+        self._dirty.add(name)
+        self.saves += 1
+
+    def _shard_notes(self, name: str):
+        """Changed shard entries, manifest counts and extras of a sharded blob."""
+        smap = self._maps[name]
+        written = self._written.get(name, {})
+        rewrite = name in self._rewrite
+        counts = {} if rewrite else dict(written)
+        notes = {}
+        for s, part in smap.shards.items():
+            blob = _dump(part) if part else None
+            if rewrite or blob != self._raw.get((name, s)):
+                notes[_shard_path(s)] = blob
+            if part:
+                counts[s] = len(part)
+            else:
+                counts.pop(s, None)
+        if rewrite:
+            for s in written:
+                if s not in counts:
+                    notes[_shard_path(s)] = None
+        extra = self._extra(name)
+        dumped = _dump(extra)
+        if rewrite or counts != written or dumped != self._extras.get(name):
+            manifest = {"_v": 2, "n": counts}
+            if extra:
+                manifest["x"] = extra
+            notes[self.root] = _dump(manifest)
+        return notes, (counts, dumped)
+
+    def _stats_note(self, changes: Dict[str, Optional[bytes]], counts: Dict[str, int]) -> bytes:
+        """Stats of the mem blob once changes are written: memory count,
+        last update and total shard bytes, for list_branches."""
+        prefix = _shard_path("")
+        size = sum(len(blob) for path, blob in changes.items() if blob and path.startswith(prefix))
+        if "mem" not in self._rewrite:
+            for path, n in _tree_sizes(self.heads.get(self.ref("mem")), self.cwd).items():
+                if path.startswith(prefix) and path not in changes:
+                    size += n
+        return _dump({"n": sum(counts.values()), "u": datetime.now().isoformat(), "b": size})
+
+    def flush(self) -> bool:
+        """Write back the blobs saved since the last flush as one transaction."""
+        if not self._dirty:
+            return True
+        notes, manifests = {}, {}
+        for name in self._dirty:
+            if name in SHARDED:
+                notes[self.ref(name)], manifests[name] = self._shard_notes(name)
+                if name == "mem":
+                    changes = notes[self.ref(name)]
+                    changes[STATS_PATH] = self._stats_note(changes, manifests[name][0])
+            else:
+                notes[self.ref(name)] = {self.root: _dump(self._data[name])}
+        notes = {ref: changes for ref, changes in notes.items() if changes}
+
+        heads = _write_notes(notes, self.cwd, self.heads, self._parents) if notes else {}
+        if heads is None:
+            return False
+        self.heads.update(heads)
+        self._parents.clear()
+        for name, (written, extra) in manifests.items():
+            self._written[name] = written
+            self._extras[name] = extra
+            self._maps[name].counts = dict(written)
+            for s, part in self._maps[name].shards.items():
+                self._raw[(name, s)] = _dump(part) if part else None
+            self._rewrite.discard(name)
+        self._dirty.clear()
+        return True
+
+_local = threading.local()
+
+WRITE_RETRIES = 10
+RETRY_DELAY = 0.005  # seconds, doubled per attempt with random jitter
+
+class WriteConflict(Exception):
+    """The notes refs kept moving under a session's writes."""
+
+@contextmanager
+def session(cwd: str = "."):
+    """Open (or join) the store for cwd; the outermost session flushes on exit.
+
+    A session is also the batch mode: everything saved in it is written as
+    one notes commit per ref, applied in a single update-ref transaction.
+    Wrap several calls in one session to share a single load and write:
+
+        with session(path):
+            remember(a, cwd=path)
+            remember(b, cwd=path)
+
+    The transaction only applies if no other writer moved the notes since
+    the session read them. If one did, the session's API calls are replayed
+    on a fresh store and written again, up to WRITE_RETRIES times.
+    """
+    stores = _local.__dict__.setdefault("stores", {})
+    key = str(Path(cwd).resolve())
+    if key in stores:
+        yield stores[key]
+        return
+
+    store = stores[key] = MemoryStore(cwd)
+    try:
+        yield store
+        store.replayed = _commit(stores, key)
+    finally:
+        del stores[key]
+
+@contextmanager
+def _retry_lock(cwd: str):
+    """Exclusive lock for writers that lost a compare-and-swap, so they
+    queue up instead of racing each other again. Uncontended writes never
+    take it. Without fcntl the retries just race."""
+    git_dir = _git(["rev-parse", "--git-common-dir"], cwd) if HAS_FCNTL else None
+    if not git_dir:
+        yield
+        return
+    with open(Path(cwd) / git_dir / "notes-memory.lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _commit(stores: Dict[str, MemoryStore], key: str) -> Optional[List[Any]]:
+    """Flush the session's store, rebasing its calls onto the new notes
+    heads until the compare-and-swap succeeds. Returns the results of the
+    replayed calls, None if the first write went through."""
+    if stores[key].flush():
+        return None
+    with _retry_lock(key):
+        for attempt in range(WRITE_RETRIES):
+            time.sleep(random.uniform(0, RETRY_DELAY * 2 ** attempt))
+            ops = stores[key].ops
+            stores[key] = MemoryStore(stores[key].cwd)
+            results = [fn(*args, **kwargs) for fn, args, kwargs in ops]
+            if stores[key].flush():
+                return results
+    raise WriteConflict(f"notes in {key} changed concurrently {WRITE_RETRIES} times")
+
+def _store(cwd: str = ".") -> MemoryStore:
+    """Store of the innermost open session for cwd."""
+    return _local.stores[str(Path(cwd).resolve())]
+
+def _in_session(fn):
+    """Run fn inside a session for its cwd argument, recording the call
+    for replay if it saved anything."""
+    sig = inspect.signature(fn)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        cwd = sig.bind(*args, **kwargs).arguments.get("cwd", ".")
+        with session(cwd) as store:
+            saves = store.saves
+            store.depth += 1
+            try:
+                result = fn(*args, **kwargs)
+            finally:
+                store.depth -= 1
+            if not store.depth and store.saves != saves:
+                store.ops.append((wrapper, args, kwargs))
+            return result
+    return wrapper
 
-    # Try to inherit from parent branch (main/master)
-    for parent in ["main", "master"]:
-        if parent != _branch(cwd):
-            parent_ref = f"refs/notes/{name}-{parent}"
-            content = _git(["notes", "--ref", parent_ref, "show", root], cwd)
-            if content:
-                try:
-                    data = json.loads(content)
-                    # Auto-copy to current branch
-                    _save(name, data, cwd)
-                    return data
-                except:
-                    pass
-
-    return {}
+def _load(name: str, cwd: str = ".") -> Dict:
+    """Load notes for current branch, with fallback to parent branches."""
+    with session(cwd) as store:
+        return store.load(name)
 
 def _save(name: str, data: Dict, cwd: str = "."):
     """Save notes for current branch."""
-    root = _ensure_git(cwd)
-    ref = _ref(name, cwd)
-    subprocess.run(
-        ["git", "notes", "--ref", ref, "add", "-f", "-m", json.dumps(data, separators=(',', ':')), root],
-        cwd=cwd, capture_output=True
-    )
+    with session(cwd) as store:
+        store.save(name, data)
 
 # Shortcuts
 def _mem(cwd=".") -> Dict: return _load("mem", cwd)
@@ -127,107 +981,176 @@ def _save_idx(d, cwd="."): _save("idx", d, cwd)
 # BRANCH OPERATIONS
 # =============================================================================
 
+@_in_session
 def merge_branch(source_branch: str, cwd: str = ".") -> Dict:
-    """Merge memories from another branch into current branch."""
-    root = _ensure_git(cwd)
-    current = _branch(cwd)
-    safe_source = source_branch.replace("/", "-")
+    """Merge memories from another branch into current branch.
 
-    results = {"merged": [], "conflicts": [], "errors": []}
+    Three-way merge against the merge base of the two mem notes refs: only
+    memories the source changed since then are applied, so a memory
+    forgotten on either side stays forgotten. Entity, topic and search
+    indexes are updated for the applied memories only.
+    """
+    store = _store(cwd)
+    source_ref = f"refs/notes/mem-{source_branch.replace('/', '-')}"
 
-    for name in ["mem", "ent", "idx"]:
-        current_ref = _ref(name, cwd)
-        source_ref = f"refs/notes/{name}-{safe_source}"
+    results = {"merged": [], "conflicts": [], "errors": []}
 
-        # Check if source has notes
-        if not _git(["notes", "--ref", source_ref, "show", root], cwd):
-            continue
+    # Check if source has notes
+    source = store.heads.get(source_ref)
+    if not source:
+        return results
 
-        # Load both
-        current_data = _load(name, cwd)
-        source_content = _git(["notes", "--ref", source_ref, "show", root], cwd)
+    mem = _mem(cwd)
+    ours = store.tip("mem")
+    base = _git(["merge-base", ours, source], cwd) if ours else None
+    if base == source:
+        return results  # nothing new on the source
 
-        try:
-            source_data = json.loads(source_content) if source_content else {}
-        except:
-            source_data = {}
+    base_part, their_part = _merge_parts(store, source_ref, base, source)
+    changed = {mid for mid in base_part.keys() | their_part.keys()
+               if _version(base_part.get(mid)) != _version(their_part.get(mid))}
+    mem.prefetch(changed)
 
-        if not source_data:
+    idx = _idx(cwd)
+    ent = _ent(cwd)
+    fts = _load("fts", cwd) if _fts_ready(idx) else None
+    lex = _load("lex", cwd) if _lex_ready(idx) else None
+    ent["e"].prefetch({e for part in (mem, their_part) for mid in changed if mid in part
+                       for e in part[mid].get("e", [])})
+
+    applied = 0
+    for mid in sorted(changed):
+        b, t, o = base_part.get(mid), their_part.get(mid), mem.get(mid)
+        if _version(o) == _version(t):
             continue
-
-        # Merge strategy: union with conflict detection
-        merged = _deep_merge(current_data, source_data, name)
-        _save(name, merged, cwd)
-        results["merged"].append(name)
+        if _version(o) != _version(b):
+            # Changed on both sides: our forget stands, their forget loses
+            # to our edit, otherwise the later update wins
+            results["conflicts"].append(mid)
+            if o is None or t is None or t.get("u", "") <= o.get("u", ""):
+                continue
+        if o is not None:
+            _unlink_memory(idx, ent, fts, lex, mid, o)
+            del mem[mid]
+        if t is not None:
+            mem[mid] = t
+            _link_memory(idx, ent, fts, lex, mid, t)
+        applied += 1
+
+    if applied:
+        store.merged("mem", source)
+        _save_mem(mem, cwd)
+        _save_ent(ent, cwd)
+        _save_idx(idx, cwd)
+        if fts is not None:
+            _save("fts", fts, cwd)
+        if lex is not None:
+            _save("lex", lex, cwd)
+        results["merged"] = ["mem", "ent", "idx"]
 
     return results
 
-def _deep_merge(base: Dict, incoming: Dict, data_type: str) -> Dict:
-    """Deep merge two dicts with type-aware strategy."""
-    result = dict(base)
-
-    for key, value in incoming.items():
-        if key not in result:
-            # New key, just add
-            result[key] = value
-        elif isinstance(result[key], dict) and isinstance(value, dict):
-            # Nested dict, recurse
-            result[key] = _deep_merge(result[key], value, data_type)
-        elif isinstance(result[key], list) and isinstance(value, list):
-            # Lists: union (for memory IDs, entities, etc.)
-            existing = set(str(x) for x in result[key])
-            for item in value:
-                if str(item) not in existing:
-                    result[key].append(item)
-        elif data_type == "mem" and key in result:
-            # For memories, keep the one with latest update
-            if isinstance(value, dict) and isinstance(result[key], dict):
-                incoming_time = value.get("u", "")
-                current_time = result[key].get("u", "")
-                if incoming_time > current_time:
-                    result[key] = value
-        elif data_type == "idx" and key == "t":
-            # Topics: merge counts
-            if isinstance(value, dict) and isinstance(result[key], dict):
-                for topic, data in value.items():
-                    if topic not in result[key]:
-                        result[key][topic] = data
-                    else:
-                        result[key][topic]["n"] = max(
-                            result[key][topic].get("n", 0),
-                            data.get("n", 0)
-                        )
-                        # Merge recent IDs
-                        existing_r = set(result[key][topic].get("r", []))
-                        for r in data.get("r", []):
-                            existing_r.add(r)
-                        result[key][topic]["r"] = list(existing_r)[:5]
+def _version(entry: Optional[Dict]) -> Optional[Dict]:
+    """Entry without its access counter, for comparing versions."""
+    if entry is None:
+        return None
+    return {k: v for k, v in entry.items() if k != "a"}
+
+def _merge_parts(store: MemoryStore, ref: str, base: Optional[str], source: str):
+    """(base, source) memories of the shards that differ between the merge
+    base and the source; everything when there is no base or either side
+    is not sharded."""
+    if base:
+        old, new = _notes_tree(base, store.cwd), _notes_tree(source, store.cwd)
+        prefix = _shard_path("")
+        if any(p.startswith(prefix) for p in old) and any(p.startswith(prefix) for p in new):
+            shards = sorted(p[len(prefix):] for p in old.keys() | new.keys()
+                            if p.startswith(prefix) and old.get(p) != new.get(p))
+            parts = []
+            for commit in (base, source):
+                data = {}
+                for part in store._fetch("mem", ref, shards, False, commit).values():
+                    data.update(part)
+                parts.append(data)
+            return parts[0], parts[1]
+    return (store.read("mem", ref, base) or {}) if base else {}, store.read("mem", ref, source) or {}
+
+def _link_memory(idx: Dict, ent: Dict, fts: Optional[ShardedMap], lex: Optional[ShardedMap],
+                 mid: str, entry: Dict):
+    """Add a memory's entity, topic, index, search, name and critical entries."""
+    entities = entry.get("e", [])
+    for e in entities:
+        e_data = ent["e"].setdefault(e, {"m": [], "n": 0})
+        if mid not in e_data["m"]:
+            e_data["m"].append(mid)
+        e_data["n"] = len(e_data["m"])
 
-    return result
+    primary = entities[0] if entities else entry.get("t", "info")
+    topic = idx["t"].setdefault(primary, {"n": 0, "r": []})
+    topic["n"] += 1
+    topic["r"] = ([mid] + [m for m in topic.get("r", []) if m != mid])[:5]
 
+    idx["m"][mid] = {
+        "s": _sum(entry["d"], 50),
+        "e": entities[:3],
+        "t": entry.get("t", "info"),
+        "i": entry.get("i", "n"),
+        "u": entry.get("u", "")[:10]
+    }
+    if fts is not None:
+        _index_doc(fts, idx, mid, entry)
+    if lex is not None:
+        _lex_add(lex, mid, entry)
+    if entry.get("i") == "c" and mid not in idx["c"]:
+        idx["c"] = [mid] + idx["c"][:4]
+    _journal(idx, "+", mid, [primary], entities)
+
+def _unlink_memory(idx: Dict, ent: Dict, fts: Optional[ShardedMap], lex: Optional[ShardedMap],
+                   mid: str, entry: Dict):
+    """Drop what _link_memory added for a memory."""
+    entities = entry.get("e", [])
+    for e in entities:
+        if e in ent["e"]:
+            ent["e"][e]["m"] = [m for m in ent["e"][e]["m"] if m != mid]
+            ent["e"][e]["n"] = len(ent["e"][e]["m"])
+
+    primary = entities[0] if entities else entry.get("t", "info")
+    topic = idx["t"].get(primary)
+    if topic and mid in topic.get("r", []):
+        topic["r"] = [m for m in topic["r"] if m != mid]
+        topic["n"] = max(0, topic.get("n", 1) - 1)
+
+    if fts is not None:
+        _unindex_doc(fts, idx, mid, entry)
+    if lex is not None:
+        _lex_remove(lex, mid, entry)
+    idx["m"].pop(mid, None)
+    idx["c"] = [m for m in idx["c"] if m != mid]
+    _journal(idx, "-", mid, [primary], entities)
+
+@_in_session
 def list_branches(cwd: str = ".") -> Dict:
-    """List branches with memory counts."""
-    root = _ensure_git(cwd)
-    current = _branch(cwd)
+    """List branches with memory counts, read from each branch's stats note."""
+    store = _store(cwd)
+    current = store.branch
 
-    # Get all memory refs
-    refs_output = _git(["for-each-ref", "--format=%(refname)", "refs/notes/mem-*"], cwd)
+    # Every notes ref was read by one for-each-ref when the store opened
+    prefix = "refs/notes/mem-"
+    refs = sorted(ref for ref in store.heads if ref.startswith(prefix))
+    blobs = _cat_blobs([f"{store.heads[ref]}:{STATS_PATH}" for ref in refs], cwd)
 
     branches = {}
-    if refs_output:
-        for ref in refs_output.split("\n"):
-            if ref:
-                # Extract branch name from ref
-                branch = ref.replace("refs/notes/mem-", "")
-                content = _git(["notes", "--ref", ref, "show", root], cwd)
-                count = 0
-                if content:
-                    try:
-                        data = json.loads(content)
-                        count = len(data)
-                    except:
-                        pass
-                branches[branch] = {"count": count, "current": branch == current.replace("/", "-")}
+    for ref, blob in zip(refs, blobs):
+        branch = ref[len(prefix):]
+        if blob:
+            stats = _parse(blob)
+        else:
+            # Written before stats notes: count the memories themselves
+            data = store.read("mem", ref)
+            stats = {"n": len(data) if data else 0}
+        branches[branch] = {"count": stats["n"], "current": branch == current.replace("/", "-")}
+        if "u" in stats:
+            branches[branch].update({"updated": stats["u"], "bytes": stats["b"]})
 
     return {"branches": branches, "current": current}
 
@@ -235,7 +1158,7 @@ def list_branches(cwd: str = ".") -> Dict:
 # ENTITY EXTRACTION (Domain-Agnostic)
 # =============================================================================
 
-STOP_WORDS = {
+STOP_WORDS = frozenset({
     "the", "a", "an", "is", "are", "was", "were", "be", "been", "being",
     "have", "has", "had", "do", "does", "did", "will", "would", "could",
     "should", "may", "might", "must", "shall", "can", "need", "dare",
@@ -250,19 +1173,118 @@ STOP_WORDS = {
     "he", "him", "his", "she", "her", "they", "them", "their", "what",
     "which", "who", "whom", "get", "got", "about", "like", "want", "know",
     "think", "make", "take", "see", "come", "go", "use", "using", "used"
-}
+})
+
+TOPIC_FIELDS = ("topic", "about", "subject", "name", "title", "category",
+                "area", "domain", "field", "concept", "item", "what",
+                "learning", "studying", "project", "goal", "target")
+LIST_FIELDS = ("topics", "tags", "categories", "items", "subjects", "areas")
+
+# One scanner for every generic entity kind: quotes, word runs, the
+# separators between them and the character that ends a text in a batch
+@functools.lru_cache(maxsize=None)
+def _scan_re(end: str):
+    end = re.escape(end)
+    return re.compile(rf'(")|(\w+)|([^"\w{end}]+)|({end})')
+
+def _text_end(texts: List[str]) -> str:
+    """A separator character that none of texts contains (almost always NUL)."""
+    for code in range(0x110000):
+        c = chr(code)
+        if not (0xD800 <= code < 0xE000 or c == '"' or re.match(r"\w", c)) \
+                and not any(c in text for text in texts):
+            return c
+    raise ValueError("texts use every separator character")
+
+def _scan_entities(text: str) -> Dict[str, None]:
+    """Generic entities of text in one pass, in order of first occurrence.
+
+    Yields hashtags (#word), quoted phrases ("2-30 chars", up to 4 words),
+    capitalized phrases (up to 3 words), words of 3-20 letters and bigrams
+    of adjacent words, each word paired at most once, left to right.
+    """
+    return _scan_entities_batch([text])[0]
+
+def _scan_entities_batch(texts: List[str]) -> List[Dict[str, None]]:
+    """_scan_entities of each text, from a single regex pass over the texts
+    joined by a character none of them contains. Offsets index the joined
+    string; that character closes a text and resets the scan state."""
+    end_char = _text_end(texts)
+    joined = end_char.join(texts) + end_char
+    results: List[Dict[str, None]] = []
+    found: Dict[str, None] = {}
+    stop = STOP_WORDS
+    pos = 0                 # offset of the current token
+    quote = -1              # offset of an open quote
+    word = None             # lowercased word that may start a bigram
+    gap = ""                # separator since the last word run (None: broken)
+    last = ""               # character just before the current token
+    cap_start = cap_end = caps = 0  # open capitalized phrase
+
+    for q, tok, sep, end in _scan_re(end_char).findall(joined):
+        if sep:
+            gap = sep if gap == "" else None
+            last = sep[-1]
+            pos += len(sep)
+            continue
+        if end:
+            if caps:
+                phrase = joined[cap_start:cap_end].lower()
+                if phrase not in stop:
+                    found[phrase] = None
+            results.append(found)
+            found, quote, word, gap, last, caps = {}, -1, None, "", "", 0
+            pos += 1
+            continue
+        if q:
+            if quote >= 0 and 2 <= pos - quote - 1 <= 30:
+                phrase = joined[quote + 1:pos].lower()
+                if len(phrase.split()) <= 4:
+                    found[phrase.strip()] = None
+                quote = -1
+            else:
+                quote = pos
+            gap, last = None, '"'
+            pos += 1
+            continue
 
-def extract_entities(content: Any) -> List[str]:
-    """Extract key topics/entities from any content (domain-agnostic)."""
-    # Priority entities from explicit fields (always included first)
+        low = tok.lower()
+        tok_end = pos + len(tok)
+        if last == "#":
+            found[low] = None
+        spaced = gap is not None and gap.isspace()
+        alpha = tok.isascii() and tok.isalpha()
+        cap = alpha and len(tok) > 1 and tok.istitle()
+
+        if cap and spaced and 0 < caps < 3:
+            cap_end, caps = tok_end, caps + 1
+        else:
+            if caps:
+                phrase = joined[cap_start:cap_end].lower()
+                if phrase not in stop:
+                    found[phrase] = None
+            cap_start, cap_end, caps = pos, tok_end, 1 if cap else 0
+
+        if alpha and len(tok) >= 3:
+            if len(tok) <= 20 and low not in stop:
+                found[low] = None
+            if word is not None and spaced:
+                if word not in stop and low not in stop:
+                    found[word + gap + low] = None
+                word = None
+            else:
+                word = low
+        else:
+            word = None
+        gap, last, pos = "", "", tok_end
+    return results
+
+def _entity_sources(content: Any) -> tuple:
+    """Priority entities from explicit fields, and the text to scan."""
     priority_entities = []
-    generic_entities = set()
 
     if isinstance(content, dict):
-        topic_fields = ["topic", "about", "subject", "name", "title", "category",
-                       "area", "domain", "field", "concept", "item", "what",
-                       "learning", "studying", "project", "goal", "target"]
-        for k in topic_fields:
+        for k in TOPIC_FIELDS:
             if k in content and isinstance(content[k], str):
                 val = content[k].lower().strip()
                 # Also add without file extension for better matching
@@ -270,45 +1292,20 @@ def extract_entities(content: Any) -> List[str]:
                 if '.' in val:
                     priority_entities.append(val.rsplit('.', 1)[0])
 
-        list_fields = ["topics", "tags", "categories", "items", "subjects", "areas"]
-        for k in list_fields:
+        for k in LIST_FIELDS:
             if k in content and isinstance(content[k], list):
                 for item in content[k]:
                     if isinstance(item, str):
                         priority_entities.append(item.lower().strip())
 
-        text = json.dumps(content).lower()
-    else:
-        text = str(content).lower()
-
-    # Extract hashtags
-    hashtags = re.findall(r'#(\w+)', text)
-    generic_entities.update(h.lower() for h in hashtags)
-
-    # Extract quoted phrases
-    quoted = re.findall(r'"([^"]{2,30})"', text)
-    generic_entities.update(q.lower().strip() for q in quoted if len(q.split()) <= 4)
-
-    # Extract capitalized phrases
-    caps = re.findall(r'\b([A-Z][a-z]+(?:\s+[A-Z][a-z]+){0,2})\b', str(content))
-    generic_entities.update(c.lower() for c in caps if c.lower() not in STOP_WORDS)
-
-    # Extract key terms
-    words = re.findall(r'\b([a-z]{3,})\b', text)
-    for word in words:
-        if word not in STOP_WORDS and 3 <= len(word) <= 20:
-            generic_entities.add(word)
-
-    # Extract bigrams
-    bigrams = re.findall(r'\b([a-z]{3,}\s+[a-z]{3,})\b', text)
-    for bg in bigrams:
-        parts = bg.split()
-        if all(p not in STOP_WORDS for p in parts):
-            generic_entities.add(bg)
+        return priority_entities, json.dumps(content)
+    return priority_entities, str(content)
 
-    generic_entities = {e for e in generic_entities if len(e) >= 3 and e not in STOP_WORDS}
+def _rank_entities(priority_entities: List[str], found: Dict[str, None]) -> List[str]:
+    """Priority entities, then generic ones shortest first, capped at 15."""
+    generic_entities = [e for e in found if len(e) >= 3 and e not in STOP_WORDS]
     sorted_generic = sorted(generic_entities, key=lambda x: (len(x.split()), len(x)))
-    
+
     # Combine: priority entities first (deduplicated), then generic entities
     seen = set()
     result = []
@@ -320,9 +1317,21 @@ def extract_entities(content: Any) -> List[str]:
         if e not in seen:
             seen.add(e)
             result.append(e)
-    
+
     return result[:15]  # Increased limit to preserve important entities
 
+def extract_entities(content: Any) -> List[str]:
+    """Extract key topics/entities from any content (domain-agnostic)."""
+    priority_entities, text = _entity_sources(content)
+    return _rank_entities(priority_entities, _scan_entities(text))
+
+def extract_entities_batch(contents: List[Any]) -> List[List[str]]:
+    """extract_entities for many contents (e.g. an import), with all their
+    texts scanned in one regex pass."""
+    sources = [_entity_sources(content) for content in contents]
+    found = _scan_entities_batch([text for _, text in sources])
+    return [_rank_entities(priority, f) for (priority, _), f in zip(sources, found)]
+
 def classify_memory(content: Any) -> str:
     """Classify memory type (domain-agnostic)."""
     if isinstance(content, dict):
@@ -395,6 +1404,7 @@ def _now() -> str:
 # REMEMBER
 # =============================================================================
 
+@_in_session
 def remember(content: Any, tags: str = "", importance: str = "n", cwd: str = ".") -> str:
     """Store memory with entity linking."""
     mem = _mem(cwd)
@@ -408,7 +1418,16 @@ def remember(content: Any, tags: str = "", importance: str = "n", cwd: str = "."
     tags_list = [t.strip() for t in tags.split(",") if t.strip()] if tags else []
 
     # Add branch context
-    branch = _branch(cwd)
+    branch = _store(cwd).branch
+
+    # Re-remembering the same content replaces its search postings
+    _ensure_indexes(cwd)
+    fts = _load("fts", cwd) if _fts_ready(idx) else None
+    if fts is not None and mid in mem:
+        _unindex_doc(fts, idx, mid, mem[mid])
+    lex = _load("lex", cwd) if _lex_ready(idx) else None
+    if lex is not None and mid in mem:
+        _lex_remove(lex, mid, mem[mid])
 
     mem[mid] = {
         "d": content,
@@ -425,6 +1444,7 @@ def remember(content: Any, tags: str = "", importance: str = "n", cwd: str = "."
     # Update entity index
     if "e" not in ent:
         ent["e"] = {}
+    ent["e"].prefetch(entities)
     for e in entities:
         if e not in ent["e"]:
             ent["e"][e] = {"m": [], "n": 0}
@@ -440,6 +1460,7 @@ def remember(content: Any, tags: str = "", importance: str = "n", cwd: str = "."
         idx["t"][primary] = {"n": 0, "r": []}
     idx["t"][primary]["n"] += 1
     idx["t"][primary]["r"] = ([mid] + idx["t"][primary].get("r", []))[:5]
+    _journal(idx, "+", mid, [primary], entities)
 
     # Update memory index
     if "m" not in idx:
@@ -452,6 +1473,14 @@ def remember(content: Any, tags: str = "", importance: str = "n", cwd: str = "."
         "u": now[:10]
     }
 
+    # Update search index (built lazily on first search otherwise)
+    if fts is not None:
+        _index_doc(fts, idx, mid, mem[mid])
+        _save("fts", fts, cwd)
+    if lex is not None:
+        _lex_add(lex, mid, mem[mid])
+        _save("lex", lex, cwd)
+
     # Track critical memories
     if importance == "c":
         if "c" not in idx:
@@ -469,19 +1498,22 @@ def remember(content: Any, tags: str = "", importance: str = "n", cwd: str = "."
 # TIERED RETRIEVAL
 # =============================================================================
 
+@_in_session
 def sync_start(cwd: str = ".") -> Dict:
-    """Tier 0: Ultra-compact session start with branch info."""
+    """Tier 0: Ultra-compact session start with branch info.
+
+    Answered from idx alone: mem is only read to auto-init an empty store
+    or for a critical memory the index has no entry for.
+    """
     idx = _idx(cwd)
-    mem = _mem(cwd)
-    branch = _branch(cwd)
+    branch = _store(cwd).branch
 
     # Auto-init if empty
-    if not mem:
+    if not idx.get("m") and not _mem(cwd):
         ctx = _init_context(cwd)
         if ctx:
             remember(ctx, tags="project,auto", importance="h", cwd=cwd)
             idx = _idx(cwd)
-            mem = _mem(cwd)
 
     result = {"b": branch}  # Include current branch
 
@@ -491,12 +1523,24 @@ def sync_start(cwd: str = ".") -> Dict:
         sorted_topics = sorted(topics.items(), key=lambda x: x[1]["n"], reverse=True)[:8]
         result["t"] = {k: v["n"] for k, v in sorted_topics}
 
-    # Critical memories
+    # Critical memories (index summaries are _sum(content, 50))
     critical = idx.get("c", [])
     if critical:
+        index = idx.get("m", {})
+        index.prefetch(critical[:3])
+        missing = [mid for mid in critical[:3] if mid not in index]
+        mem = _mem(cwd) if missing else {}
+        if missing:
+            mem.prefetch(missing)
         c_list = []
         for mid in critical[:3]:
-            if mid in mem:
+            if mid in index:
+                c_list.append({
+                    "id": mid,
+                    "s": index[mid]["s"][:40],
+                    "t": index[mid].get("t", "info")
+                })
+            elif mid in mem:
                 c_list.append({
                     "id": mid,
                     "s": _sum(mem[mid]["d"], 40),
@@ -518,57 +1562,52 @@ def sync_start(cwd: str = ".") -> Dict:
 
     return result
 
+@_in_session
 def get_topic(topic: str, cwd: str = ".") -> Dict:
-    """Tier 1: Get memories for a topic."""
+    """Tier 1: Get memories for a topic.
+
+    Entity, topic and tag names come from the name index (see TOPIC
+    LOOKUP), so only matching entities and memories are read; topics
+    shorter than a trigram, or a store whose name index is not built
+    yet, fall back to a scan.
+    """
     idx = _idx(cwd)
     ent = _ent(cwd)
     mem = _mem(cwd)
 
     topic_lower = topic.lower()
-    mids = set()
-
-    # Check entity index
-    entities = ent.get("e", {})
-    for e_name, e_data in entities.items():
-        if topic_lower in e_name or e_name in topic_lower:
-            mids.update(e_data.get("m", []))
-
-    # Check topic index
-    topics = idx.get("t", {})
-    for t_name, t_data in topics.items():
-        if topic_lower in t_name or t_name in topic_lower:
-            mids.update(t_data.get("r", []))
-
-    # Search in memory summaries and entities
-    for mid, entry in idx.get("m", {}).items():
-        if topic_lower in entry.get("s", "").lower():
-            mids.add(mid)
-        if topic_lower in " ".join(entry.get("e", [])):
-            mids.add(mid)
-    
-    # Also search in tags (stored in mem, not idx)
-    for mid, m in mem.items():
-        tags = m.get("g", [])
-        if any(topic_lower in tag.lower() or tag.lower() in topic_lower for tag in tags):
-            mids.add(mid)
+    if 3 <= len(topic_lower) <= LEX_QUERY_MAX and _lex_ready(idx):
+        mids = _topic_lookup(topic_lower, idx, ent, _load("lex", cwd))
+    else:
+        mids = _topic_scan(topic_lower, idx, ent, mem)
 
+    # Rank by the index's importance and read the top memories only
+    imp_order = {"c": 0, "h": 1, "n": 2, "l": 3}
+    docs = idx.get("m", {})
+    docs.prefetch(mids)
+    ranked = sorted(mids, key=lambda m: (imp_order.get(docs.get(m, {}).get("i"), 2), m))
     memories = []
-    for mid in mids:
-        if mid in mem:
-            m = mem[mid]
-            memories.append({
-                "id": mid,
-                "s": _sum(m["d"], 60),
-                "t": m.get("t", "info"),
-                "i": m.get("i", "n"),
-                "b": m.get("b", "?")  # Include branch origin
-            })
+    for i in range(0, len(ranked), 10):
+        chunk = ranked[i:i + 10]
+        mem.prefetch(chunk)
+        for mid in chunk:
+            if mid in mem:
+                m = mem[mid]
+                memories.append({
+                    "id": mid,
+                    "s": _sum(m["d"], 60),
+                    "t": m.get("t", "info"),
+                    "i": m.get("i", "n"),
+                    "b": m.get("b", "?")  # Include branch origin
+                })
+        if len(memories) >= 10:
+            break
 
-    imp_order = {"c": 0, "h": 1, "n": 2, "l": 3}
     memories.sort(key=lambda x: (imp_order.get(x["i"], 2), x["id"]))
 
     return {"topic": topic, "mem": memories[:10]}
 
+@_in_session
 def recall(mid: str = None, tag: str = None, query: str = None, last: int = None, cwd: str = ".") -> Any:
     """Retrieve memories."""
     idx = _idx(cwd)
@@ -576,10 +1615,11 @@ def recall(mid: str = None, tag: str = None, query: str = None, last: int = None
 
     if not any([mid, tag, query, last]):
         return {
-            "b": _branch(cwd),
+            "b": _store(cwd).branch,
             "n": len(idx.get("m", {})),
             "t": list(idx.get("t", {}).keys())[:10],
-            "recent": list(idx.get("m", {}).keys())[:5]
+            "recent": [m for m, _ in heapq.nlargest(
+                5, idx.get("m", {}).items(), key=lambda x: x[1].get("u", ""))]
         }
 
     if mid:
@@ -610,6 +1650,7 @@ def recall(mid: str = None, tag: str = None, query: str = None, last: int = None
 # UPDATE/EVOLVE
 # =============================================================================
 
+@_in_session
 def update(mid: str, content: Any = None, importance: str = None,
            tags: str = None, merge: bool = False, cwd: str = ".") -> bool:
     """Update existing memory."""
@@ -624,6 +1665,14 @@ def update(mid: str, content: Any = None, importance: str = None,
     old_entities = set(entry.get("e", []))
     old_importance = entry.get("i", "n")
 
+    # Content and tags are indexed for search: drop the old postings first
+    fts = _load("fts", cwd) if _fts_ready(idx) and (content is not None or tags) else None
+    if fts is not None:
+        _unindex_doc(fts, idx, mid, entry)
+    lex = _load("lex", cwd) if _lex_ready(idx) and (content is not None or tags) else None
+    if lex is not None:
+        _lex_remove(lex, mid, entry)
+
     if content is not None:
         if merge and isinstance(entry["d"], dict) and isinstance(content, dict):
             entry["d"] = {**entry["d"], **content}
@@ -643,7 +1692,8 @@ def update(mid: str, content: Any = None, importance: str = None,
     # Update entity index: remove old, add new
     removed_entities = old_entities - new_entities
     added_entities = new_entities - old_entities
-    
+    ent["e"].prefetch(removed_entities | added_entities)
+
     for e in removed_entities:
         if e in ent.get("e", {}):
             ent["e"][e]["m"] = [m for m in ent["e"][e]["m"] if m != mid]
@@ -662,6 +1712,12 @@ def update(mid: str, content: Any = None, importance: str = None,
         idx["m"][mid]["e"] = entry["e"][:3]
         idx["m"][mid]["i"] = entry.get("i", "n")
         idx["m"][mid]["u"] = entry["u"][:10]
+        if fts is not None:
+            _index_doc(fts, idx, mid, entry)
+            _save("fts", fts, cwd)
+    if lex is not None:
+        _lex_add(lex, mid, entry)
+        _save("lex", lex, cwd)
 
     # Handle importance changes for critical list
     new_importance = entry.get("i", "n")
@@ -679,6 +1735,7 @@ def update(mid: str, content: Any = None, importance: str = None,
     _save_idx(idx, cwd)
     return True
 
+@_in_session
 def evolve(mid: str, note: str, cwd: str = ".") -> bool:
     """Add evolution note."""
     mem = _mem(cwd)
@@ -687,12 +1744,13 @@ def evolve(mid: str, note: str, cwd: str = ".") -> bool:
 
     if "ev" not in mem[mid]:
         mem[mid]["ev"] = []
-    mem[mid]["ev"].append({"n": note, "t": _now(), "b": _branch(cwd)})
+    mem[mid]["ev"].append({"n": note, "t": _now(), "b": _store(cwd).branch})
     mem[mid]["u"] = datetime.now().isoformat()
 
     _save_mem(mem, cwd)
     return True
 
+@_in_session
 def forget(mid: str, cwd: str = ".") -> bool:
     """Remove memory."""
     mem = _mem(cwd)
@@ -703,6 +1761,7 @@ def forget(mid: str, cwd: str = ".") -> bool:
         return False
 
     # Clean up entity index
+    ent["e"].prefetch(mem[mid].get("e", []))
     for e in mem[mid].get("e", []):
         if e in ent.get("e", {}):
             ent["e"][e]["m"] = [m for m in ent["e"][e]["m"] if m != mid]
@@ -710,11 +1769,24 @@ def forget(mid: str, cwd: str = ".") -> bool:
 
     # Clean up topic index - remove from recent lists and decrement counts
     topics = idx.get("t", {})
+    touched = []
     for topic_name in list(topics.keys()):
         topic_data = topics[topic_name]
         if mid in topic_data.get("r", []):
             topic_data["r"] = [m for m in topic_data["r"] if m != mid]
             topic_data["n"] = max(0, topic_data.get("n", 1) - 1)
+            touched.append(topic_name)
+    _journal(idx, "-", mid, touched, mem[mid].get("e", []))
+
+    # Clean up search index
+    if _fts_ready(idx):
+        fts = _load("fts", cwd)
+        _unindex_doc(fts, idx, mid, mem[mid])
+        _save("fts", fts, cwd)
+    if _lex_ready(idx):
+        lex = _load("lex", cwd)
+        _lex_remove(lex, mid, mem[mid])
+        _save("lex", lex, cwd)
 
     # Clean up memory index
     if mid in idx.get("m", {}):
@@ -735,61 +1807,314 @@ def forget(mid: str, cwd: str = ".") -> bool:
 # SEARCH
 # =============================================================================
 
+# Inverted index in the sharded "fts" blob: token -> {mid: [tf, fields]},
+# where tf counts the token in the content and fields flags entity/tag
+# matches. Document lengths live in idx["m"][mid]["l"], totals in idx["s"].
+# Writes (remember, import, maintain) build it when missing; search never
+# saves it, so a read cannot turn into a notes write.
+FTS_VERSION = 1
+FIELD_ENT, FIELD_TAG = 1, 2
+BM25_K1, BM25_B = 1.2, 0.75
+_TOKEN_RE = re.compile(r"\w+")
+
+def _tokens(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+def _doc_terms(entry: Dict) -> Dict[str, List[int]]:
+    """Postings of one memory: token -> [content tf, field flags]."""
+    terms = {}
+    for tok in _tokens(json.dumps(entry.get("d", ""), ensure_ascii=False)):
+        terms.setdefault(tok, [0, 0])[0] += 1
+    for tok in _tokens(" ".join(entry.get("e", []))):
+        terms.setdefault(tok, [0, 0])[1] |= FIELD_ENT
+    for tok in _tokens(" ".join(entry.get("g", []))):
+        terms.setdefault(tok, [0, 0])[1] |= FIELD_TAG
+    return terms
+
+def _fts_ready(idx: Dict) -> bool:
+    return idx.get("s", {}).get("fv") == FTS_VERSION
+
+def _index_doc(fts: ShardedMap, idx: Dict, mid: str, entry: Dict):
+    """Add a memory's postings; idx["m"][mid] must exist."""
+    terms = _doc_terms(entry)
+    fts.prefetch(terms)
+    for tok, posting in terms.items():
+        fts.setdefault(tok, {})[mid] = posting
+    length = sum(tf for tf, _ in terms.values())
+    idx["m"][mid]["l"] = length
+    idx["s"]["fl"] = idx["s"].get("fl", 0) + length
+
+def _unindex_doc(fts: ShardedMap, idx: Dict, mid: str, entry: Dict):
+    """Remove a memory's postings (entry as it was indexed)."""
+    terms = _doc_terms(entry)
+    fts.prefetch(terms)
+    for tok in terms:
+        postings = fts.get(tok)
+        if postings and mid in postings:
+            del postings[mid]
+            if not postings:
+                del fts[tok]
+    idx["s"]["fl"] = max(0, idx["s"].get("fl", 0) - idx["m"].get(mid, {}).pop("l", 0))
+
+def _fts_index(mem: Dict) -> tuple:
+    """Inverted index and document lengths of all memories, unsaved."""
+    fts, lengths = {}, {}
+    for mid, entry in mem.items():
+        terms = _doc_terms(entry)
+        for tok, posting in terms.items():
+            fts.setdefault(tok, {})[mid] = posting
+        lengths[mid] = sum(tf for tf, _ in terms.values())
+    return fts, lengths
+
+def _build_fts(cwd: str = "."):
+    """Rebuild the search index from all memories."""
+    idx = _idx(cwd)
+    fts, lengths = _fts_index(_mem(cwd))
+    total = 0
+    for mid, length in lengths.items():
+        if mid in idx["m"]:
+            idx["m"][mid]["l"] = length
+            total += length
+    idx["s"].update({"fv": FTS_VERSION, "fl": total})
+    _save("fts", fts, cwd)
+    _save_idx(idx, cwd)
+
+def _ensure_indexes(cwd: str = "."):
+    """Build the search and name indexes if they are missing. Only write
+    paths call this; reads without an index use a transient one or a scan."""
+    idx = _idx(cwd)
+    if not _fts_ready(idx):
+        _build_fts(cwd)
+    if not _lex_ready(idx):
+        _build_lex(cwd)
+
+def _postings(fts: ShardedMap, term: str) -> Dict[str, List[int]]:
+    """Postings of every token starting with term, summed per memory."""
+    if len(term) >= SHARD_CHARS:
+        shards = [fts.shard(term)]
+    else:
+        shards = fts.select(lambda s: bytes.fromhex(s).decode(errors="ignore").startswith(term))
+    matches = {}
+    for shard in shards:
+        for tok, postings in shard.items():
+            if tok.startswith(term):
+                for mid, (tf, fields) in postings.items():
+                    m = matches.setdefault(mid, [0, 0])
+                    m[0] += tf
+                    m[1] |= fields
+    return matches
+
+@_in_session
 def search(query: str, cwd: str = ".") -> Dict:
-    """Full-text search across all memories."""
-    mem = _mem(cwd)
+    """Full-text search across all memories (BM25 over the inverted index).
+
+    Query terms match indexed tokens by prefix; entity and tag matches add
+    the same +2 boosts as content scoring always has.
+    """
     idx = _idx(cwd)
-    
-    query_lower = query.lower()
-    query_terms = [t.strip() for t in query_lower.split() if t.strip()]
-    
-    results = []
-    
-    for mid, entry in mem.items():
-        score = 0
-        
-        # Search in content
-        content_str = json.dumps(entry.get("d", "")).lower()
-        for term in query_terms:
-            if term in content_str:
-                score += content_str.count(term)
-        
-        # Search in entities
-        entities_str = " ".join(entry.get("e", [])).lower()
-        for term in query_terms:
-            if term in entities_str:
+    docs = idx.get("m", {})
+    if _fts_ready(idx):
+        fts, lengths = _load("fts", cwd), None
+        total = idx["s"].get("fl", 0)
+    else:
+        # A search never writes: index in memory for this call only
+        built, lengths = _fts_index(_mem(cwd))
+        fts = ShardedMap.of(built, SHARDED["fts"])
+        total = sum(length for mid, length in lengths.items() if mid in docs)
+
+    query_terms = list(dict.fromkeys(_tokens(query)))
+    n = len(docs)
+    avgdl = total / n if n else 0
+
+    # BM25 with norm = k1 * (1 - b + b * dl / avgdl) folded into k + kb * dl
+    k = BM25_K1 * (1 - BM25_B)
+    kb = BM25_K1 * BM25_B / avgdl if avgdl else 0
+    scores: Dict[str, float] = {}
+    for term in query_terms:
+        matches = _postings(fts, term)
+        docs.prefetch(matches)
+        df = sum(1 for tf, _ in matches.values() if tf)
+        idf = math.log(1 + (n - df + 0.5) / (df + 0.5)) * (BM25_K1 + 1)
+        for mid, (tf, fields) in matches.items():
+            doc = docs.get(mid)
+            if doc is None:
+                continue
+            dl = doc.get("l", avgdl) if lengths is None else lengths.get(mid, avgdl)
+            score = idf * tf / (tf + k + kb * dl) if tf else 0.0
+            if fields & FIELD_ENT:
                 score += 2  # Boost entity matches
-        
-        # Search in tags
-        tags_str = " ".join(entry.get("g", [])).lower()
-        for term in query_terms:
-            if term in tags_str:
+            if fields & FIELD_TAG:
                 score += 2  # Boost tag matches
-        
-        if score > 0:
+            scores[mid] = scores.get(mid, 0.0) + score
+
+    # Sort by score (descending), then by importance; only candidates
+    # scoring at least the 15th best need the full sort key
+    imp_order = {"c": 0, "h": 1, "n": 2, "l": 3}
+    best = heapq.nlargest(15, scores.values())
+    cutoff = best[-1] - 1e-9 if best else 0
+    top = sorted(
+        (m for m, score in scores.items() if score >= cutoff),
+        key=lambda m: (-round(scores[m], 9), imp_order.get(docs[m].get("i"), 2), m))[:15]
+
+    mem = _mem(cwd)
+    mem.prefetch(top)
+    results = []
+    for mid in top:
+        entry = mem.get(mid)
+        if entry:
             results.append({
                 "id": mid,
                 "s": _sum(entry.get("d"), 60),
                 "t": entry.get("t", "info"),
                 "i": entry.get("i", "n"),
-                "b": entry.get("b", "?"),
-                "score": score
+                "b": entry.get("b", "?")
             })
-    
-    # Sort by score (descending), then by importance
-    imp_order = {"c": 0, "h": 1, "n": 2, "l": 3}
-    results.sort(key=lambda x: (-x["score"], imp_order.get(x["i"], 2)))
-    
-    # Remove score from output (internal use only)
-    for r in results:
-        del r["score"]
-    
-    return {"query": query, "results": results[:15]}
+
+    return {"query": query, "results": results}
+
+# =============================================================================
+# TOPIC LOOKUP
+# =============================================================================
+
+# Name index in the sharded "lex" blob for get_topic, which matches a topic
+# against entity, topic and tag names in both directions (name contains
+# topic, topic contains name). "\0" + name -> [kinds, tag mids] registers a
+# name; each trigram of a name -> [names containing it]. Tag mids follow
+# every tag change; names are only added between rebuilds, and each hit is
+# looked up in ent and idx, so a stale name costs a lookup, never a wrong
+# result. Like the search index it is only built on writes (_ensure_indexes).
+LEX_VERSION = 1
+NAME_ENT, NAME_TOPIC, NAME_TAG = 1, 2, 4
+LEX_QUERY_MAX = 128  # longer topics are matched by a scan
+_NAME = "\0"
+
+def _lex_ready(idx: Dict) -> bool:
+    return idx.get("s", {}).get("lv") == LEX_VERSION
+
+def _name_grams(name: str) -> set:
+    return {g for g in (name[i:i + 3] for i in range(len(name) - 2)) if _NAME not in g}
+
+def _memory_names(entry: Dict) -> List[tuple]:
+    """(name, kind) of the entities, primary topic and tags of a memory,
+    spelled as get_topic compares them."""
+    entities = entry.get("e", [])
+    names = [(e, NAME_ENT) for e in entities]
+    names.append((entities[0] if entities else entry.get("t", "info"), NAME_TOPIC))
+    names += [(tag.lower(), NAME_TAG) for tag in entry.get("g", [])]
+    return names
+
+def _lex_add(lex: ShardedMap, mid: str, entry: Dict):
+    """Register a memory's names and its tag references."""
+    _lex_register(lex, _memory_names(entry), mid)
+
+def _lex_register(lex: ShardedMap, names: List[tuple], mid: str = ""):
+    lex.prefetch(_NAME + name for name, _ in names)
+    new = []
+    for name, kind in names:
+        reg = lex.get(_NAME + name)
+        if reg is None:
+            reg = lex[_NAME + name] = [0, []]
+            new.append(name)
+        reg[0] |= kind
+        if kind == NAME_TAG and mid not in reg[1]:
+            reg[1].append(mid)
+    lex.prefetch(g for name in new for g in _name_grams(name))
+    for name in new:
+        for g in _name_grams(name):
+            lex.setdefault(g, []).append(name)
+
+def _lex_remove(lex: ShardedMap, mid: str, entry: Dict):
+    """Drop a memory's tag references (entry as it was registered)."""
+    tags = [tag.lower() for tag in entry.get("g", [])]
+    lex.prefetch(_NAME + tag for tag in tags)
+    for tag in tags:
+        reg = lex.get(_NAME + tag)
+        if reg and mid in reg[1]:
+            reg[1].remove(mid)
+
+def _build_lex(cwd: str = "."):
+    """Rebuild the name index from all entities, topics and tags."""
+    idx = _idx(cwd)
+    ent = _ent(cwd)
+    lex = ShardedMap.of({}, SHARDED["lex"])
+    _lex_register(lex, [(name, NAME_ENT) for name in ent["e"]])
+    _lex_register(lex, [(name, NAME_TOPIC) for name in idx["t"]])
+    for mid, entry in _mem(cwd).scan():
+        _lex_register(lex, [(tag.lower(), NAME_TAG) for tag in entry.get("g", [])], mid)
+    idx["s"]["lv"] = LEX_VERSION
+    _save("lex", lex.to_dict(), cwd)
+    _save_idx(idx, cwd)
+
+def _lex_names(lex: ShardedMap, topic: str) -> Dict[str, List]:
+    """Registered names containing topic or contained in it."""
+    subs = {topic[i:j] for i in range(len(topic)) for j in range(i + 1, len(topic) + 1)}
+    grams = _name_grams(topic)
+    lex.prefetch([_NAME + s for s in subs] + list(grams))
+    # Names containing topic: candidates from its rarest trigram
+    postings = [lex.get(g, []) for g in grams]
+    names = {n for n in min(postings, key=len) if topic in n} if postings and all(postings) else set()
+    # Names inside topic: its substrings that are registered names
+    names.update(s for s in subs if _NAME + s in lex)
+    return {n: lex[_NAME + n] for n in names}
+
+def _topic_lookup(topic: str, idx: Dict, ent: Dict, lex: ShardedMap) -> set:
+    """Ids get_topic matches, found through the name index."""
+    names = _lex_names(lex, topic)
+    mids = set()
+
+    entities = [n for n, (kinds, _) in names.items() if kinds & NAME_ENT]
+    ent["e"].prefetch(entities)
+    for n in entities:
+        if n in ent["e"]:
+            mids.update(ent["e"][n].get("m", []))
+
+    for n, (kinds, _) in names.items():
+        if kinds & NAME_TOPIC and n in idx["t"]:
+            mids.update(idx["t"][n].get("r", []))
+
+    # Summaries and leading entities are in the idx entries: one batched read
+    for mid, entry in idx["m"].items():
+        if topic in entry.get("s", "").lower() or topic in " ".join(entry.get("e", [])):
+            mids.add(mid)
+
+    for kinds, refs in names.values():
+        if kinds & NAME_TAG:
+            mids.update(refs)
+    return mids
+
+def _topic_scan(topic: str, idx: Dict, ent: Dict, mem: ShardedMap) -> set:
+    """Ids get_topic matches, by a pass over every entity, topic and memory."""
+    mids = set()
+
+    # Check entity index
+    for e_name, e_data in ent.get("e", {}).items():
+        if topic in e_name or e_name in topic:
+            mids.update(e_data.get("m", []))
+
+    # Check topic index
+    for t_name, t_data in idx.get("t", {}).items():
+        if topic in t_name or t_name in topic:
+            mids.update(t_data.get("r", []))
+
+    # Search in memory summaries and entities
+    for mid, entry in idx.get("m", {}).items():
+        if topic in entry.get("s", "").lower():
+            mids.add(mid)
+        if topic in " ".join(entry.get("e", [])):
+            mids.add(mid)
+
+    # Also search in tags (stored in mem, not idx)
+    for mid, m in mem.items():
+        tags = m.get("g", [])
+        if any(topic in tag.lower() or tag.lower() in topic for tag in tags):
+            mids.add(mid)
+    return mids
 
 # =============================================================================
 # ENTITIES
 # =============================================================================
 
+@_in_session
 def entities(cwd: str = ".") -> Dict:
     """List all entities with counts."""
     ent = _ent(cwd)
@@ -800,6 +2125,7 @@ def entities(cwd: str = ".") -> Dict:
         "total": len(e_dict)
     }
 
+@_in_session
 def entity(name: str, cwd: str = ".") -> Dict:
     """Get entity details and linked memories."""
     ent = _ent(cwd)
@@ -819,6 +2145,7 @@ def entity(name: str, cwd: str = ".") -> Dict:
         return {"error": "not found"}
 
     memories = []
+    idx["m"].prefetch(e_data.get("m", []))
     for mid in e_data.get("m", []):
         if mid in idx.get("m", {}):
             memories.append({
@@ -833,13 +2160,107 @@ def entity(name: str, cwd: str = ".") -> Dict:
         "memories": memories[:10]
     }
 
+# =============================================================================
+# IMPORT/EXPORT (JSONL)
+# =============================================================================
+
+IMPORT_BATCH = 500  # records per entity-extraction batch
+
+def import_jsonl(lines: Iterable[str], cwd: str = ".") -> Dict:
+    """Add memories from JSONL lines in one session and one write.
+
+    A line holding an exported record (a dict with "d") keeps its id,
+    tags, importance and timestamps; any other JSON value is remembered
+    as content.
+    """
+    records, errors = [], 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            errors += 1
+    return {"imported": import_records(records, cwd), "errors": errors}
+
+@_in_session
+def import_records(records: List[Any], cwd: str = ".") -> int:
+    """Add parsed records (see import_jsonl); returns how many."""
+    for i in range(0, len(records), IMPORT_BATCH):
+        _import_batch(records[i:i + IMPORT_BATCH], cwd)
+    return len(records)
+
+def _import_batch(records: List[Any], cwd: str):
+    mem = _mem(cwd)
+    ent = _ent(cwd)
+    _ensure_indexes(cwd)
+    idx = _idx(cwd)
+    fts = _load("fts", cwd) if _fts_ready(idx) else None
+    lex = _load("lex", cwd) if _lex_ready(idx) else None
+    branch = _store(cwd).branch
+    now = datetime.now().isoformat()
+
+    entries = []
+    for record in records:
+        if isinstance(record, dict) and "d" in record:
+            fields = {k: v for k, v in record.items() if k != "id"}
+            entries.append((record.get("id") or _id(record["d"]), fields))
+        else:
+            entries.append((_id(record), {"d": record}))
+
+    # Entities for the whole batch in one pass
+    extracted = iter(extract_entities_batch([f["d"] for _, f in entries if "e" not in f]))
+    for n, (mid, fields) in enumerate(entries):
+        entry = {
+            "d": fields["d"],
+            "e": fields["e"] if "e" in fields else next(extracted),
+            "t": fields.get("t") or classify_memory(fields["d"]),
+            "g": [],
+            "i": "n",
+            "b": branch,
+            "c": now,
+            "u": now,
+            "a": 0
+        }
+        entry.update(fields)
+        entries[n] = (mid, entry)
+
+    mem.prefetch(mid for mid, _ in entries)
+    ent["e"].prefetch({e for mid, entry in entries for e in entry["e"]} |
+                      {e for mid, _ in entries if mid in mem for e in mem[mid].get("e", [])})
+    for mid, entry in entries:
+        if mid in mem:
+            _unlink_memory(idx, ent, fts, lex, mid, mem[mid])
+        mem[mid] = entry
+        _link_memory(idx, ent, fts, lex, mid, entry)
+
+    _save_mem(mem, cwd)
+    _save_ent(ent, cwd)
+    _save_idx(idx, cwd)
+    if fts is not None:
+        _save("fts", fts, cwd)
+    if lex is not None:
+        _save("lex", lex, cwd)
+
+@_in_session
+def export_jsonl(out, cwd: str = ".") -> int:
+    """Write every memory to out as a JSON line {"id": ..., **entry}, a
+    shard at a time; returns how many."""
+    n = 0
+    for mid, entry in _mem(cwd).scan():
+        out.write(json.dumps({"id": mid, **entry}, separators=(',', ':')) + "\n")
+        n += 1
+    return n
+
 # =============================================================================
 # SESSION END
 # =============================================================================
 
+@_in_session
 def sync_end(summary: Any, cwd: str = ".") -> Dict:
     """End session, store summary."""
-    branch = _branch(cwd)
+    branch = _store(cwd).branch
 
     # Add branch to summary
     if isinstance(summary, dict):
@@ -849,12 +2270,81 @@ def sync_end(summary: Any, cwd: str = ".") -> Dict:
     _maintain(cwd)
     return {"ok": True, "mid": mid, "branch": branch}
 
-def _maintain(cwd: str = "."):
-    """Lightweight maintenance - clean up stale references."""
+# Change journal in idx["j"]: [op, mid, topics, entities] per remember (+)
+# and forget (-), so _maintain repairs only what those touched. A missing
+# journal (older stores, merges, overflow) means a full pass is due.
+JOURNAL_MAX = 5000
+
+def _journal(idx: Dict, op: str, mid: str, topics: List[str], entities: List[str]):
+    """Append a change for the next _maintain."""
+    journal = idx.get("j")
+    if journal is None:
+        return
+    if len(journal) >= JOURNAL_MAX:
+        del idx["j"]
+        return
+    journal.append([op, mid, list(topics), list(entities)])
+
+@_in_session
+def _maintain(cwd: str = ".", full: bool = False) -> Dict:
+    """Lightweight maintenance - clean up stale references.
+
+    Repairs the topics, entities and index entries named in the journal;
+    full=True (or a missing journal) walks everything instead.
+    """
     idx = _idx(cwd)
     mem = _mem(cwd)
     ent = _ent(cwd)
 
+    journal = idx.get("j")
+    if full or journal is None:
+        _maintain_full(idx, mem, ent)
+        idx["j"] = []
+        _save_idx(idx, cwd)
+        _save_ent(ent, cwd)
+        _ensure_indexes(cwd)
+        return {"full": True, "changes": 0}
+
+    touched_topics, touched_entities, mids = set(), set(), set()
+    for op, mid, topics, ents in journal:
+        touched_topics.update(topics)
+        touched_entities.update(ents)
+        mids.add(mid)
+    mem.prefetch(mids)
+    gone = {mid for mid in mids if mid not in mem}
+
+    # Clean up topic index
+    topics = idx.get("t", {})
+    for t in touched_topics:
+        if t in topics:
+            topics[t]["r"] = [m for m in topics[t]["r"] if m not in gone]
+            if not topics[t]["r"] and topics[t].get("n", 0) <= 0:
+                del topics[t]
+
+    # Clean up memory index and critical list
+    mem_index = idx.get("m", {})
+    for mid in gone:
+        mem_index.pop(mid, None)
+    idx["c"] = [m for m in idx.get("c", []) if m not in gone]
+
+    # Clean up entity index
+    entities_dict = ent.get("e", {})
+    entities_dict.prefetch(touched_entities)
+    for e_name in touched_entities:
+        if e_name in entities_dict:
+            entities_dict[e_name]["m"] = [m for m in entities_dict[e_name].get("m", []) if m not in gone]
+            entities_dict[e_name]["n"] = len(entities_dict[e_name]["m"])
+            if entities_dict[e_name]["n"] == 0:
+                del entities_dict[e_name]
+
+    idx["j"] = []
+    _save_idx(idx, cwd)
+    _save_ent(ent, cwd)
+    _ensure_indexes(cwd)
+    return {"full": False, "changes": len(journal)}
+
+def _maintain_full(idx: Dict, mem: Dict, ent: Dict):
+    """Filter every topic, index entry and entity list against mem."""
     # Clean up topic index
     topics = idx.get("t", {})
     for t in list(topics.keys()):
@@ -872,6 +2362,9 @@ def _maintain(cwd: str = "."):
     # Clean up critical list
     idx["c"] = [m for m in idx.get("c", []) if m in mem]
 
+    # Names only accumulate in the name index: _maintain rebuilds it
+    idx["s"].pop("lv", None)
+
     # Clean up entity index - remove empty entities and stale memory refs
     entities_dict = ent.get("e", {})
     for e_name in list(entities_dict.keys()):
@@ -882,9 +2375,6 @@ def _maintain(cwd: str = "."):
         if entities_dict[e_name]["n"] == 0:
             del entities_dict[e_name]
 
-    _save_idx(idx, cwd)
-    _save_ent(ent, cwd)
-
 # =============================================================================
 # INIT CONTEXT
 # =============================================================================
@@ -997,32 +2487,62 @@ def main():
 
     sub.add_parser("branches", aliases=["br"])
 
+    # import/export
+    im = sub.add_parser("import")
+    im.add_argument("file", nargs="?", default="-", help="JSONL file (- for stdin)")
+    ex = sub.add_parser("export")
+    ex.add_argument("file", nargs="?", default="-", help="JSONL file (- for stdout)")
+
+    # maintenance
+    mt = sub.add_parser("maintain")
+    mt.add_argument("--full", action="store_true", help="Rebuild all lists, not just journaled changes")
+
     args = p.parse_args()
     cwd = args.path
-
-    # Execute
+    if args.cmd == "import":
+        # Read input up front so a replayed run imports the same lines
+        if args.file == "-":
+            args.lines = sys.stdin.readlines()
+        else:
+            with open(args.file) as f:
+                args.lines = f.readlines()
+
+    # Execute (one store load and write-back per invocation); print only
+    # once the notes are committed, so output matches what was written
+    with session(cwd) as store:
+        output = _run(args, cwd)
+    if store.replayed:
+        output = store.replayed[-1]
+    if output is not None:
+        print(output)
+
+@_in_session
+def _run(args, cwd: str) -> Optional[str]:
+    """Run a CLI command and return its output (None if already streamed)."""
+    dump = lambda result: json.dumps(result, separators=(',', ':'))
     if args.cmd == "sync":
         if args.start:
-            print(json.dumps(sync_start(cwd), separators=(',', ':')))
+            return dump(sync_start(cwd))
         elif args.end:
             try:
                 summary = json.loads(args.end)
             except:
                 summary = args.end
-            print(json.dumps(sync_end(summary, cwd), separators=(',', ':')))
+            return dump(sync_end(summary, cwd))
+        return None
     elif args.cmd in ("remember", "r"):
         try:
             content = json.loads(args.content)
         except:
             content = args.content
-        print(remember(content, args.tags, args.importance, cwd))
+        return remember(content, args.tags, args.importance, cwd)
     elif args.cmd in ("recall", "q"):
         result = recall(args.mid, args.tag, args.query, args.last, cwd)
-        print(json.dumps(result, separators=(',', ':')) if result else "null")
+        return dump(result) if result else "null"
     elif args.cmd in ("get", "g"):
-        print(json.dumps(get_topic(args.topic, cwd), separators=(',', ':')))
+        return dump(get_topic(args.topic, cwd))
     elif args.cmd in ("search", "s"):
-        print(json.dumps(search(args.query, cwd), separators=(',', ':')))
+        return dump(search(args.query, cwd))
     elif args.cmd in ("update", "u"):
         content = None
         if args.content:
@@ -1030,21 +2550,32 @@ def main():
                 content = json.loads(args.content)
             except:
                 content = args.content
-        print("ok" if update(args.mid, content, args.importance, args.tags, args.merge, cwd) else "not found")
+        return "ok" if update(args.mid, content, args.importance, args.tags, args.merge, cwd) else "not found"
     elif args.cmd in ("evolve", "e"):
-        print("ok" if evolve(args.mid, args.note, cwd) else "not found")
+        return "ok" if evolve(args.mid, args.note, cwd) else "not found"
     elif args.cmd in ("forget", "f"):
-        print("ok" if forget(args.mid, cwd) else "not found")
+        return "ok" if forget(args.mid, cwd) else "not found"
     elif args.cmd in ("entities", "ent"):
-        print(json.dumps(entities(cwd), separators=(',', ':')))
+        return dump(entities(cwd))
     elif args.cmd == "entity":
-        print(json.dumps(entity(args.name, cwd), separators=(',', ':')))
+        return dump(entity(args.name, cwd))
     elif args.cmd in ("merge-branch", "mb"):
-        print(json.dumps(merge_branch(args.source, cwd), separators=(',', ':')))
+        return dump(merge_branch(args.source, cwd))
     elif args.cmd in ("branches", "br"):
-        print(json.dumps(list_branches(cwd), separators=(',', ':')))
+        return dump(list_branches(cwd))
+    elif args.cmd == "import":
+        return dump(import_jsonl(args.lines, cwd))
+    elif args.cmd == "export":
+        # Read-only, so streaming before the session ends is safe
+        if args.file == "-":
+            export_jsonl(sys.stdout, cwd)
+            return None
+        with open(args.file, "w") as f:
+            return dump({"exported": export_jsonl(f, cwd)})
+    elif args.cmd == "maintain":
+        return dump(_maintain(cwd, args.full))
     else:
-        print(json.dumps(recall(cwd=cwd), separators=(',', ':')))
+        return dump(recall(cwd=cwd))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,430 @@
+"""
+Unit Tests for GitNotesMemory
+"""
+
+import importlib.util
+import io
+import json
+import unittest
+import tempfile
+import shutil
+import subprocess
+import sys
+import threading
+from pathlib import Path
+from unittest import mock
+
+# Load memory.py by path: skills/memory is also importable as "memory"
+_spec = importlib.util.spec_from_file_location(
+    "git_notes_memory", Path(__file__).resolve().parent.parent / "memory.py")
+memory = sys.modules["git_notes_memory"] = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(memory)
+
+
+def _git(path, *args):
+    return subprocess.run(["git", *args], cwd=path, check=True,
+                          capture_output=True, text=True).stdout.strip()
+
+
+class MemoryTestCase(unittest.TestCase):
+    """Fresh repository with one commit per test"""
+
+    def setUp(self):
+        self.encoding = memory.ENCODING
+        self.paths = []
+        self.path = self.new_repo()
+
+    def tearDown(self):
+        memory.ENCODING = self.encoding
+        memory.configure_pool(memory.POOL_SIZE)
+        for path in self.paths:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def new_repo(self):
+        path = tempfile.mkdtemp()
+        self.paths.append(path)
+        _git(path, "init", "-q", "-b", "main")
+        _git(path, "config", "user.name", "Test")
+        _git(path, "config", "user.email", "test@example.com")
+        _git(path, "commit", "-q", "--allow-empty", "-m", "init")
+        return path
+
+    def remember_all(self, contents, **kwargs):
+        with memory.session(self.path):
+            return [memory.remember(c, cwd=self.path, **kwargs) for c in contents]
+
+    def mem(self):
+        """Memories as a fresh session reads them back from the notes"""
+        with memory.session(self.path):
+            return memory._mem(self.path).to_dict()
+
+
+class TestRoundTrip(MemoryTestCase):
+    """remember / recall / update / forget"""
+
+    def test_round_trip(self):
+        mid = memory.remember({"topic": "Postgres", "note": "uses MVCC"},
+                              tags="db,storage", importance="h", cwd=self.path)
+        other = memory.remember("Redis caches sessions", cwd=self.path)
+
+        entry = memory.recall(mid, cwd=self.path)
+        self.assertEqual(entry["d"], {"topic": "Postgres", "note": "uses MVCC"})
+        self.assertEqual(entry["g"], ["db", "storage"])
+        self.assertEqual(entry["i"], "h")
+        self.assertIn("postgres", entry["e"])
+        self.assertEqual(memory.recall(mid, cwd=self.path)["a"], 2)
+        self.assertEqual(memory.recall(cwd=self.path)["n"], 2)
+        self.assertEqual(set(memory.recall(tag="db", cwd=self.path)), {mid})
+
+        self.assertTrue(memory.update(mid, "Postgres uses MVCC and WAL", tags="db", cwd=self.path))
+        self.assertEqual(memory.recall(mid, cwd=self.path)["d"], "Postgres uses MVCC and WAL")
+        self.assertEqual([r["id"] for r in memory.search("wal", cwd=self.path)["results"]], [mid])
+        self.assertEqual(memory.search("storage", cwd=self.path)["results"], [])
+        self.assertFalse(memory.update("missing", "x", cwd=self.path))
+
+        self.assertTrue(memory.forget(mid, cwd=self.path))
+        self.assertIsNone(memory.recall(mid, cwd=self.path))
+        self.assertFalse(memory.forget(mid, cwd=self.path))
+        self.assertEqual(memory.search("postgres", cwd=self.path)["results"], [])
+        memory._maintain(self.path)
+        self.assertEqual(memory.entity("postgres", cwd=self.path), {"error": "not found"})
+        self.assertEqual(list(self.mem()), [other])
+
+    def test_session_writes_once(self):
+        heads = memory._notes_heads(self.path)
+        with memory.session(self.path):
+            memory.remember("first", cwd=self.path)
+            memory.remember("second", cwd=self.path)
+            self.assertEqual(memory._notes_heads(self.path), heads)
+        self.assertEqual(len(self.mem()), 2)
+
+    def test_reads_do_not_write(self):
+        self.remember_all(["Postgres uses MVCC", "Redis is a cache"], tags="db")
+        with memory.session(self.path):
+            idx = memory._idx(self.path)
+            idx["s"].pop("fv")
+            idx["s"].pop("lv")
+            memory._save_idx(idx, self.path)
+        heads = memory._notes_heads(self.path)
+        self.assertEqual(len(memory.search("postgres", cwd=self.path)["results"]), 1)
+        self.assertEqual(len(memory.get_topic("redis", cwd=self.path)["mem"]), 1)
+        self.assertEqual(memory._notes_heads(self.path), heads)
+
+
+class TestSyncStart(MemoryTestCase):
+    """sync_start answers from the index"""
+
+    def test_index_only(self):
+        critical = self.remember_all(["Never force-push to main"], importance="c")
+        high = self.remember_all(["Postgres is the system of record"], importance="h")
+        self.remember_all(["Redis caches sessions", "Kafka streams events"], tags="infra")
+
+        with mock.patch.object(memory, "_mem", side_effect=AssertionError("mem read")):
+            result = memory.sync_start(cwd=self.path)
+        self.assertEqual(result["b"], "main")
+        self.assertEqual(result["n"], 4)
+        self.assertEqual([c["id"] for c in result["c"]], critical)
+        self.assertEqual(result["c"][0]["s"], "Never force-push to main")
+        self.assertEqual([h["id"] for h in result["h"]], high)
+
+
+class TestListBranches(MemoryTestCase):
+    """list_branches reads each branch's stats note"""
+
+    def test_stats_note(self):
+        self.remember_all(["alpha note", "bravo note"])
+        _git(self.path, "checkout", "-q", "-b", "feature/x")
+        memory.remember("charlie on feature", cwd=self.path)
+        forgotten = memory.remember("delta on feature", cwd=self.path)
+        memory.forget(forgotten, cwd=self.path)
+        counts = {"main": 2, "feature-x": len(self.mem())}
+
+        with mock.patch.object(memory.MemoryStore, "read", side_effect=AssertionError("mem read")):
+            result = memory.list_branches(cwd=self.path)
+        self.assertEqual(result["current"], "feature/x")
+        self.assertEqual({b: v["count"] for b, v in result["branches"].items()}, counts)
+        self.assertTrue(result["branches"]["feature-x"]["current"])
+        self.assertFalse(result["branches"]["main"]["current"])
+
+        prefix = memory._shard_path("")
+        for branch, info in result["branches"].items():
+            head = memory._notes_heads(self.path)[f"refs/notes/mem-{branch}"]
+            sizes = memory._tree_sizes(head, self.path)
+            self.assertEqual(info["bytes"], sum(n for p, n in sizes.items() if p.startswith(prefix)))
+            self.assertTrue(info["updated"])
+
+
+class TestMaintain(MemoryTestCase):
+    """Journaled _maintain repairs what a full walk would"""
+
+    def snapshot(self):
+        with memory.session(self.path):
+            idx = memory._plain(memory._idx(self.path))
+            ent = memory._plain(memory._ent(self.path))
+        return {"t": idx["t"], "m": idx["m"], "c": idx["c"], "e": ent["e"], "j": idx["j"]}
+
+    def test_journaled_matches_full(self):
+        mids = self.remember_all(["Postgres uses MVCC", "Redis caches #sessions",
+                                  "Postgres replicas lag", "Kafka streams events"],
+                                 importance="c")
+        memory._maintain(self.path, full=True)
+        memory.forget(mids[0], cwd=self.path)
+        memory.forget(mids[1], cwd=self.path)
+        memory.update(mids[3], "Kafka streams events to Postgres", cwd=self.path)
+
+        result = memory._maintain(self.path)
+        self.assertFalse(result["full"])
+        self.assertGreater(result["changes"], 0)
+        journaled = self.snapshot()
+        self.assertEqual(journaled["j"], [])
+        self.assertNotIn(mids[0], journaled["m"])
+        self.assertNotIn(mids[1], journaled["c"])
+
+        self.assertEqual(memory._maintain(self.path, full=True), {"full": True, "changes": 0})
+        self.assertEqual(self.snapshot(), journaled)
+
+
+class TestEncoding(MemoryTestCase):
+    """Packed blobs hold exactly what JSON blobs hold"""
+
+    RECORDS = [
+        {"d": {"topic": "Postgres", "n": 1, "f": 0.5, "ok": True}, "e": ["postgres"], "g": []},
+        {"d": "plain text über \x00 \"quoted\"", "e": [], "g": ["a", "b"], "ev": [{"n": "x"}]},
+        {"d": None, "x": [1, "two", None]},
+        {"d": ["list", 2], "e": ["list"], "g": [], "i": "c"},
+    ]
+
+    def test_blob_parity(self):
+        part = {f"m{i}": record for i, record in enumerate(self.RECORDS)}
+        for data in [part, {"t": {"a": {"n": 1, "r": ["x"]}}, "c": []}, [], "text", 3]:
+            memory.ENCODING = "json"
+            plain = memory._dump(data)
+            memory.ENCODING = "packed"
+            packed = memory._dump(data)
+            self.assertTrue(packed.startswith(memory.PACKED_MAGIC))
+            self.assertEqual(memory._parse(packed), memory._parse(plain))
+            self.assertEqual(memory._parse(packed), data)
+
+    def test_store_parity(self):
+        contents = [f"Memory {i} about Postgres and #redis" if i % 2
+                    else {"topic": f"Topic{i % 5}", "note": f"note {i}"} for i in range(40)]
+        stores = {}
+        for encoding in ["json", "packed"]:
+            memory.ENCODING = encoding
+            self.path = self.new_repo()
+            self.remember_all(contents, tags="db")
+            memory.ENCODING = "json"  # parse must not depend on the writer's setting
+            with memory.session(self.path):
+                stores[encoding] = {
+                    name: memory._plain(memory._load(name, self.path))
+                    for name in ["mem", "ent", "fts", "lex"]
+                }
+                stores[encoding]["search"] = memory.search("postgres redis", cwd=self.path)
+                stores[encoding]["topic"] = memory.get_topic("topic", cwd=self.path)
+            for entry in stores[encoding]["mem"].values():
+                del entry["c"], entry["u"]
+        self.assertEqual(stores["json"], stores["packed"])
+
+
+class TestMergeBranch(MemoryTestCase):
+    """Three-way merge of branch notes"""
+
+    def test_three_way_merge(self):
+        a, b, e = self.remember_all(["alpha note", "bravo note", "echo note"])
+
+        _git(self.path, "checkout", "-q", "-b", "feature")
+        c = memory.remember("charlie on feature", cwd=self.path)
+        memory.forget(a, cwd=self.path)
+        memory.update(b, importance="h", cwd=self.path)
+        self.assertEqual(set(self.mem()), {b, c, e})
+
+        _git(self.path, "checkout", "-q", "main")
+        d = memory.remember("delta on main", cwd=self.path)
+        memory.forget(e, cwd=self.path)
+
+        result = memory.merge_branch("feature", cwd=self.path)
+        self.assertEqual(result["conflicts"], [])
+        mem = self.mem()
+        # a forgotten on feature and e forgotten on main both stay forgotten
+        self.assertEqual(set(mem), {b, c, d})
+        self.assertEqual(mem[b]["i"], "h")
+        self.assertEqual([r["id"] for r in memory.search("charlie", cwd=self.path)["results"]], [c])
+
+        # Nothing new on the source: merging again changes nothing
+        heads = memory._notes_heads(self.path)
+        self.assertEqual(memory.merge_branch("feature", cwd=self.path)["merged"], [])
+        self.assertEqual(memory._notes_heads(self.path), heads)
+
+    def test_conflict_later_update_wins(self):
+        mid = memory.remember("shared note", cwd=self.path)
+        _git(self.path, "checkout", "-q", "-b", "feature")
+        memory.update(mid, importance="l", cwd=self.path)
+        _git(self.path, "checkout", "-q", "main")
+        memory.update(mid, importance="c", cwd=self.path)
+
+        # main's update is the later one
+        self.assertEqual(memory.merge_branch("feature", cwd=self.path)["conflicts"], [mid])
+        self.assertEqual(self.mem()[mid]["i"], "c")
+
+
+class TestCompareAndSwap(MemoryTestCase):
+    """Concurrent stores: the losing session replays its calls"""
+
+    def test_replay(self):
+        other = []
+        with memory.session(self.path) as store:
+            mine = memory.remember("written in the session", cwd=self.path)
+            # Another store (thread-local sessions) commits first
+            t = threading.Thread(target=lambda: other.append(
+                memory.remember("written by another store", cwd=self.path)))
+            t.start()
+            t.join()
+        self.assertEqual(store.replayed, [mine])
+        self.assertEqual(set(self.mem()), {mine, other[0]})
+        with memory.session(self.path):
+            self.assertEqual(set(memory._idx(self.path)["m"]), {mine, other[0]})
+            self.assertEqual(len(memory.search("written", cwd=self.path)["results"]), 2)
+
+    def test_no_replay_without_conflict(self):
+        with memory.session(self.path) as store:
+            memory.remember("alone", cwd=self.path)
+        self.assertIsNone(store.replayed)
+
+    def test_conflict_exhausted(self):
+        retries = memory.WRITE_RETRIES
+        memory.WRITE_RETRIES = 0
+        try:
+            with self.assertRaises(memory.WriteConflict):
+                with memory.session(self.path):
+                    memory.remember("loses", cwd=self.path)
+                    t = threading.Thread(target=lambda: memory.remember("wins", cwd=self.path))
+                    t.start()
+                    t.join()
+        finally:
+            memory.WRITE_RETRIES = retries
+        self.assertEqual([m["d"] for m in self.mem().values()], ["wins"])
+
+
+class TestIndexes(MemoryTestCase):
+    """search and get_topic agree with a scan over every memory"""
+
+    CONTENTS = [
+        "Postgres uses MVCC for isolation",
+        "Redis is an in-memory cache for #sessions",
+        {"topic": "Kafka.md", "note": "Kafka Streams joins topics"},
+        "The Billing Service writes to Postgres",
+        "Use \"connection pooling\" with PgBouncer",
+        {"topics": ["observability", "tracing"], "note": "OpenTelemetry spans"},
+        "Cache invalidation on Redis keys",
+        "sessions expire after an hour",
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.mids = self.remember_all(self.CONTENTS[:4], tags="db,backend")
+        self.mids += self.remember_all(self.CONTENTS[4:], tags="ops")
+        memory.forget(self.mids[6], cwd=self.path)
+
+    def test_search_matches_scan(self):
+        mem = self.mem()
+        for query in ["postgres", "cache sess", "kafka", "ops", "pool", "tracing spans", "nothing"]:
+            terms = memory._tokens(query)
+            expected = {mid for mid, entry in mem.items()
+                        if any(tok.startswith(t) for t in terms for tok in memory._doc_terms(entry))}
+            found = memory.search(query, cwd=self.path)
+            self.assertEqual({r["id"] for r in found["results"]}, expected, query)
+
+        # Persisted and transient indexes rank identically
+        queries = ["postgres redis", "cache", "db"]
+        ranked = [memory.search(q, cwd=self.path) for q in queries]
+        with memory.session(self.path):
+            idx = memory._idx(self.path)
+            idx["s"].pop("fv")
+            memory._save_idx(idx, self.path)
+        self.assertEqual([memory.search(q, cwd=self.path) for q in queries], ranked)
+
+    def test_get_topic_matches_scan(self):
+        topics = ["postgres", "redis", "kafka", "sessions", "connection pooling", "db",
+                  "observability", "service", "postgres uses mvcc for isolation", "nothing"]
+        with memory.session(self.path):
+            idx, ent, mem = memory._idx(self.path), memory._ent(self.path), memory._mem(self.path)
+            lex = memory._load("lex", self.path)
+            for topic in topics:
+                self.assertEqual(memory._topic_lookup(topic, idx, ent, lex),
+                                 memory._topic_scan(topic, idx, ent, mem), topic)
+            indexed = [memory.get_topic(t, cwd=self.path) for t in topics]
+
+        with memory.session(self.path):
+            idx = memory._idx(self.path)
+            idx["s"].pop("lv")
+            memory._save_idx(idx, self.path)
+        self.assertEqual([memory.get_topic(t, cwd=self.path) for t in topics], indexed)
+
+
+class TestEntities(MemoryTestCase):
+    """Batched extraction matches per-item extraction"""
+
+    def test_batch_matches_single(self):
+        contents = [
+            "Decided to use Postgres for the Billing Service #backend",
+            {"topic": "Redis.md", "tags": ["Cache"], "note": "hot \"key space\" here"},
+            "unclosed \"quote at the end",
+            "\"ab\" tail Caps At End",
+            "text with a NUL\x00Inside \"and \x00 a quote\"",
+            "",
+            "Kafka\x01Streams New York City",
+        ]
+        self.assertEqual(memory.extract_entities_batch(contents),
+                         [memory.extract_entities(c) for c in contents])
+        self.assertIn("key space", memory.extract_entities(contents[1]))
+        self.assertIn("and \x00 a quote", memory.extract_entities(contents[4]))
+
+
+class TestImportExport(MemoryTestCase):
+    """export_jsonl / import_jsonl / import_records"""
+
+    def test_round_trip(self):
+        self.remember_all(["Postgres uses MVCC", {"topic": "Redis", "note": "cache"}],
+                          tags="db", importance="h")
+        out = io.StringIO()
+        self.assertEqual(memory.export_jsonl(out, cwd=self.path), 2)
+        exported = self.mem()
+
+        self.path = self.new_repo()
+        result = memory.import_jsonl(out.getvalue().splitlines(), cwd=self.path)
+        self.assertEqual(result, {"imported": 2, "errors": 0})
+        self.assertEqual(self.mem(), exported)
+        self.assertEqual(len(memory.search("mvcc", cwd=self.path)["results"]), 1)
+        self.assertEqual(len(memory.get_topic("redis", cwd=self.path)["mem"]), 1)
+
+    def test_import_arbitrary_json(self):
+        lines = ['"Kafka streams events"', '{"topic": "Postgres"}', "[1, 2]", "", "not json"]
+        result = memory.import_jsonl(lines, cwd=self.path)
+        self.assertEqual(result, {"imported": 3, "errors": 1})
+        mem = self.mem()
+        self.assertEqual(sorted(json.dumps(e["d"]) for e in mem.values()),
+                         sorted(json.dumps(json.loads(l)) for l in lines[:3]))
+        for entry in mem.values():
+            self.assertEqual((entry["g"], entry["i"], entry["a"]), ([], "n", 0))
+        self.assertIn("postgres", mem[memory._id({"topic": "Postgres"})]["e"])
+
+    def test_import_writes_once(self):
+        memory.remember("existing", cwd=self.path)
+        before = {ref: int(_git(self.path, "rev-list", "--count", ref))
+                  for ref in memory._notes_heads(self.path)}
+        batch = memory.IMPORT_BATCH
+        memory.IMPORT_BATCH = 2
+        try:
+            memory.import_records([f"record {i}" for i in range(5)], cwd=self.path)
+        finally:
+            memory.IMPORT_BATCH = batch
+        # Three batches, one commit per notes ref
+        for ref, count in before.items():
+            self.assertLessEqual(int(_git(self.path, "rev-list", "--count", ref)), count + 1, ref)
+        mem_ref = "refs/notes/mem-main"
+        self.assertEqual(int(_git(self.path, "rev-list", "--count", mem_ref)), before[mem_ref] + 1)
+        self.assertEqual(len(self.mem()), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
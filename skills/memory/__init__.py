@@ -5,7 +5,10 @@ OpenClaw 分層記憶系統 - 統一入口
 """
 
 from .core_memory import CoreMemory, load_core_memory, get_core_memory_context
-from .recall_memory import RecallMemory, Message, ConversationSummary, create_recall_memory
+from .recall_memory import (
+    RecallMemory, Message, ConversationSummary, WriteBuffer,
+    Tokenizer, EstimateTokenizer, TiktokenTokenizer, create_recall_memory
+)
 from .archival_memory import ArchivalMemory, MemoryEntry, create_archival_memory
 from .auto_summarize import AutoSummarizer, SummaryConfig, summarize_conversation
 from .memory_manager import MemoryManager, MemoryContext, create_memory_manager
@@ -21,6 +24,10 @@ __all__ = [
     'RecallMemory',
     'Message',
     'ConversationSummary',
+    'WriteBuffer',
+    'Tokenizer',
+    'EstimateTokenizer',
+    'TiktokenTokenizer',
     'create_recall_memory',
     
     # Archival
@@ -8,11 +8,17 @@ Archival Memory Module - 存檔記憶（向量數據庫）
 """
 
 import json
+import os
+import uuid
 import hashlib
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from functools import lru_cache
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Any, Union
-from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Any, Union, Tuple, Iterable
+from dataclasses import dataclass, asdict, replace
 import numpy as np
 
 # 可選依賴處理
@@ -23,6 +29,12 @@ try:
 except ImportError:
     HAS_LANCEDB = False
 
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
 try:
     import openai
     HAS_OPENAI = True
@@ -62,29 +74,543 @@ class MemoryEntry:
 
 
 class SimpleEmbedding:
-    """簡單嵌入實現（當沒有外部嵌入服務時使用）"""
+    """
+    簡單嵌入實現（當沒有外部嵌入服務時使用）
+    
+    Hashing trick：每個詞哈希出 FEATURES 個（維度, ±1）特徵，分散到全部 dim 維，
+    不同詞的向量近似正交。詞特徵經 LRU 快取；embed_batch 把整批文本的
+    詞頻當作稀疏矩陣（COO），一次 bincount 投影到 dim 維。
+    """
+    
+    # 每個詞佔用的維度數
+    FEATURES = 8
     
-    def __init__(self, dim: int = 384):
+    def __init__(self, dim: int = 384, cache_size: int = 65536):
         self.dim = dim
+        self._token_features = lru_cache(maxsize=cache_size)(self._hash_token)
+    
+    def _hash_token(self, token: str) -> Tuple[np.ndarray, np.ndarray]:
+        """詞 → (維度數組, 符號數組)"""
+        digest = hashlib.blake2b(token.encode(), digest_size=4 * self.FEATURES).digest()
+        h = np.frombuffer(digest, dtype=np.uint32)
+        return (h >> 1) % self.dim, np.where(h & 1, 1.0, -1.0)
     
     def embed(self, text: str) -> List[float]:
-        """生成簡單嵌入向量"""
-        words = text.lower().split()
-        vector = [0.0] * self.dim
+        """生成簡單嵌入向量（已歸一化）"""
+        return self.embed_batch([text])[0].tolist()
+    
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        """批量生成嵌入，返回 (len(texts), dim) 的 float32 矩陣，每行已歸一化"""
+        vocab: Dict[str, int] = {}
+        rows, cols, counts = [], [], []
+        for row, text in enumerate(texts):
+            for token, count in Counter(text.lower().split()).items():
+                rows.append(row)
+                cols.append(vocab.setdefault(token, len(vocab)))
+                counts.append(count)
+        
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        if not vocab:
+            return out
         
-        for word in words:
-            h = hashlib.md5(word.encode()).hexdigest()
-            for i in range(min(self.dim, len(h))):
-                idx = i % self.dim
-                val = int(h[i], 16) / 15.0
-                vector[idx] += val
+        features = [self._token_features(token) for token in vocab]
+        dims = np.stack([f[0] for f in features])    # (詞數, FEATURES)
+        signs = np.stack([f[1] for f in features])
+        cols = np.asarray(cols)
+        flat = (np.asarray(rows)[:, None] * self.dim + dims[cols]).ravel()
+        weights = (np.asarray(counts, dtype=np.float64)[:, None] * signs[cols]).ravel()
+        out[:] = np.bincount(flat, weights=weights, minlength=out.size).reshape(out.shape)
         
         # 歸一化
-        norm = sum(x ** 2 for x in vector) ** 0.5
-        if norm > 0:
-            vector = [x / norm for x in vector]
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        np.divide(out, norms, out=out, where=norms > 0)
+        return out
+
+
+class VectorIndex:
+    """
+    內存向量索引
+    
+    向量存放在連續的 float32 矩陣中，與 id 數組逐行對應；
+    memory_type / source 編碼為整數存成平行數組，過濾時直接生成掩碼。
+    插入寫入預留容量（不足時翻倍），刪除只打墓碑，墓碑多於存活行時才壓縮。
+    搜索是一次矩陣向量乘法加 argpartition 取 top-k。
+    entries 保存條目元數據（不含向量）。
+    """
+    
+    # 墓碑少於此數時不壓縮，避免小索引頻繁重排
+    MIN_COMPACT = 1024
+    
+    # 按行對應的數組（壓縮與擴容時一起處理）
+    _COLUMNS = ('_vectors', '_alive', '_types', '_sources')
+    
+    def __init__(self, dim: int, capacity: int = 1024):
+        self.dim = dim
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._types = np.zeros(capacity, dtype=np.int32)
+        self._sources = np.zeros(capacity, dtype=np.int32)
+        self._ids: List[Optional[str]] = []
+        self._rows: Dict[str, int] = {}
+        self._labels: Dict[str, int] = {}
+        self._dead = 0
+        self.entries: Dict[str, MemoryEntry] = {}
+    
+    def __len__(self) -> int:
+        return len(self._rows)
+    
+    def __contains__(self, memory_id: str) -> bool:
+        return memory_id in self._rows
+    
+    def refresh(self):
+        """與存儲同步（內存索引無需同步）"""
+    
+    def _label(self, value: str) -> int:
+        return self._labels.setdefault(value, len(self._labels))
+    
+    def _grow(self, size: int):
+        capacity = max(size, 2 * len(self._alive))
+        for name in self._COLUMNS:
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(self._ids)] = old[:len(self._ids)]
+            setattr(self, name, new)
+    
+    def _append(
+        self,
+        memory_id: str,
+        memory_type: str,
+        source: str,
+        entry: Optional[MemoryEntry]
+    ) -> int:
+        """登記一行並返回行號；同 id 的舊行打上墓碑"""
+        self._tombstone(memory_id)
+        row = len(self._ids)
+        if row >= len(self._alive):
+            self._grow(row + 1)
+        self._alive[row] = True
+        self._types[row] = self._label(memory_type)
+        self._sources[row] = self._label(source)
+        self._ids.append(memory_id)
+        self._rows[memory_id] = row
+        if entry is not None:
+            self.entries[memory_id] = entry
+        return row
+    
+    def _tombstone(self, memory_id: str) -> bool:
+        row = self._rows.pop(memory_id, None)
+        if row is None:
+            return False
+        self._alive[row] = False
+        self._ids[row] = None
+        self._dead += 1
+        self.entries.pop(memory_id, None)
+        return True
+    
+    def _needs_compact(self) -> bool:
+        return self._dead >= self.MIN_COMPACT and self._dead > len(self._rows)
+    
+    def add(
+        self,
+        memory_id: str,
+        vector: List[float],
+        memory_type: str = "",
+        source: str = "",
+        entry: Optional[MemoryEntry] = None
+    ):
+        """追加一行"""
+        row = self._append(memory_id, memory_type, source, entry)
+        self._vectors[row] = vector
+    
+    def add_many(self, entries: List[MemoryEntry], vectors: np.ndarray):
+        """按順序追加多行（id / memory_type / source 取自條目）"""
+        for entry, vector in zip(entries, vectors):
+            self.add(entry.id, vector, entry.memory_type, entry.source, entry)
+    
+    def remove(self, memory_id: str) -> bool:
+        if not self._tombstone(memory_id):
+            return False
+        if self._needs_compact():
+            self._compact()
+        return True
+    
+    def _compact(self):
+        """丟棄墓碑行，存活行按原順序前移"""
+        n = len(self._ids)
+        keep = np.flatnonzero(self._alive[:n])
+        for name in self._COLUMNS:
+            arr = getattr(self, name)
+            arr[:len(keep)] = arr[keep]
+            arr[len(keep):n] = 0
+        self._ids = [self._ids[i] for i in keep]
+        self._rows = {memory_id: row for row, memory_id in enumerate(self._ids)}
+        self._dead = 0
+    
+    def get(self, memory_id: str) -> Optional[np.ndarray]:
+        row = self._rows.get(memory_id)
+        return None if row is None else np.array(self._vectors[row])
+    
+    def search(
+        self,
+        query: List[float],
+        limit: int = 5,
+        memory_type: Optional[str] = None,
+        source: Optional[str] = None
+    ) -> List[Tuple[str, float]]:
+        """返回 (id, 內積分數)，分數從高到低；同分按插入順序"""
+        n = len(self._ids)
+        if n == 0 or limit <= 0:
+            return []
+        
+        mask = self._alive[:n].copy()
+        for value, codes in ((memory_type, self._types), (source, self._sources)):
+            if value:
+                if value not in self._labels:
+                    return []
+                mask &= codes[:n] == self._labels[value]
+        
+        candidates = np.flatnonzero(mask)
+        if len(candidates) == 0:
+            return []
+        if len(candidates) == n:
+            scores = self._vectors[:n] @ np.asarray(query, dtype=np.float32)
+        else:
+            scores = self._vectors[candidates] @ np.asarray(query, dtype=np.float32)
+        
+        return [(self._ids[candidates[i]], float(scores[i])) for i in _top_k(scores, limit)]
+    
+    def get_entry(self, memory_id: str) -> Optional[MemoryEntry]:
+        return self.entries.get(memory_id)
+    
+    def search_entries(
+        self,
+        query: List[float],
+        limit: int = 5,
+        memory_type: Optional[str] = None,
+        source: Optional[str] = None
+    ) -> List[Tuple[MemoryEntry, float]]:
+        """同 search，返回條目而非 id"""
+        return [(self.entries[i], score) for i, score in self.search(query, limit, memory_type, source)]
+
+
+def _top_k(scores: np.ndarray, limit: int) -> np.ndarray:
+    """分數最高的 limit 個位置，從高到低；同分時位置靠前的優先"""
+    k = min(limit, len(scores))
+    if k < len(scores):
+        # 第 k 名的分數；與它同分的位置全部留下，再按 (分數, 位置) 排序
+        boundary = np.partition(-scores, k - 1)[k - 1]
+        top = np.flatnonzero(-scores <= boundary)
+    else:
+        top = np.arange(len(scores))
+    return top[np.lexsort((top, -scores[top]))][:k]
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'little')
+
+
+class MappedVectorIndex:
+    """
+    檔案持久化的向量索引（LanceDB 不可用時的默認後備），接口同 VectorIndex
+    
+    - <name>.meta：當前世代（壓縮時原子替換，即提交點）
+    - <name>.<gen>.vec：float32 向量按行追加
+    - <name>.<gen>.rows：定長行表（id / memory_type / source 的哈希、
+      記錄偏移與長度、存活標記），與向量逐行對應
+    - <name>.<gen>.dat：條目記錄（JSON），只在命中 top-k 或按 id 讀取時讀
+    
+    .vec 與 .rows 經 mmap 映射，多個進程共享頁緩存；打開與同步只讀 .meta
+    與檔案大小，不為每個條目建 Python 對象。寫入先寫向量與記錄，最後追加行表；
+    刪除在行表裡清除存活標記。墓碑多於存活行時把存活行寫成新世代再替換 .meta，
+    其他進程發現世代改變後重新映射。寫入與壓縮以 <name>.lock 上的 flock 串行化。
+    """
+    
+    ROW = np.dtype([
+        ('key', '<u8'), ('type', '<u8'), ('source', '<u8'),
+        ('offset', '<u8'), ('length', '<u4'), ('alive', 'u1')
+    ])
+    
+    # 墓碑少於此數時不壓縮
+    MIN_COMPACT = 1024
+    
+    # 壓縮時每次複製的行數
+    COPY_ROWS = 65536
+    
+    def __init__(self, path: Union[str, Path], dim: int):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.dim = dim
+        self.meta_path = path.with_name(f"{path.name}.meta")
+        self.lock_path = path.with_name(f"{path.name}.lock")
+        self._mutex = threading.Lock()
+        self._lock_file = None
+        self._meta_stat = None
+        self._gen: Optional[str] = None
+        self._dat = None
+        self._unmap()
+    
+    def _unmap(self):
+        self._n = 0
+        self._rows = np.zeros(0, dtype=self.ROW)
+        self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+    
+    def _file(self, suffix: str, gen: Optional[str] = None) -> Path:
+        return self.path.with_name(f"{self.path.name}.{gen or self._gen}.{suffix}")
+    
+    @contextmanager
+    def _locked(self, exclusive: bool):
+        with self._mutex:
+            if HAS_FCNTL:
+                if self._lock_file is None:
+                    self._lock_file = open(self.lock_path, 'a+b')
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if HAS_FCNTL:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+    
+    def refresh(self):
+        """映射其他進程新寫入的行；世代改變時換到新檔案"""
+        with self._locked(exclusive=False):
+            self._sync()
+    
+    def _sync(self):
+        """按 .meta 與行表大小更新映射（需持有鎖）"""
+        try:
+            stat = os.stat(self.meta_path)
+        except FileNotFoundError:
+            return
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if key != self._meta_stat:
+            gen = json.loads(self.meta_path.read_text())['gen']
+            self._meta_stat = key
+            if gen != self._gen:
+                self.close_files()
+                self._gen = gen
+        
+        n = os.stat(self._file('rows')).st_size // self.ROW.itemsize
+        if n != self._n:
+            if n == 0:
+                self._unmap()
+                return
+            self._rows = np.memmap(self._file('rows'), dtype=self.ROW, mode='r', shape=(n,))
+            self._vectors = np.memmap(self._file('vec'), dtype=np.float32, mode='r', shape=(n, self.dim))
+            self._n = n
+    
+    def _create(self):
+        """第一次寫入時建立空的世代（需持有排他鎖）"""
+        gen = uuid.uuid4().hex[:8]
+        for suffix in ('vec', 'rows', 'dat'):
+            self._file(suffix, gen).touch()
+        self._commit(gen)
+    
+    def _commit(self, gen: str):
+        tmp = self.meta_path.with_name(f"{self.meta_path.name}.tmp")
+        tmp.write_text(json.dumps({'gen': gen, 'dim': self.dim}))
+        os.replace(tmp, self.meta_path)
+        self._sync()
+    
+    def _dat_fd(self) -> int:
+        if self._dat is None:
+            self._dat = os.open(self._file('dat'), os.O_RDONLY)
+        return self._dat
+    
+    def _read_record(self, row: int) -> Dict[str, Any]:
+        """從 .dat 讀取一行的條目記錄"""
+        r = self._rows[row]
+        return json.loads(os.pread(self._dat_fd(), int(r['length']), int(r['offset'])))
+    
+    def _entry(self, row: int) -> MemoryEntry:
+        return MemoryEntry(**self._read_record(row))
+    
+    def _find(self, memory_ids: Iterable[str]) -> Dict[str, int]:
+        """存活行中各 id 的行號（比對哈希後再讀記錄確認）"""
+        wanted = {_hash64(i): i for i in memory_ids}
+        if not wanted or self._n == 0:
+            return {}
+        keys = self._rows['key']
+        hits = np.flatnonzero(np.isin(keys, list(wanted)) & (self._rows['alive'] == 1))
+        found = {}
+        for row in hits:
+            memory_id = wanted.get(int(keys[row]))
+            if memory_id is not None and self._read_record(row)['id'] == memory_id:
+                found[memory_id] = int(row)
+        return found
+    
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self._rows['alive']))
+    
+    def __contains__(self, memory_id: str) -> bool:
+        return bool(self._find([memory_id]))
+    
+    def get(self, memory_id: str) -> Optional[np.ndarray]:
+        row = self._find([memory_id]).get(memory_id)
+        return None if row is None else np.array(self._vectors[row])
+    
+    def get_entry(self, memory_id: str) -> Optional[MemoryEntry]:
+        row = self._find([memory_id]).get(memory_id)
+        return None if row is None else self._entry(row)
+    
+    def search(
+        self,
+        query: List[float],
+        limit: int = 5,
+        memory_type: Optional[str] = None,
+        source: Optional[str] = None
+    ) -> List[Tuple[str, float]]:
+        """返回 (id, 內積分數)，分數從高到低"""
+        return [(entry.id, score) for entry, score in self.search_entries(query, limit, memory_type, source)]
+    
+    def search_entries(
+        self,
+        query: List[float],
+        limit: int = 5,
+        memory_type: Optional[str] = None,
+        source: Optional[str] = None
+    ) -> List[Tuple[MemoryEntry, float]]:
+        """同 search，只讀取命中行的條目記錄"""
+        if self._n == 0 or limit <= 0:
+            return []
+        mask = self._rows['alive'] == 1
+        if memory_type:
+            mask &= self._rows['type'] == _hash64(memory_type)
+        if source:
+            mask &= self._rows['source'] == _hash64(source)
+        candidates = np.flatnonzero(mask)
+        if len(candidates) == 0:
+            return []
         
-        return vector
+        scores = self._vectors[candidates] @ np.asarray(query, dtype=np.float32)
+        results = []
+        for i in _top_k(scores, limit):
+            entry = self._entry(candidates[i])
+            # 哈希碰撞的行不算命中
+            if (memory_type and entry.memory_type != memory_type) or (source and entry.source != source):
+                continue
+            results.append((entry, float(scores[i])))
+        return results
+    
+    @staticmethod
+    def _record(entry: MemoryEntry) -> Dict[str, Any]:
+        return {
+            'id': entry.id,
+            'content': entry.content,
+            'source': entry.source,
+            'memory_type': entry.memory_type,
+            'created_at': entry.created_at,
+            'updated_at': entry.updated_at,
+            'metadata': entry.metadata
+        }
+    
+    def _set_dead(self, rows: Iterable[int]):
+        """清除存活標記（需持有排他鎖）；映射共享頁緩存，其他進程立即可見"""
+        alive_at = self.ROW.fields['alive'][1]
+        with open(self._file('rows'), 'r+b') as f:
+            for row in rows:
+                f.seek(row * self.ROW.itemsize + alive_at)
+                f.write(b'\x00')
+    
+    def add(
+        self,
+        memory_id: str,
+        vector: List[float],
+        memory_type: str = "",
+        source: str = "",
+        entry: Optional[MemoryEntry] = None
+    ):
+        """追加一行；同 id 的舊行打上墓碑"""
+        if entry is None:
+            entry = MemoryEntry(id=memory_id, content="", source=source, memory_type=memory_type)
+        self.add_many([entry], [vector])
+    
+    def add_many(self, entries: List[MemoryEntry], vectors: np.ndarray):
+        """一次加鎖：向量、記錄、行表各寫一次"""
+        if not entries:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(entries), self.dim)
+        with self._locked(exclusive=True):
+            self._sync()
+            if self._gen is None:
+                self._create()
+            self._set_dead(self._find(e.id for e in entries).values())
+            
+            row = self._n
+            with open(self._file('vec'), 'r+b') as f:
+                f.seek(row * self.dim * 4)
+                f.write(vectors.tobytes())
+            
+            table = np.zeros(len(entries), dtype=self.ROW)
+            with open(self._file('dat'), 'ab') as f:
+                offset = f.tell()
+                for i, entry in enumerate(entries):
+                    data = (json.dumps(self._record(entry), ensure_ascii=False) + "\n").encode('utf-8')
+                    f.write(data)
+                    table[i] = (_hash64(entry.id), _hash64(entry.memory_type), _hash64(entry.source),
+                                offset, len(data), 1)
+                    offset += len(data)
+            
+            # 行表最後寫入：寫到一半中斷的行不計入（下次從 row 處覆蓋）
+            with open(self._file('rows'), 'r+b') as f:
+                f.seek(row * self.ROW.itemsize)
+                f.write(table.tobytes())
+                f.truncate()
+            self._sync()
+    
+    def remove(self, memory_id: str) -> bool:
+        with self._locked(exclusive=True):
+            self._sync()
+            row = self._find([memory_id]).get(memory_id)
+            if row is None:
+                return False
+            self._set_dead([row])
+            dead = self._n - len(self)
+            if dead >= self.MIN_COMPACT and dead > len(self):
+                self._rewrite()
+        return True
+    
+    def compact(self):
+        """立即重寫存儲，丟棄所有墓碑行"""
+        with self._locked(exclusive=True):
+            self._sync()
+            if self._n > len(self):
+                self._rewrite()
+    
+    def _rewrite(self):
+        """存活行寫成新世代，再替換 .meta（需持有排他鎖）"""
+        old = self._gen
+        gen = uuid.uuid4().hex[:8]
+        keep = np.flatnonzero(self._rows['alive'] == 1)
+        table = np.array(self._rows[keep])
+        offset = 0
+        with open(self._file('vec', gen), 'wb') as vec, open(self._file('dat', gen), 'wb') as dat:
+            for start in range(0, len(keep), self.COPY_ROWS):
+                chunk = keep[start:start + self.COPY_ROWS]
+                vec.write(np.ascontiguousarray(self._vectors[chunk]).tobytes())
+                for i in range(start, start + len(chunk)):
+                    length = int(table[i]['length'])
+                    dat.write(os.pread(self._dat_fd(), length, int(table[i]['offset'])))
+                    table[i]['offset'] = offset
+                    offset += length
+        self._file('rows', gen).write_bytes(table.tobytes())
+        self._commit(gen)
+        # 其他進程已映射或打開的舊檔案仍可讀到關閉為止
+        for suffix in ('vec', 'rows', 'dat'):
+            self._file(suffix, old).unlink(missing_ok=True)
+    
+    def close_files(self):
+        if self._dat is not None:
+            os.close(self._dat)
+            self._dat = None
+        self._unmap()
+    
+    def close(self):
+        self.close_files()
+        self._gen = self._meta_stat = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
 
 
 class ArchivalMemory:
@@ -97,7 +623,11 @@ class ArchivalMemory:
     - 混合檢索（向量 + 關鍵詞）
     - 支持多種記憶類型
     
-    存儲：LanceDB（多模態向量數據庫）
+    存儲：LanceDB（多模態向量數據庫）；未安裝時回退到 db_path 目錄下的
+    mmap 向量檔案與行表（persist_fallback=False 時只存內存）
+    
+    LanceDB 表超過 index_threshold 行後自動建立 IVF-PQ 索引，未索引的新行
+    超過 index_refresh_ratio 時重建；nprobes / refine_factor 用於權衡召回與延遲。
     """
     
     def __init__(
@@ -105,7 +635,12 @@ class ArchivalMemory:
         db_path: Optional[str] = None,
         table_name: str = "archival_memory",
         embedding_dim: int = 384,
-        embedding_provider: str = "simple"
+        embedding_provider: str = "simple",
+        persist_fallback: bool = True,
+        index_threshold: int = 100_000,
+        index_refresh_ratio: float = 0.2,
+        nprobes: int = 20,
+        refine_factor: Optional[int] = None
     ):
         self.db_path = Path(db_path or "~/.openclaw/memory/archival.lance").expanduser()
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
@@ -113,6 +648,15 @@ class ArchivalMemory:
         self.table_name = table_name
         self.embedding_dim = embedding_dim
         self.embedding_provider = embedding_provider
+        self.persist_fallback = persist_fallback
+        
+        # ANN 索引（只用於 LanceDB）；index_threshold=0 關閉自動建索引
+        self.index_threshold = index_threshold
+        self.index_refresh_ratio = index_refresh_ratio
+        self.nprobes = nprobes
+        self.refine_factor = refine_factor
+        # 再寫入多少行才需要重新檢查索引狀態，避免每次 add 都查表
+        self._rows_until_check = 0
         
         self._db = None
         self._table = None
@@ -138,17 +682,29 @@ class ArchivalMemory:
         
         return [0.0] * self.embedding_dim
     
+    def _get_embeddings(self, texts: List[str]) -> np.ndarray:
+        """批量獲取文本嵌入，返回 (len(texts), dim) 的 float32 矩陣"""
+        if isinstance(self._embedder, SimpleEmbedding):
+            return self._embedder.embed_batch(texts)
+        return np.array([self._get_embedding(t) for t in texts], dtype=np.float32).reshape(
+            len(texts), self.embedding_dim
+        )
+    
     def _init_db(self):
         """初始化 LanceDB"""
         if not HAS_LANCEDB:
-            print("Warning: LanceDB not available, using in-memory fallback")
-            self._entries: Dict[str, MemoryEntry] = {}
+            if self.persist_fallback:
+                print(f"Warning: LanceDB not available, using file fallback in {self.db_path}")
+                self._index = MappedVectorIndex(self.db_path / self.table_name, self.embedding_dim)
+            else:
+                print("Warning: LanceDB not available, using in-memory fallback")
+                self._index = VectorIndex(self.embedding_dim)
             return
         
         self._db = lancedb.connect(str(self.db_path))
         
         # 定義 schema
-        schema = pa.schema([
+        self._schema = pa.schema([
             pa.field("id", pa.string()),
             pa.field("content", pa.string()),
             pa.field("vector", pa.list_(pa.float32(), self.embedding_dim)),
@@ -162,7 +718,7 @@ class ArchivalMemory:
         if self.table_name in self._db.table_names():
             self._table = self._db.open_table(self.table_name)
         else:
-            self._table = self._db.create_table(self.table_name, schema=schema)
+            self._table = self._db.create_table(self.table_name, schema=self._schema)
     
     def insert(
         self,
@@ -172,7 +728,8 @@ class ArchivalMemory:
         metadata: Optional[Dict] = None,
         memory_id: Optional[str] = None
     ) -> str:
-        """插入記憶條目"""
+        """插入記憶條目（指定 memory_id 時替換同 id 的條目）"""
+        replace_ids = {memory_id} if memory_id is not None else None
         if memory_id is None:
             memory_id = hashlib.md5(
                 f"{content}:{datetime.utcnow().isoformat()}".encode()
@@ -189,70 +746,233 @@ class ArchivalMemory:
             metadata=metadata
         )
         
+        self._add_entries([entry], np.asarray([embedding], dtype=np.float32), replace_ids)
+        return memory_id
+    
+    def insert_many(self, items: Iterable[Dict[str, Any]]) -> List[str]:
+        """
+        批量插入記憶條目
+        
+        Args:
+            items: 每項為 dict，鍵同 insert 的參數（content 必填）
+        
+        Returns:
+            與 items 一一對應的 id。未指定 memory_id 時 id 為
+            (memory_type, source, content) 的哈希，完全相同的條目（批內或已存在）
+            只存一次並返回已有的 id；指定 memory_id 時與 insert 一樣替換同 id 的條目
+        """
+        items = list(items)
+        ids = []
+        explicit = set()
+        for item in items:
+            memory_id = item.get('memory_id')
+            if memory_id:
+                explicit.add(memory_id)
+            else:
+                memory_id = self._content_id(
+                    item.get('memory_type', "fact"), item.get('source', ""), item['content']
+                )
+            ids.append(memory_id)
+        
+        # 只有內容哈希的 id 按已存在跳過；同一 id 在批內出現多次時以最後一次為準
+        existing = self._existing_ids(set(ids) - explicit)
+        entries: Dict[str, MemoryEntry] = {}
+        for memory_id, item in zip(ids, items):
+            if memory_id in existing:
+                continue
+            entries[memory_id] = MemoryEntry(
+                id=memory_id,
+                content=item['content'],
+                source=item.get('source', ""),
+                memory_type=item.get('memory_type', "fact"),
+                metadata=item.get('metadata')
+            )
+        
+        if entries:
+            entries = list(entries.values())
+            self._add_entries(
+                entries,
+                self._get_embeddings([e.content for e in entries]),
+                replace_ids=explicit
+            )
+        return ids
+    
+    @staticmethod
+    def _content_id(memory_type: str, source: str, content: str) -> str:
+        key = json.dumps([memory_type, source, content], ensure_ascii=False)
+        return hashlib.md5(key.encode()).hexdigest()[:16]
+    
+    def _existing_ids(self, ids: set) -> set:
+        """返回已存在於存儲中的 id"""
+        if not ids:
+            return set()
+        if HAS_LANCEDB and self._table is not None:
+            quoted = ", ".join(self._sql_quote(i) for i in ids)
+            found = (
+                self._table.search()
+                .where(f"id IN ({quoted})")
+                .select(["id"])
+                .limit(len(ids))
+                .to_arrow()
+            )
+            return set(found.column("id").to_pylist())
+        
+        self._index.refresh()
+        return {i for i in ids if i in self._index}
+    
+    def _add_entries(
+        self,
+        entries: List[MemoryEntry],
+        vectors: np.ndarray,
+        replace_ids: Optional[set] = None
+    ):
+        """
+        寫入條目：LanceDB 組一個 Arrow 批次只 add 一次，避免產生大量小數據檔案
+        
+        replace_ids 中已存在的 id 先刪除舊行（後備索引寫入同 id 時本來就會替換）
+        """
         if HAS_LANCEDB and self._table is not None:
-            import pandas as pd
-            df = pd.DataFrame([{
-                'id': entry.id,
-                'content': entry.content,
-                'vector': entry.embedding,
-                'source': entry.source,
-                'memory_type': entry.memory_type,
-                'created_at': entry.created_at,
-                'updated_at': entry.updated_at,
-                'metadata': json.dumps(entry.metadata) if entry.metadata else None
-            }])
-            self._table.add(df)
+            replaced = self._existing_ids(replace_ids or set())
+            if replaced:
+                quoted = ", ".join(self._sql_quote(i) for i in replaced)
+                self._table.delete(f"id IN ({quoted})")
+            batch = pa.RecordBatch.from_arrays([
+                pa.array([e.id for e in entries], pa.string()),
+                pa.array([e.content for e in entries], pa.string()),
+                pa.FixedSizeListArray.from_arrays(
+                    pa.array(vectors.ravel(), pa.float32()), self.embedding_dim
+                ),
+                pa.array([e.source for e in entries], pa.string()),
+                pa.array([e.memory_type for e in entries], pa.string()),
+                pa.array([e.created_at for e in entries], pa.string()),
+                pa.array([e.updated_at for e in entries], pa.string()),
+                pa.array([json.dumps(e.metadata) if e.metadata else None for e in entries], pa.string())
+            ], schema=self._schema)
+            self._table.add(pa.Table.from_batches([batch]))
+            self._maybe_index(len(entries))
         else:
-            self._entries[memory_id] = entry
+            # 條目只存元數據，向量統一放在索引裡
+            self._index.add_many([replace(e, embedding=None) for e in entries], vectors)
+    
+    @staticmethod
+    def _sql_quote(value: str) -> str:
+        return "'" + value.replace("'", "''") + "'"
+    
+    def _maybe_index(self, added: int):
+        """
+        表超過閾值且沒有索引、或未索引的行太多時（重新）建立 ANN 索引
         
-        return memory_id
+        只有新增行數可能越過閾值或重建比例時才查詢表狀態；
+        其他進程的寫入在下一次檢查時一併計入。
+        """
+        if not self.index_threshold:
+            return
+        self._rows_until_check -= added
+        if self._rows_until_check > 0:
+            return
+        try:
+            count = self._table.count_rows()
+            if count < self.index_threshold:
+                self._rows_until_check = self.index_threshold - count
+                return
+            allowed = count * self.index_refresh_ratio
+            unindexed = self._unindexed_rows()
+            if unindexed is None or unindexed > allowed:
+                self.create_index()
+                unindexed = 0
+            self._rows_until_check = max(1, int(allowed - unindexed) + 1)
+        except Exception as e:
+            # 索引只影響速度，寫入本身已經成功
+            self._rows_until_check = max(1, int(self.index_threshold * self.index_refresh_ratio))
+            print(f"Error maintaining ANN index: {e}")
+    
+    def _unindexed_rows(self) -> Optional[int]:
+        """向量列索引未覆蓋的行數；沒有索引時返回 None"""
+        for index in self._table.list_indices():
+            if "vector" in index.columns:
+                return self._table.index_stats(index.name).num_unindexed_rows
+        return None
+    
+    def create_index(
+        self,
+        num_partitions: Optional[int] = None,
+        num_sub_vectors: Optional[int] = None
+    ):
+        """
+        建立（或替換）向量列的 IVF-PQ 索引
+        
+        Args:
+            num_partitions: IVF 分區數，默認約 sqrt(行數)
+            num_sub_vectors: PQ 子向量數（須整除維度），默認約 dim / 16
+        """
+        if not (HAS_LANCEDB and self._table is not None):
+            return
+        count = self._table.count_rows()
+        if num_sub_vectors is None:
+            num_sub_vectors = next(
+                d for d in range(max(1, self.embedding_dim // 16), 0, -1)
+                if self.embedding_dim % d == 0
+            )
+        self._table.create_index(
+            metric="L2",
+            num_partitions=num_partitions or max(1, int(count ** 0.5)),
+            num_sub_vectors=num_sub_vectors,
+            vector_column_name="vector",
+            replace=True
+        )
     
     def search(
         self,
         query: str,
         limit: int = 5,
         memory_type: Optional[str] = None,
-        source: Optional[str] = None
+        source: Optional[str] = None,
+        nprobes: Optional[int] = None,
+        refine_factor: Optional[int] = None
     ) -> List[Dict[str, Any]]:
-        """向量搜索記憶"""
+        """
+        向量搜索記憶
+        
+        過濾條件在向量搜索前套用（prefilter），有過濾時仍返回最多 limit 條。
+        nprobes / refine_factor 覆蓋實例設定，只在 LanceDB 建有索引時生效：
+        nprobes 越大召回越高、越慢；refine_factor 讀取 limit 倍數的候選用原始向量重排。
+        """
         query_embedding = self._get_embedding(query)
         
         if HAS_LANCEDB and self._table is not None:
-            results = self._table.search(query_embedding).limit(limit * 2)
-            df = results.to_pandas()
+            builder = self._table.search(query_embedding).nprobes(nprobes or self.nprobes)
+            refine_factor = refine_factor or self.refine_factor
+            if refine_factor:
+                builder = builder.refine_factor(refine_factor)
             
+            conditions = []
             if memory_type:
-                df = df[df['memory_type'] == memory_type]
+                conditions.append(f"memory_type = {self._sql_quote(memory_type)}")
             if source:
-                df = df[df['source'] == source]
+                conditions.append(f"source = {self._sql_quote(source)}")
+            if conditions:
+                builder = builder.where(" AND ".join(conditions), prefilter=True)
             
-            df = df.head(limit)
+            table = builder.select(
+                ['id', 'content', 'memory_type', 'source', 'metadata', 'created_at']
+            ).limit(limit).to_arrow()
+            columns = table.to_pydict()
             
             return [
                 {
-                    'id': row['id'],
-                    'content': row['content'],
-                    'score': float(row.get('_distance', 0)),
-                    'memory_type': row['memory_type'],
-                    'source': row['source'],
-                    'metadata': json.loads(row['metadata']) if row.get('metadata') else None,
-                    'created_at': row['created_at']
+                    'id': columns['id'][i],
+                    'content': columns['content'][i],
+                    'score': float(columns['_distance'][i]),
+                    'memory_type': columns['memory_type'][i],
+                    'source': columns['source'][i],
+                    'metadata': json.loads(columns['metadata'][i]) if columns['metadata'][i] else None,
+                    'created_at': columns['created_at'][i]
                 }
-                for _, row in df.iterrows()
+                for i in range(table.num_rows)
             ]
         else:
-            results = []
-            for entry in self._entries.values():
-                if memory_type and entry.memory_type != memory_type:
-                    continue
-                if source and entry.source != source:
-                    continue
-                
-                if entry.embedding:
-                    dot = sum(a * b for a, b in zip(query_embedding, entry.embedding))
-                    results.append((entry, dot))
-            
-            results.sort(key=lambda x: x[1], reverse=True)
+            self._index.refresh()
+            results = self._index.search_entries(query_embedding, limit, memory_type, source)
             
             return [
                 {
@@ -264,15 +984,15 @@ class ArchivalMemory:
                     'metadata': entry.metadata,
                     'created_at': entry.created_at
                 }
-                for entry, score in results[:limit]
+                for entry, score in results
             ]
     
     def get_by_id(self, memory_id: str) -> Optional[MemoryEntry]:
         """根據 ID 獲取記憶"""
         if HAS_LANCEDB and self._table is not None:
-            results = self._table.search().where(f"id = '{memory_id}'").limit(1).to_pandas()
-            if len(results) > 0:
-                row = results.iloc[0]
+            results = self._table.search().where(f"id = {self._sql_quote(memory_id)}").limit(1).to_arrow()
+            if results.num_rows > 0:
+                row = results.to_pylist()[0]
                 return MemoryEntry(
                     id=row['id'],
                     content=row['content'],
@@ -284,31 +1004,37 @@ class ArchivalMemory:
                     metadata=json.loads(row['metadata']) if row.get('metadata') else None
                 )
         else:
-            return self._entries.get(memory_id)
+            self._index.refresh()
+            entry = self._index.get_entry(memory_id)
+            if entry is not None:
+                return replace(entry, embedding=self._index.get(memory_id).tolist())
         
         return None
     
     def delete(self, memory_id: str) -> bool:
         """刪除記憶條目"""
         if HAS_LANCEDB and self._table is not None:
-            self._table.delete(f"id = '{memory_id}'")
+            self._table.delete(f"id = {self._sql_quote(memory_id)}")
         else:
-            if memory_id in self._entries:
-                del self._entries[memory_id]
-                return True
-            return False
+            return self._index.remove(memory_id)
         return True
     
     def get_stats(self) -> Dict[str, Any]:
         """獲取統計信息"""
         if HAS_LANCEDB and self._table is not None:
-            count = len(self._table.to_pandas())
+            count = self._table.count_rows()
+        else:
+            self._index.refresh()
+            count = len(self._index)
+        
+        if HAS_LANCEDB:
+            db_type = 'lancedb'
         else:
-            count = len(self._entries)
+            db_type = 'mmap' if self.persist_fallback else 'in-memory'
         
         return {
             'total_entries': count,
-            'db_type': 'lancedb' if HAS_LANCEDB else 'in-memory',
+            'db_type': db_type,
             'embedding_provider': self.embedding_provider,
             'embedding_dim': self.embedding_dim
         }
@@ -8,7 +8,7 @@ Auto Summarize Module - 自動摘要
 import json
 import re
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Iterable, Tuple
 from dataclasses import dataclass
 
 try:
@@ -42,9 +42,12 @@ class AutoSummarizer:
         self,
         recall_memory: Optional[RecallMemory] = None,
         llm_client: Optional[Any] = None,
-        config: Optional[SummaryConfig] = None
+        config: Optional[SummaryConfig] = None,
+        archival_memory: Optional[Any] = None
     ):
         self.recall = recall_memory or RecallMemory()
+        # 摘要寫入的 ArchivalMemory；未傳入時第一次存儲才創建默認實例
+        self.archival = archival_memory
         self.llm = llm_client
         self.config = config or SummaryConfig()
     
@@ -53,21 +56,16 @@ class AutoSummarizer:
         session_id: str,
         store_to_archival: bool = True
     ) -> Optional[ConversationSummary]:
-        """為整個會話生成摘要"""
-        stats = self.recall.get_session_stats(session_id)
+        """為整個會話生成摘要（流式讀取消息，包含已壓縮到冷存儲的消息）"""
+        stats = self.recall.get_session_stats(session_id, include_archived=True)
         
         if stats['message_count'] == 0:
             return None
         
-        all_messages = self.recall.get_recent_messages(
-            session_id,
-            limit=stats['message_count'],
-            include_summary=False
+        summary_text, key_points = self._digest(
+            self.recall.iter_messages(session_id, include_archived=True)
         )
         
-        summary_text = self._generate_summary(all_messages)
-        key_points = self._extract_key_points(all_messages)
-        
         summary = ConversationSummary(
             session_id=session_id,
             summary=summary_text,
@@ -80,10 +78,89 @@ class AutoSummarizer:
         self.recall.save_summary(summary)
         
         if store_to_archival:
-            self._store_to_archival(summary, all_messages)
+            self._store_to_archival(summary)
         
         return summary
     
+    def summarize_messages(
+        self,
+        session_id: str,
+        messages: Iterable[Any],
+        previous: Optional[ConversationSummary] = None
+    ) -> Optional[ConversationSummary]:
+        """
+        摘要一段消息並併入之前的摘要（供 RecallMemory 自動壓縮使用，不保存）
+        
+        摘要文本由之前摘要的內容與新消息一起重新生成，不逐段拼接；
+        關鍵點合併去重後保留最新的 key_points_count 個。
+        """
+        span = {'count': 0, 'start': None, 'end': None}
+        
+        def tally():
+            for msg in messages:
+                span['count'] += 1
+                span['start'] = span['start'] or msg.timestamp
+                span['end'] = msg.timestamp
+                yield msg
+        
+        summary_text, key_points = self._digest(tally(), previous.summary if previous else None)
+        if not span['count']:
+            return previous
+        
+        start_time, count = span['start'], span['count']
+        if previous:
+            key_points = previous.key_points + [p for p in key_points if p not in previous.key_points]
+            start_time = previous.start_time or start_time
+            count += previous.message_count or 0
+        
+        limit = self.config.max_summary_length
+        if len(summary_text) > limit:
+            summary_text = "…" + summary_text[-(limit - 1):]
+        
+        return ConversationSummary(
+            session_id=session_id,
+            summary=summary_text,
+            key_points=key_points[-self.config.key_points_count:],
+            start_time=start_time,
+            end_time=span['end'],
+            message_count=count
+        )
+    
+    def _digest(self, messages: Iterable[Any], previous: Optional[str] = None) -> Tuple[str, List[str]]:
+        """
+        一次遍歷消息得到 (摘要文本, 關鍵點)
+        
+        結果與 _generate_summary / _extract_key_points 相同，
+        但只保留摘要與前 key_points_count 個關鍵點需要的內容。
+        previous 為之前的摘要文本時，一併納入重新生成的摘要。
+        """
+        limit = self.config.key_points_count
+        actions = self._summary_actions(previous)
+        conversation = [f"summary: {previous}"] if previous and self.llm else []
+        preferences, facts, tasks = [], [], []
+        seen = False
+        
+        for msg in messages:
+            seen = True
+            if self.llm and msg.role in ['user', 'assistant']:
+                conversation.append(f"{msg.role}: {msg.content[:200]}")
+            actions.update(self._message_actions(msg))
+            if len(preferences) < limit:
+                preferences.extend(self._message_preferences(msg))
+            if len(preferences) + len(facts) < limit:
+                facts.extend(self._message_facts(msg))
+            if len(preferences) + len(facts) + len(tasks) < limit:
+                tasks.extend(self._message_tasks(msg))
+        
+        if not seen:
+            summary_text = ""
+        elif self.llm:
+            summary_text = self._llm_summarize(conversation)
+        else:
+            summary_text = self._describe_actions(actions)
+        
+        return summary_text, (preferences + facts + tasks)[:limit]
+    
     def _generate_summary(self, messages: List[Any]) -> str:
         """生成摘要文本"""
         if not messages:
@@ -105,29 +182,40 @@ class AutoSummarizer:
     
     def _simple_summarize(self, messages: List[Any]) -> str:
         """簡單規則摘要"""
+        actions = set()
+        for msg in messages:
+            actions.update(self._message_actions(msg))
+        return self._describe_actions(actions)
+    
+    def _message_actions(self, msg: Any) -> List[str]:
+        """單條消息對應的行為"""
         actions = []
+        content = msg.content.lower()
         
-        for msg in messages:
-            content = msg.content.lower()
-            
-            if msg.role == 'user':
-                if any(word in content for word in ['create', 'build', 'make', 'write']):
-                    actions.append('created something')
-                elif any(word in content for word in ['fix', 'debug', 'error', 'issue']):
-                    actions.append('debugged issues')
-                elif any(word in content for word in ['explain', 'what', 'how', 'why']):
-                    actions.append('asked questions')
-            
-            if msg.role == 'assistant':
-                if any(word in content for word in ['created', 'completed', 'done', 'finished']):
-                    actions.append('completed tasks')
+        if msg.role == 'user':
+            if any(word in content for word in ['create', 'build', 'make', 'write']):
+                actions.append('created something')
+            elif any(word in content for word in ['fix', 'debug', 'error', 'issue']):
+                actions.append('debugged issues')
+            elif any(word in content for word in ['explain', 'what', 'how', 'why']):
+                actions.append('asked questions')
         
-        actions = list(set(actions))
+        if msg.role == 'assistant':
+            if any(word in content for word in ['created', 'completed', 'done', 'finished']):
+                actions.append('completed tasks')
         
+        return actions
+    
+    def _describe_actions(self, actions: set) -> str:
         if actions:
-            return f"Session involved: {', '.join(actions)}."
+            return f"Session involved: {', '.join(sorted(actions))}."
         return "General conversation session."
     
+    def _summary_actions(self, summary_text: Optional[str]) -> set:
+        """從 _describe_actions 生成的文本還原行為集合"""
+        match = re.fullmatch(r"Session involved: (.+)\.", summary_text or "")
+        return set(match.group(1).split(", ")) if match else set()
+    
     def _simple_summarize_from_text(self, conversation: List[str]) -> str:
         """從文本列表生成摘要"""
         return f"Conversation with {len(conversation)} exchanges."
@@ -152,6 +240,9 @@ class AutoSummarizer:
     
     def _extract_preferences(self, messages: List[Any]) -> List[str]:
         """提取用戶偏好"""
+        return [p for msg in messages for p in self._message_preferences(msg)]
+    
+    def _message_preferences(self, msg: Any) -> List[str]:
         preferences = []
         
         preference_patterns = [
@@ -160,17 +251,19 @@ class AutoSummarizer:
             r'(?:my|我的)\s+(?:favorite|favourite|最喜歡)\s+(?:is|是)\s+(.+?)[.。]'
         ]
         
-        for msg in messages:
-            if msg.role == 'user':
-                for pattern in preference_patterns:
-                    matches = re.findall(pattern, msg.content, re.IGNORECASE)
-                    for match in matches:
-                        preferences.append(f"User preference: {match.strip()}")
+        if msg.role == 'user':
+            for pattern in preference_patterns:
+                matches = re.findall(pattern, msg.content, re.IGNORECASE)
+                for match in matches:
+                    preferences.append(f"User preference: {match.strip()}")
         
         return preferences
     
     def _extract_facts(self, messages: List[Any]) -> List[str]:
         """提取重要事實"""
+        return [f for msg in messages for f in self._message_facts(msg)]
+    
+    def _message_facts(self, msg: Any) -> List[str]:
         facts = []
         
         fact_patterns = [
@@ -178,74 +271,72 @@ class AutoSummarizer:
             r'(?:my|我的)\s+(?:name|姓名|job|工作|company|公司)\s+(?:is|是)\s+(.+?)[.。]'
         ]
         
-        for msg in messages:
-            if msg.role == 'user':
-                for pattern in fact_patterns:
-                    matches = re.findall(pattern, msg.content, re.IGNORECASE)
-                    for match in matches:
-                        facts.append(f"User fact: {match.strip()}")
+        if msg.role == 'user':
+            for pattern in fact_patterns:
+                matches = re.findall(pattern, msg.content, re.IGNORECASE)
+                for match in matches:
+                    facts.append(f"User fact: {match.strip()}")
         
         return facts
     
     def _extract_completed_tasks(self, messages: List[Any]) -> List[str]:
         """提取已完成的任務"""
+        return [t for msg in messages for t in self._message_tasks(msg)]
+    
+    def _message_tasks(self, msg: Any) -> List[str]:
         tasks = []
         
         task_keywords = ['created', 'built', 'implemented', 'fixed', 'completed', 
                         'generated', 'wrote', 'deployed']
         
-        for msg in messages:
-            if msg.role == 'assistant':
-                content_lower = msg.content.lower()
-                for keyword in task_keywords:
-                    if keyword in content_lower:
-                        # 提取句子
-                        sentences = re.findall(r'[^.!?]+[.!?]', msg.content)
-                        for sent in sentences:
-                            if keyword in sent.lower():
-                                tasks.append(f"Task: {sent.strip()}")
-                                break
-                        break
+        if msg.role == 'assistant':
+            content_lower = msg.content.lower()
+            for keyword in task_keywords:
+                if keyword in content_lower:
+                    # 提取句子
+                    sentences = re.findall(r'[^.!?]+[.!?]', msg.content)
+                    for sent in sentences:
+                        if keyword in sent.lower():
+                            tasks.append(f"Task: {sent.strip()}")
+                            break
+                    break
         
         return tasks
     
     def _store_to_archival(
         self,
         summary: ConversationSummary,
-        messages: List[Any]
+        messages: Optional[List[Any]] = None
     ):
         """存儲摘要到存檔記憶"""
         try:
-            try:
-                from .archival_memory import ArchivalMemory
-            except ImportError:
-                from archival_memory import ArchivalMemory
-            archival = ArchivalMemory()
+            if self.archival is None:
+                try:
+                    from .archival_memory import ArchivalMemory
+                except ImportError:
+                    from archival_memory import ArchivalMemory
+                self.archival = ArchivalMemory()
+            archival = self.archival
             
-            # 存儲摘要
-            archival.insert(
-                content=summary.summary,
-                memory_type="summary",
-                source=summary.session_id,
-                metadata={
+            # 摘要與關鍵點（各自作為獨立記憶）一次批量寫入；重複的關鍵點只存一次
+            archival.insert_many([{
+                'content': summary.summary,
+                'memory_type': "summary",
+                'source': summary.session_id,
+                'metadata': {
                     'session_id': summary.session_id,
                     'message_count': summary.message_count,
                     'key_points': summary.key_points
                 }
-            )
-            
-            # 存儲關鍵點作為獨立記憶
-            for point in summary.key_points:
-                archival.insert(
-                    content=point,
-                    memory_type="key_point",
-                    source=summary.session_id
-                )
+            }] + [
+                {'content': point, 'memory_type': "key_point", 'source': summary.session_id}
+                for point in summary.key_points
+            ])
                 
         except Exception as e:
             print(f"Error storing to archival: {e}")
     
-    def extract_code_blocks(self, messages: List[Any]) -> List[Dict]:
+    def extract_code_blocks(self, messages: Iterable[Any]) -> List[Dict]:
         """提取對話中的代碼塊"""
         code_blocks = []
         
@@ -269,13 +360,7 @@ class AutoSummarizer:
         stats = self.recall.get_session_stats(session_id)
         summary = self.recall.get_summary(session_id)
         
-        all_messages = self.recall.get_recent_messages(
-            session_id,
-            limit=stats['message_count'],
-            include_summary=False
-        )
-        
-        code_blocks = self.extract_code_blocks(all_messages)
+        code_blocks = self.extract_code_blocks(self.recall.iter_messages(session_id))
         
         return {
             'session_id': session_id,
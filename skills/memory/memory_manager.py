@@ -65,7 +65,8 @@ class MemoryManager:
         
         # 初始化摘要器
         self.summarizer = AutoSummarizer(
-            recall_memory=self.recall
+            recall_memory=self.recall,
+            archival_memory=self.archival
         ) if enable_auto_summarize else None
     
     def get_full_context(
@@ -85,8 +86,8 @@ class MemoryManager:
         if query:
             archival_results = self.archival.search(query=query, limit=3)
         
-        total_chars = len(core_prompt) + sum(len(m['content']) for m in recall_messages)
-        total_tokens_estimate = total_chars // 4
+        count = self.recall.tokenizer.count
+        total_tokens_estimate = count(core_prompt) + sum(count(m['content']) for m in recall_messages)
         
         return MemoryContext(
             core_prompt=core_prompt,
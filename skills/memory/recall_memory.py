@@ -6,14 +6,25 @@ Recall Memory Module - 召回記憶（對話歷史）
 """
 
 import json
+import logging
+import queue
 import sqlite3
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Any, Iterator
+from typing import Dict, List, Optional, Any, Iterator, Iterable
 from dataclasses import dataclass, asdict
 from enum import Enum
 import threading
 
+# 可選依賴：精確的 BPE 計數
+try:
+    import tiktoken
+    HAS_TIKTOKEN = True
+except ImportError:
+    HAS_TIKTOKEN = False
+
+logger = logging.getLogger(__name__)
+
 
 class MessageRole(Enum):
     """消息角色"""
@@ -32,13 +43,14 @@ class Message:
     content: str = ""
     timestamp: Optional[str] = None
     metadata: Optional[str] = None  # JSON string
+    snippet: Optional[str] = None  # 搜索命中片段（僅全文搜索結果）
     
     def __post_init__(self):
         if self.timestamp is None:
             self.timestamp = datetime.utcnow().isoformat()
     
     def to_dict(self) -> Dict[str, Any]:
-        return {
+        data = {
             'id': self.id,
             'session_id': self.session_id,
             'role': self.role,
@@ -46,6 +58,9 @@ class Message:
             'timestamp': self.timestamp,
             'metadata': json.loads(self.metadata) if self.metadata else {}
         }
+        if self.snippet is not None:
+            data['snippet'] = self.snippet
+        return data
 
 
 @dataclass
@@ -69,6 +84,41 @@ class ConversationSummary:
         }
 
 
+class Tokenizer:
+    """
+    Token 計數接口
+    
+    name 會與計數一起存入 messages 表；換用其他分詞器時舊計數自動失效。
+    """
+    
+    name = "base"
+    
+    def count(self, text: str) -> int:
+        raise NotImplementedError
+
+
+class EstimateTokenizer(Tokenizer):
+    """粗略估算：1 token ≈ 4 chars（無依賴的默認值）"""
+    
+    name = "estimate-4"
+    
+    def count(self, text: str) -> int:
+        return (len(text) + 3) // 4
+
+
+class TiktokenTokenizer(Tokenizer):
+    """tiktoken 精確計數（需要 pip install tiktoken）"""
+    
+    def __init__(self, encoding: str = "cl100k_base"):
+        if not HAS_TIKTOKEN:
+            raise ImportError("tiktoken is not installed")
+        self._encoding = tiktoken.get_encoding(encoding)
+        self.name = f"tiktoken-{encoding}"
+    
+    def count(self, text: str) -> int:
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+
 class RecallMemory:
     """
     召回記憶管理器
@@ -76,32 +126,69 @@ class RecallMemory:
     對應 MemGPT 的 Recall Memory：
     - 存儲完整的對話歷史
     - 支持按 session 查詢
-    - 自動壓縮舊對話
-    - 支持關鍵字搜索
+    - 自動壓縮舊對話（後台摘要並移入冷存儲）
+    - 支持關鍵字搜索（FTS5 trigram 全文索引，bm25 排序）
+    - 按 token 預算組裝上下文（可插拔分詞器，計數快取在消息行上）
     
-    存儲：SQLite（輕量、快速）
+    存儲：SQLite（輕量、快速）；壓縮後的舊消息在同目錄的
+    <db>_archive.db（冷存儲，不參與上下文；搜索與統計默認包含）
     """
     
+    # 全文索引的片段標記與長度（token 數）
+    SNIPPET_MARKS = ('[', ']')
+    SNIPPET_TOKENS = 16
+    
+    SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+    
+    # 等待寫鎖的秒數
+    BUSY_TIMEOUT = 30
+    
     def __init__(
         self,
         db_path: Optional[str] = None,
         max_context_messages: int = 20,
-        auto_compress_threshold: int = 50
+        auto_compress_threshold: int = 50,
+        use_fts: bool = True,
+        synchronous: str = "NORMAL",
+        compress_window: Optional[int] = None,
+        compress_in_background: bool = True,
+        archive_path: Optional[str] = None,
+        tokenizer: Optional[Tokenizer] = None
     ):
         self.db_path = Path(db_path or "~/.openclaw/memory/recall.db").expanduser()
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.archive_path = Path(archive_path).expanduser() if archive_path else \
+            self.db_path.with_name(f"{self.db_path.stem}_archive.db")
         
         self.max_context_messages = max_context_messages
         self.auto_compress_threshold = auto_compress_threshold
+        # 壓縮後保留的最新消息數（滑動窗口），默認與上下文消息數相同
+        self.compress_window = compress_window or max_context_messages
+        self.compress_in_background = compress_in_background
+        self.use_fts = use_fts
+        self.has_fts = False
+        self.tokenizer = tokenizer or EstimateTokenizer()
+        
+        # WAL 模式下 NORMAL 只在 checkpoint 時 fsync，斷電最多丟失最後幾筆提交
+        self.synchronous = synchronous.upper()
+        if self.synchronous not in self.SYNCHRONOUS_LEVELS:
+            raise ValueError(f"synchronous must be one of {self.SYNCHRONOUS_LEVELS}")
         
         self._local = threading.local()
+        self._compress_queue: "queue.Queue[str]" = queue.Queue()
+        self._compress_pending = set()
+        self._compress_lock = threading.Lock()
+        self._compress_thread: Optional[threading.Thread] = None
         self._init_db()
     
     def _get_conn(self) -> sqlite3.Connection:
-        """獲取線程安全的連接"""
+        """獲取線程安全的連接（WAL 模式：讀寫互不阻塞）"""
         if not hasattr(self._local, 'conn') or self._local.conn is None:
-            self._local.conn = sqlite3.connect(str(self.db_path))
-            self._local.conn.row_factory = sqlite3.Row
+            conn = sqlite3.connect(str(self.db_path), timeout=self.BUSY_TIMEOUT)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={self.synchronous}")
+            self._local.conn = conn
         return self._local.conn
     
     def _init_db(self):
@@ -116,9 +203,16 @@ class RecallMemory:
                 role TEXT NOT NULL,
                 content TEXT NOT NULL,
                 timestamp TEXT DEFAULT CURRENT_TIMESTAMP,
-                metadata TEXT
+                metadata TEXT,
+                token_count INTEGER,
+                token_model TEXT
             )
         """)
+        # 舊庫補上 token 計數快取列（NULL 表示尚未計算）
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(messages)")}
+        for column, kind in (('token_count', 'INTEGER'), ('token_model', 'TEXT')):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE messages ADD COLUMN {column} {kind}")
         
         # 摘要表
         conn.execute("""
@@ -134,13 +228,113 @@ class RecallMemory:
             )
         """)
         
-        # 創建索引
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_msg_session ON messages(session_id)")
+        # 創建索引：(session_id, timestamp) 加上隱含的 rowid，
+        # 會話內按時間排序與 keyset 分頁都直接走索引；取代單列的 session_id 索引
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_msg_session_time ON messages(session_id, timestamp)")
+        conn.execute("DROP INDEX IF EXISTS idx_msg_session")
         conn.execute("CREATE INDEX IF NOT EXISTS idx_msg_time ON messages(timestamp)")
         conn.execute("CREATE INDEX IF NOT EXISTS idx_sum_session ON summaries(session_id)")
         
+        self._init_session_stats(conn)
+        
+        if self.use_fts:
+            self.has_fts = self._init_fts(conn)
+        
         conn.commit()
     
+    def _init_session_stats(self, conn: sqlite3.Connection):
+        """
+        建立會話統計表，由觸發器隨 messages 增刪增量維護
+        
+        get_session_stats / list_sessions 直接讀取，不再對 messages 做聚合；
+        刪除時的 MIN/MAX 走 (session_id, timestamp) 索引重算。
+        舊數據庫首次建立時從 messages 回填。
+        """
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'session_stats'"
+        ).fetchone()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS session_stats (
+                session_id TEXT PRIMARY KEY,
+                message_count INTEGER NOT NULL DEFAULT 0,
+                start_time TEXT,
+                end_time TEXT,
+                total_chars INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_stats_end ON session_stats(end_time);
+            
+            CREATE TRIGGER IF NOT EXISTS session_stats_ai AFTER INSERT ON messages BEGIN
+                INSERT INTO session_stats (session_id, message_count, start_time, end_time, total_chars)
+                VALUES (new.session_id, 1, new.timestamp, new.timestamp, LENGTH(new.content))
+                ON CONFLICT(session_id) DO UPDATE SET
+                    message_count = message_count + 1,
+                    start_time = MIN(COALESCE(start_time, excluded.start_time), excluded.start_time),
+                    end_time = MAX(COALESCE(end_time, excluded.end_time), excluded.end_time),
+                    total_chars = total_chars + excluded.total_chars;
+            END;
+            CREATE TRIGGER IF NOT EXISTS session_stats_ad AFTER DELETE ON messages BEGIN
+                UPDATE session_stats SET
+                    message_count = message_count - 1,
+                    total_chars = total_chars - LENGTH(old.content),
+                    start_time = (SELECT MIN(timestamp) FROM messages WHERE session_id = old.session_id),
+                    end_time = (SELECT MAX(timestamp) FROM messages WHERE session_id = old.session_id)
+                WHERE session_id = old.session_id;
+                DELETE FROM session_stats
+                WHERE session_id = old.session_id AND message_count <= 0;
+            END;
+            CREATE TRIGGER IF NOT EXISTS session_stats_au AFTER UPDATE OF content ON messages BEGIN
+                UPDATE session_stats SET
+                    total_chars = total_chars - LENGTH(old.content) + LENGTH(new.content)
+                WHERE session_id = new.session_id;
+            END;
+        """)
+        if not exists:
+            conn.execute("""
+                INSERT INTO session_stats (session_id, message_count, start_time, end_time, total_chars)
+                SELECT session_id, COUNT(*), MIN(timestamp), MAX(timestamp), SUM(LENGTH(content))
+                FROM messages GROUP BY session_id
+            """)
+    
+    def _init_fts(self, conn: sqlite3.Connection) -> bool:
+        """
+        建立 messages 的 FTS5 全文索引（trigram 分詞，支持中日韓子字串）
+        
+        外部內容表，由觸發器與 messages 同步；舊數據庫首次建立時重建索引。
+        SQLite 未編譯 FTS5 或不支持 trigram 時返回 False，搜索退回 LIKE。
+        """
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+        ).fetchone()
+        try:
+            conn.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                    content,
+                    content='messages',
+                    content_rowid='id',
+                    tokenize='trigram'
+                )
+            """)
+        except sqlite3.OperationalError:
+            return False
+        
+        conn.executescript("""
+            CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN
+                INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN
+                INSERT INTO messages_fts(messages_fts, rowid, content)
+                VALUES ('delete', old.id, old.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF content ON messages BEGIN
+                INSERT INTO messages_fts(messages_fts, rowid, content)
+                VALUES ('delete', old.id, old.content);
+                INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+            END;
+        """)
+        if not exists:
+            conn.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+        return True
+    
     def add_message(
         self,
         session_id: str,
@@ -167,6 +361,50 @@ class RecallMemory:
         
         return cursor.lastrowid
     
+    def add_messages(self, messages: Iterable[Dict[str, Any]]) -> List[int]:
+        """
+        批量添加消息（一個事務、一次 executemany）
+        
+        Args:
+            messages: 每項包含 session_id、role、content，可選 metadata
+        
+        Returns:
+            List[int]: 按輸入順序的消息 ID
+        """
+        rows = [
+            (
+                m['session_id'],
+                m['role'],
+                m['content'],
+                json.dumps(m['metadata']) if m.get('metadata') else None
+            )
+            for m in messages
+        ]
+        if not rows:
+            return []
+        
+        conn = self._get_conn()
+        # IMMEDIATE 先取得寫鎖，事務內 AUTOINCREMENT 的 ID 連續
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                """INSERT INTO messages (session_id, role, content, metadata)
+                   VALUES (?, ?, ?, ?)""",
+                rows
+            )
+            last_id = conn.execute(
+                "SELECT seq FROM sqlite_sequence WHERE name = 'messages'"
+            ).fetchone()[0]
+        
+        for session_id in dict.fromkeys(row[0] for row in rows):
+            self._maybe_compress(session_id)
+        
+        return list(range(last_id - len(rows) + 1, last_id + 1))
+    
+    def buffered(self, max_size: int = 500, max_delay: float = 1.0) -> "WriteBuffer":
+        """創建寫入緩衝：按數量或時間批量寫入（見 WriteBuffer）"""
+        return WriteBuffer(self, max_size=max_size, max_delay=max_delay)
+    
     def get_recent_messages(
         self,
         session_id: str,
@@ -201,66 +439,243 @@ class RecallMemory:
         rows = conn.execute(
             """SELECT * FROM messages 
                WHERE session_id = ? 
-               ORDER BY timestamp DESC 
+               ORDER BY timestamp DESC, id DESC 
                LIMIT ?""",
             (session_id, limit)
         ).fetchall()
         
         for row in reversed(rows):  # 反轉為正序
-            messages.append(Message(
-                id=row['id'],
-                session_id=row['session_id'],
-                role=row['role'],
-                content=row['content'],
-                timestamp=row['timestamp'],
-                metadata=row['metadata']
-            ))
+            messages.append(self._row_to_message(row))
         
         return messages
     
+    def get_history(
+        self,
+        session_id: str,
+        limit: int = 50,
+        before_id: Optional[int] = None,
+        after_id: Optional[int] = None
+    ) -> List[Message]:
+        """
+        分頁獲取會話歷史（keyset 分頁，按 (timestamp, id) 排序，返回正序）
+        
+        Args:
+            before_id: 返回早於該消息的最多 limit 條（往前翻頁）
+            after_id: 返回晚於該消息的最多 limit 條（往後翻頁）
+            都不指定時返回最新的 limit 條；錨點消息不存在時返回空列表
+        """
+        conn = self._get_conn()
+        anchor_id = before_id if before_id is not None else after_id
+        
+        if anchor_id is None:
+            rows = conn.execute(
+                """SELECT * FROM messages
+                   WHERE session_id = ?
+                   ORDER BY timestamp DESC, id DESC
+                   LIMIT ?""",
+                (session_id, limit)
+            ).fetchall()
+            return [self._row_to_message(row) for row in reversed(rows)]
+        
+        anchor = conn.execute(
+            "SELECT timestamp FROM messages WHERE id = ?", (anchor_id,)
+        ).fetchone()
+        if anchor is None:
+            return []
+        
+        if before_id is not None:
+            rows = conn.execute(
+                """SELECT * FROM messages
+                   WHERE session_id = ? AND (timestamp, id) < (?, ?)
+                   ORDER BY timestamp DESC, id DESC
+                   LIMIT ?""",
+                (session_id, anchor['timestamp'], anchor_id, limit)
+            ).fetchall()
+            rows.reverse()
+        else:
+            rows = conn.execute(
+                """SELECT * FROM messages
+                   WHERE session_id = ? AND (timestamp, id) > (?, ?)
+                   ORDER BY timestamp, id
+                   LIMIT ?""",
+                (session_id, anchor['timestamp'], anchor_id, limit)
+            ).fetchall()
+        return [self._row_to_message(row) for row in rows]
+    
+    def iter_messages(
+        self,
+        session_id: str,
+        batch_size: int = 500,
+        include_archived: bool = False
+    ) -> Iterator[Message]:
+        """
+        按時間正序逐條產出會話的所有消息
+        
+        每次只從數據庫讀取 batch_size 行（keyset 分頁），
+        不會把整個會話載入內存。include_archived 時先產出冷存儲中已壓縮的消息。
+        """
+        if include_archived and self._attach_archive():
+            for row in self._iter_rows("archive.messages", session_id, batch_size):
+                yield self._row_to_message(row)
+        for row in self._iter_rows("main.messages", session_id, batch_size):
+            yield self._row_to_message(row)
+    
+    def _iter_rows(
+        self,
+        table: str,
+        session_id: str,
+        batch_size: int,
+        until: Optional[tuple] = None
+    ) -> Iterator[sqlite3.Row]:
+        """按 (timestamp, id) 正序分批讀取行，until 為包含的上界"""
+        conn = self._get_conn()
+        bound = " AND (timestamp, id) <= (?, ?)" if until else ""
+        key: Optional[tuple] = None
+        while True:
+            if key is None:
+                rows = conn.execute(
+                    f"""SELECT * FROM {table}
+                       WHERE session_id = ?{bound}
+                       ORDER BY timestamp, id
+                       LIMIT ?""",
+                    (session_id, *(until or ()), batch_size)
+                ).fetchall()
+            else:
+                rows = conn.execute(
+                    f"""SELECT * FROM {table}
+                       WHERE session_id = ? AND (timestamp, id) > (?, ?){bound}
+                       ORDER BY timestamp, id
+                       LIMIT ?""",
+                    (session_id, *key, *(until or ()), batch_size)
+                ).fetchall()
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            key = (rows[-1]['timestamp'], rows[-1]['id'])
+    
+    @staticmethod
+    def _row_to_message(row: sqlite3.Row) -> Message:
+        return Message(
+            id=row['id'],
+            session_id=row['session_id'],
+            role=row['role'],
+            content=row['content'],
+            timestamp=row['timestamp'],
+            metadata=row['metadata']
+        )
+    
     def get_messages_for_context(
         self,
         session_id: str,
-        max_tokens: int = 4000
+        max_tokens: int = 4000,
+        include_summary: bool = True
     ) -> List[Dict[str, str]]:
         """
         獲取用於 LLM 上下文的消息列表
         
-        智能選擇：優先保留最近消息，舊消息用摘要替代
+        從最新消息往回裝，直到 token 預算用完（最多 max_context_messages 條），
+        保證最新的消息總在上下文裡；會話摘要只用裝完消息後剩下的預算。
+        
+        Args:
+            session_id: 會話 ID
+            max_tokens: token 預算（按 self.tokenizer 計數）
+            include_summary: 剩餘預算裝得下時把摘要放在最前面
         """
-        messages = self.get_recent_messages(session_id, limit=self.max_context_messages)
+        conn = self._get_conn()
+        budget = max_tokens
         
-        # 轉換為 OpenAI 格式
-        context = []
-        total_chars = 0
+        rows = conn.execute(
+            """SELECT id, role, content, token_count, token_model FROM messages
+               WHERE session_id = ?
+               ORDER BY timestamp DESC, id DESC
+               LIMIT ?""",
+            (session_id, self.max_context_messages)
+        ).fetchall()
         
-        for msg in messages:
-            char_count = len(msg.content)
-            if total_chars + char_count > max_tokens * 4:  # 粗略估算 1 token ≈ 4 chars
+        context = []
+        counted = []
+        for row in rows:
+            tokens = row['token_count']
+            if tokens is None or row['token_model'] != self.tokenizer.name:
+                tokens = self.tokenizer.count(row['content'])
+                counted.append((tokens, self.tokenizer.name, row['id']))
+            if tokens > budget:
                 break
-            
-            context.append({
-                'role': msg.role,
-                'content': msg.content
-            })
-            total_chars += char_count
+            context.append({'role': row['role'], 'content': row['content']})
+            budget -= tokens
+        
+        if counted:
+            self._cache_token_counts(conn, counted)
+        
+        if include_summary:
+            summary = self.get_summary(session_id)
+            if summary:
+                content = f"[Previous conversation summary]: {summary.summary}"
+                if self.tokenizer.count(content) <= budget:
+                    context.append({'role': 'system', 'content': content})
         
+        context.reverse()  # 反轉為正序
         return context
     
+    def _cache_token_counts(self, conn: sqlite3.Connection, counted: List[tuple]):
+        """
+        把新算出的 token 數寫回消息行
+        
+        只是快取：不等待寫鎖，其他連接正在寫入時直接跳過，下次再算，
+        讀取路徑不會因此阻塞。
+        """
+        conn.execute("PRAGMA busy_timeout = 0")
+        try:
+            with conn:
+                conn.executemany(
+                    "UPDATE messages SET token_count = ?, token_model = ? WHERE id = ?",
+                    counted
+                )
+        except sqlite3.OperationalError:
+            pass
+        finally:
+            conn.execute(f"PRAGMA busy_timeout = {self.BUSY_TIMEOUT * 1000}")
+    
     def search(
         self,
         query: str,
         session_id: Optional[str] = None,
-        limit: int = 10
+        limit: int = 10,
+        include_archived: bool = True
     ) -> List[Message]:
         """
         關鍵字搜索對話歷史
+        
+        有全文索引時按 bm25 相關度排序並附帶命中片段（Message.snippet）；
+        trigram 需至少 3 個字符，較短的查詢與無 FTS5 時使用 LIKE 掃描。
+        主庫結果不足 limit 條時，再以 LIKE 掃描冷存儲中已壓縮的消息補足
+        （include_archived=False 時只搜主庫）。
         """
+        if self.has_fts and len(query) >= 3:
+            results = self._search_fts(query, session_id, limit)
+        else:
+            results = self._search_like("main.messages", query, session_id, limit)
+        
+        if include_archived and len(results) < limit and self._attach_archive(create=False):
+            # 壓縮中途失敗時消息可能兩邊都有
+            seen = {m.id for m in results}
+            archived = self._search_like("archive.messages", query, session_id, limit)
+            results += [m for m in archived if m.id not in seen][:limit - len(results)]
+        return results
+    
+    def _search_like(
+        self,
+        table: str,
+        query: str,
+        session_id: Optional[str],
+        limit: int
+    ) -> List[Message]:
+        """LIKE 子字串掃描，按時間從新到舊"""
         conn = self._get_conn()
         
         if session_id:
             rows = conn.execute(
-                """SELECT * FROM messages 
+                f"""SELECT * FROM {table} 
                    WHERE session_id = ? AND content LIKE ? 
                    ORDER BY timestamp DESC 
                    LIMIT ?""",
@@ -268,13 +683,39 @@ class RecallMemory:
             ).fetchall()
         else:
             rows = conn.execute(
-                """SELECT * FROM messages 
+                f"""SELECT * FROM {table} 
                    WHERE content LIKE ? 
                    ORDER BY timestamp DESC 
                    LIMIT ?""",
                 (f'%{query}%', limit)
             ).fetchall()
         
+        return [self._row_to_message(row) for row in rows]
+    
+    def _search_fts(
+        self,
+        query: str,
+        session_id: Optional[str],
+        limit: int
+    ) -> List[Message]:
+        """FTS5 搜索：整個查詢作為短語（與 LIKE 相同的子字串語義）"""
+        conn = self._get_conn()
+        phrase = '"' + query.replace('"', '""') + '"'
+        start, end = self.SNIPPET_MARKS
+        
+        sql = """SELECT m.*, snippet(messages_fts, 0, ?, ?, '…', ?) AS snippet
+                 FROM messages_fts
+                 JOIN messages m ON m.id = messages_fts.rowid
+                 WHERE messages_fts MATCH ?"""
+        params: List[Any] = [start, end, self.SNIPPET_TOKENS, phrase]
+        if session_id:
+            sql += " AND m.session_id = ?"
+            params.append(session_id)
+        sql += " ORDER BY bm25(messages_fts), m.id DESC LIMIT ?"
+        params.append(limit)
+        
+        rows = conn.execute(sql, params).fetchall()
+        
         return [
             Message(
                 id=row['id'],
@@ -282,7 +723,8 @@ class RecallMemory:
                 role=row['role'],
                 content=row['content'],
                 timestamp=row['timestamp'],
-                metadata=row['metadata']
+                metadata=row['metadata'],
+                snippet=row['snippet']
             )
             for row in rows
         ]
@@ -292,25 +734,28 @@ class RecallMemory:
         conn = self._get_conn()
         
         try:
-            conn.execute(
-                """INSERT OR REPLACE INTO summaries 
-                   (session_id, summary, key_points, start_time, end_time, message_count)
-                   VALUES (?, ?, ?, ?, ?, ?)""",
-                (
-                    summary.session_id,
-                    summary.summary,
-                    json.dumps(summary.key_points),
-                    summary.start_time,
-                    summary.end_time,
-                    summary.message_count
-                )
-            )
+            self._write_summary(conn, summary)
             conn.commit()
             return True
         except Exception as e:
             print(f"Error saving summary: {e}")
             return False
     
+    def _write_summary(self, conn: sqlite3.Connection, summary: ConversationSummary):
+        conn.execute(
+            """INSERT OR REPLACE INTO summaries 
+               (session_id, summary, key_points, start_time, end_time, message_count)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            (
+                summary.session_id,
+                summary.summary,
+                json.dumps(summary.key_points),
+                summary.start_time,
+                summary.end_time,
+                summary.message_count
+            )
+        )
+    
     def get_summary(self, session_id: str) -> Optional[ConversationSummary]:
         """獲取對話摘要"""
         conn = self._get_conn()
@@ -332,71 +777,204 @@ class RecallMemory:
         return None
     
     def _maybe_compress(self, session_id: str):
-        """檢查並壓縮舊對話"""
+        """檢查會話是否超過壓縮閾值，超過則交給後台壓縮"""
         conn = self._get_conn()
         
-        count = conn.execute(
-            "SELECT COUNT(*) FROM messages WHERE session_id = ?",
+        row = conn.execute(
+            "SELECT message_count FROM session_stats WHERE session_id = ?",
             (session_id,)
-        ).fetchone()[0]
+        ).fetchone()
         
-        if count > self.auto_compress_threshold:
-            # 標記需要壓縮，實際壓縮由 auto_summarize 處理
-            pass
+        if row and row[0] > self.auto_compress_threshold:
+            if self.compress_in_background:
+                self._schedule_compress(session_id)
+            else:
+                self.compact_session(session_id)
+    
+    def _schedule_compress(self, session_id: str):
+        """排入後台壓縮隊列（同一會話排隊中時不重複）"""
+        with self._compress_lock:
+            if session_id in self._compress_pending:
+                return
+            self._compress_pending.add(session_id)
+            if self._compress_thread is None or not self._compress_thread.is_alive():
+                self._compress_thread = threading.Thread(
+                    target=self._compress_worker, name="recall-compress", daemon=True
+                )
+                self._compress_thread.start()
+        self._compress_queue.put(session_id)
     
-    def get_session_stats(self, session_id: str) -> Dict[str, Any]:
-        """獲取會話統計"""
+    def _compress_worker(self):
+        while True:
+            session_id = self._compress_queue.get()
+            with self._compress_lock:
+                self._compress_pending.discard(session_id)
+            try:
+                self.compact_session(session_id)
+            except Exception as e:
+                print(f"Error compressing session {session_id}: {e}")
+            finally:
+                self._compress_queue.task_done()
+    
+    def wait_for_compression(self):
+        """等待已排隊的後台壓縮完成"""
+        self._compress_queue.join()
+    
+    def compact_session(self, session_id: str) -> int:
+        """
+        壓縮會話：最新 compress_window 條以外的消息經 AutoSummarizer
+        併入會話摘要，並移到冷存儲
+        
+        Returns:
+            int: 移入冷存儲的消息數
+        """
+        try:
+            from .auto_summarize import AutoSummarizer
+        except ImportError:
+            from auto_summarize import AutoSummarizer
+        
         conn = self._get_conn()
+        cutoff = conn.execute(
+            """SELECT timestamp, id FROM messages
+               WHERE session_id = ?
+               ORDER BY timestamp DESC, id DESC
+               LIMIT 1 OFFSET ?""",
+            (session_id, self.compress_window)
+        ).fetchone()
+        if cutoff is None:
+            return 0
+        until = (cutoff['timestamp'], cutoff['id'])
         
-        stats = conn.execute(
-            """SELECT 
-                COUNT(*) as message_count,
-                MIN(timestamp) as start_time,
-                MAX(timestamp) as end_time,
-                SUM(LENGTH(content)) as total_chars
-               FROM messages 
-               WHERE session_id = ?""",
+        old = (self._row_to_message(row)
+               for row in self._iter_rows("main.messages", session_id, 500, until))
+        summary = AutoSummarizer(recall_memory=self).summarize_messages(
+            session_id, old, previous=self.get_summary(session_id)
+        )
+        
+        self._attach_archive()
+        where = "session_id = ? AND (timestamp, id) <= (?, ?)"
+        # WAL 下跨附加數據庫的事務不是原子的：先提交冷存儲的寫入，
+        # 再刪除主庫中已確認歸檔的行。中途失敗時消息只會兩邊都有，
+        # 重新壓縮即可完成搬移，不會丟失
+        with conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO archive.messages "
+                "SELECT id, session_id, role, content, timestamp, metadata "
+                f"FROM main.messages WHERE {where}",
+                (session_id, *until)
+            )
+        with conn:
+            moved = conn.execute(
+                f"DELETE FROM main.messages WHERE {where} "
+                "AND id IN (SELECT id FROM archive.messages WHERE session_id = ?)",
+                (session_id, *until, session_id)
+            ).rowcount
+            if summary:
+                # 摘要涵蓋的是冷存儲中的全部消息
+                count, start = conn.execute(
+                    "SELECT COUNT(*), MIN(timestamp) FROM archive.messages WHERE session_id = ?",
+                    (session_id,)
+                ).fetchone()
+                summary.message_count, summary.start_time = count, start
+                self._write_summary(conn, summary)
+        return moved
+    
+    def _attach_archive(self, create: bool = True) -> bool:
+        """把冷存儲附加為 archive；create=False 時檔案不存在則不附加"""
+        conn = self._get_conn()
+        attached = any(row[1] == 'archive' for row in conn.execute("PRAGMA database_list"))
+        if attached:
+            return True
+        if not create and not self.archive_path.exists():
+            return False
+        
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute("ATTACH DATABASE ? AS archive", (str(self.archive_path),))
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS archive.messages (
+                id INTEGER PRIMARY KEY,
+                session_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                timestamp TEXT,
+                metadata TEXT
+            )
+        """)
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS archive.idx_archive_session_time "
+            "ON messages(session_id, timestamp)"
+        )
+        conn.commit()
+        return True
+    
+    def get_session_stats(self, session_id: str, include_archived: bool = True) -> Dict[str, Any]:
+        """獲取會話統計（讀 session_stats，加上冷存儲中的消息；include_archived=False 時只算主庫）"""
+        conn = self._get_conn()
+        
+        row = conn.execute(
+            "SELECT * FROM session_stats WHERE session_id = ?",
             (session_id,)
         ).fetchone()
-        
-        return {
+        stats = {
             'session_id': session_id,
-            'message_count': stats['message_count'],
-            'start_time': stats['start_time'],
-            'end_time': stats['end_time'],
-            'total_chars': stats['total_chars']
+            'message_count': row['message_count'] if row else 0,
+            'start_time': row['start_time'] if row else None,
+            'end_time': row['end_time'] if row else None,
+            'total_chars': row['total_chars'] if row else None
         }
+        
+        if include_archived and self._attach_archive(create=False):
+            archived = conn.execute(
+                """SELECT 
+                    COUNT(*) as message_count,
+                    MIN(timestamp) as start_time,
+                    MAX(timestamp) as end_time,
+                    SUM(LENGTH(content)) as total_chars
+                   FROM archive.messages 
+                   WHERE session_id = ?""",
+                (session_id,)
+            ).fetchone()
+            if archived['message_count']:
+                stats['message_count'] += archived['message_count']
+                stats['start_time'] = min(filter(None, [stats['start_time'], archived['start_time']]))
+                stats['end_time'] = max(filter(None, [stats['end_time'], archived['end_time']]))
+                stats['total_chars'] = (stats['total_chars'] or 0) + archived['total_chars']
+        
+        return stats
     
     def clear_session(self, session_id: str) -> bool:
         """清除特定會話的記憶"""
         conn = self._get_conn()
         
         try:
-            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            archived = self._attach_archive(create=False)
+            conn.execute("DELETE FROM main.messages WHERE session_id = ?", (session_id,))
+            if archived:
+                conn.execute("DELETE FROM archive.messages WHERE session_id = ?", (session_id,))
             conn.execute("DELETE FROM summaries WHERE session_id = ?", (session_id,))
             conn.commit()
             return True
         except Exception:
             return False
     
-    def list_sessions(self, limit: int = 100) -> List[Dict[str, Any]]:
-        """列出所有會話"""
+    def list_sessions(self, limit: int = 100, include_archived: bool = True) -> List[Dict[str, Any]]:
+        """列出所有會話（消息數與首條時間默認包含冷存儲中的消息）"""
         conn = self._get_conn()
         
         rows = conn.execute(
             """SELECT 
                 session_id,
-                COUNT(*) as message_count,
-                MIN(timestamp) as first_message,
-                MAX(timestamp) as last_message
-               FROM messages 
-               GROUP BY session_id 
-               ORDER BY last_message DESC 
+                message_count,
+                start_time as first_message,
+                end_time as last_message
+               FROM session_stats 
+               ORDER BY end_time DESC 
                LIMIT ?""",
             (limit,)
         ).fetchall()
         
-        return [
+        sessions = [
             {
                 'session_id': row['session_id'],
                 'message_count': row['message_count'],
@@ -405,6 +983,120 @@ class RecallMemory:
             }
             for row in rows
         ]
+        
+        if include_archived and sessions and self._attach_archive(create=False):
+            by_id = {s['session_id']: s for s in sessions}
+            archived = conn.execute(
+                f"""SELECT session_id, COUNT(*), MIN(timestamp)
+                   FROM archive.messages
+                   WHERE session_id IN ({','.join('?' * len(by_id))})
+                   GROUP BY session_id""",
+                list(by_id)
+            ).fetchall()
+            for session_id, count, first in archived:
+                session = by_id[session_id]
+                session['message_count'] += count
+                session['first_message'] = min(filter(None, [session['first_message'], first]))
+        
+        return sessions
+
+
+class WriteBuffer:
+    """
+    消息寫入緩衝（write-behind）
+    
+    add() 只放入緩衝，累積 max_size 條或最早一條等待 max_delay 秒後，
+    以一次 add_messages 寫入。未寫入的消息對讀取不可見；
+    需要讀到剛寫入的內容前先調用 flush()。
+    
+    用法：
+        with recall.buffered(max_size=500, max_delay=1.0) as buf:
+            buf.add(session_id, "user", "Hello")
+    """
+    
+    # 定時寫入失敗後重試間隔的上限（秒）
+    MAX_RETRY_DELAY = 60.0
+    
+    def __init__(self, recall: RecallMemory, max_size: int = 500, max_delay: float = 1.0):
+        self.recall = recall
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self._pending: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        # 寫入全程持有，保證批次按順序落庫
+        self._flush_lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        # 連續定時寫入失敗次數，決定重試間隔
+        self._failures = 0
+    
+    def add(
+        self,
+        session_id: str,
+        role: str,
+        content: str,
+        metadata: Optional[Dict] = None
+    ):
+        """放入緩衝，滿 max_size 時立即寫入"""
+        with self._lock:
+            self._pending.append({
+                'session_id': session_id,
+                'role': role,
+                'content': content,
+                'metadata': metadata
+            })
+            full = len(self._pending) >= self.max_size
+            if not full and self._timer is None:
+                self._arm(self.max_delay)
+        if full:
+            self.flush()
+    
+    def flush(self) -> List[int]:
+        """寫入所有緩衝的消息，返回其 ID；失敗時消息放回緩衝並拋出異常"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if not pending:
+                return []
+            try:
+                return self.recall.add_messages(pending)
+            except Exception:
+                with self._lock:
+                    self._pending[:0] = pending
+                raise
+    
+    def _arm(self, delay: float):
+        """啟動定時寫入（需持有 _lock）"""
+        self._timer = threading.Timer(delay, self._timed_flush)
+        self._timer.daemon = True
+        self._timer.start()
+    
+    def _timed_flush(self):
+        """定時寫入；失敗的消息留在緩衝，按指數退避重新定時重試"""
+        try:
+            self.flush()
+            self._failures = 0
+        except Exception:
+            self._failures += 1
+            delay = min(self.max_delay * 2 ** self._failures, self.MAX_RETRY_DELAY)
+            logger.exception("Error flushing buffered messages, retrying in %.1fs", delay)
+            with self._lock:
+                if self._pending and self._timer is None:
+                    self._arm(delay)
+    
+    def close(self) -> List[int]:
+        return self.flush()
+    
+    def __len__(self) -> int:
+        return len(self._pending)
+    
+    def __enter__(self) -> "WriteBuffer":
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
 
 
 # 便捷函數
@@ -5,6 +5,8 @@ Unit Tests for MemGPT-Style Layered Memory System
 import unittest
 import tempfile
 import shutil
+import sqlite3
+import time
 from pathlib import Path
 
 # 添加父目錄到路徑
@@ -12,8 +14,8 @@ import sys
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from memory.core_memory import CoreMemory, CoreMemorySection
-from memory.recall_memory import RecallMemory, Message, ConversationSummary
-from memory.archival_memory import ArchivalMemory, MemoryEntry, SimpleEmbedding
+from memory.recall_memory import RecallMemory, Message, ConversationSummary, Tokenizer
+from memory.archival_memory import ArchivalMemory, MemoryEntry, SimpleEmbedding, VectorIndex, MappedVectorIndex
 from memory.auto_summarize import AutoSummarizer, SummaryConfig
 from memory.memory_manager import MemoryManager, MemoryContext
 
@@ -115,7 +117,320 @@ class TestRecallMemory(unittest.TestCase):
         
         self.assertGreater(len(results), 0)
         self.assertIn("Python", results[0].content)
-    
+
+    def test_search_fts_cjk_snippet(self):
+        """測試全文索引搜索中文並返回片段"""
+        if not self.recall.has_fts:
+            self.skipTest("SQLite 不支持 FTS5 trigram")
+        self.recall.add_message("s1", "user", "我們決定使用向量資料庫來存放長期記憶")
+        self.recall.add_message("s2", "user", "今天天氣很好")
+
+        results = self.recall.search("向量資料庫")
+
+        self.assertEqual(len(results), 1)
+        self.assertIn("[向量資料庫]", results[0].snippet)
+        self.assertEqual(self.recall.search("向量資料庫", session_id="s2"), [])
+
+    def test_search_fts_rebuilds_existing_db(self):
+        """測試舊數據庫首次開啟時建立全文索引"""
+        self.recall.add_message("s1", "user", "legacy message about kafka")
+        conn = self.recall._get_conn()
+        conn.executescript("""
+            DROP TRIGGER messages_fts_ai;
+            DROP TRIGGER messages_fts_ad;
+            DROP TRIGGER messages_fts_au;
+            DROP TABLE messages_fts;
+        """)
+
+        reopened = RecallMemory(str(self.db_path))
+        if not reopened.has_fts:
+            self.skipTest("SQLite 不支持 FTS5 trigram")
+
+        results = reopened.search("kafka")
+        self.assertEqual(len(results), 1)
+
+    def test_add_messages(self):
+        """測試批量添加消息"""
+        first = self.recall.add_message("s1", "user", "before")
+        ids = self.recall.add_messages([
+            {'session_id': "s1", 'role': "user", 'content': "one"},
+            {'session_id': "s2", 'role': "assistant", 'content': "two", 'metadata': {'k': 1}},
+        ])
+
+        self.assertEqual(ids, [first + 1, first + 2])
+        self.assertEqual(self.recall.add_messages([]), [])
+        stats = self.recall.get_session_stats("s1")
+        self.assertEqual(stats['message_count'], 2)
+
+    def test_wal_mode(self):
+        """測試使用 WAL 日誌模式"""
+        mode = self.recall._get_conn().execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode, "wal")
+
+    def test_write_buffer(self):
+        """測試寫入緩衝按數量與時間寫入"""
+        buf = self.recall.buffered(max_size=3, max_delay=0.05)
+        buf.add("s1", "user", "a")
+        buf.add("s1", "user", "b")
+        self.assertEqual(self.recall.get_session_stats("s1")['message_count'], 0)
+        buf.add("s1", "user", "c")
+        self.assertEqual(self.recall.get_session_stats("s1")['message_count'], 3)
+
+        buf.add("s1", "user", "d")
+        time.sleep(0.3)
+        self.assertEqual(len(buf), 0)
+        self.assertEqual(self.recall.get_session_stats("s1")['message_count'], 4)
+
+        with self.recall.buffered(max_size=100, max_delay=60) as buf:
+            buf.add("s2", "user", "e")
+        self.assertEqual(self.recall.get_session_stats("s2")['message_count'], 1)
+
+    def test_write_buffer_failure_requeues(self):
+        """測試寫入失敗時消息按原順序留在緩衝"""
+        buf = self.recall.buffered(max_size=100, max_delay=60)
+        buf.add("s1", "user", "a")
+        buf.add("s1", "user", "b")
+        add_messages = self.recall.add_messages
+        self.recall.add_messages = lambda pending: 1 / 0
+        with self.assertRaises(ZeroDivisionError):
+            buf.flush()
+        self.assertEqual(len(buf), 2)
+
+        buf.add("s1", "user", "c")
+        self.recall.add_messages = add_messages
+        buf.flush()
+        history = self.recall.get_history("s1")
+        self.assertEqual([m.content for m in history], ["a", "b", "c"])
+
+    def test_write_buffer_timed_retry(self):
+        """測試定時寫入失敗後自動重試"""
+        buf = self.recall.buffered(max_size=100, max_delay=0.01)
+        add_messages = self.recall.add_messages
+        calls = []
+
+        def flaky(pending):
+            calls.append(len(pending))
+            if len(calls) == 1:
+                raise sqlite3.OperationalError("database is locked")
+            return add_messages(pending)
+
+        self.recall.add_messages = flaky
+        with self.assertLogs("memory.recall_memory", level="ERROR"):
+            buf.add("s1", "user", "a")
+            deadline = time.monotonic() + 5
+            while not self.recall.get_history("s1") and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual([m.content for m in self.recall.get_history("s1")], ["a"])
+
+    def test_get_history_keyset(self):
+        """測試 keyset 分頁（同一秒內的消息按 ID 排序）"""
+        ids = self.recall.add_messages([
+            {'session_id': "s1", 'role': "user", 'content': f"m{i}"} for i in range(7)
+        ])
+        self.recall.add_message("s2", "user", "other")
+
+        latest = self.recall.get_history("s1", limit=3)
+        self.assertEqual([m.id for m in latest], ids[4:])
+        older = self.recall.get_history("s1", limit=3, before_id=latest[0].id)
+        self.assertEqual([m.id for m in older], ids[1:4])
+        newer = self.recall.get_history("s1", limit=10, after_id=ids[1])
+        self.assertEqual([m.id for m in newer], ids[2:])
+        self.assertEqual(self.recall.get_history("s1", before_id=999), [])
+
+    def test_iter_messages(self):
+        """測試流式遍歷會話消息"""
+        ids = self.recall.add_messages([
+            {'session_id': "s1", 'role': "user", 'content': f"m{i}"} for i in range(5)
+        ])
+
+        streamed = list(self.recall.iter_messages("s1", batch_size=2))
+
+        self.assertEqual([m.id for m in streamed], ids)
+        self.assertEqual(list(self.recall.iter_messages("missing")), [])
+
+    def test_compact_session(self):
+        """測試壓縮：窗口外的消息摘要後移入冷存儲"""
+        recall = RecallMemory(str(self.db_path), auto_compress_threshold=5,
+                              compress_window=3, compress_in_background=False)
+        ids = [recall.add_message("s1", "user", f"I like tea number {i}.") for i in range(6)]
+
+        recent = recall.get_recent_messages("s1")
+        self.assertEqual([m.id for m in recent[1:]], ids[3:])
+        self.assertIn("[Previous conversation summary]", recent[0].content)
+        summary = recall.get_summary("s1")
+        self.assertEqual(summary.message_count, 3)
+        self.assertTrue(summary.key_points)
+
+        self.assertEqual(recall.get_session_stats("s1", include_archived=False)['message_count'], 3)
+        self.assertEqual(recall.get_session_stats("s1")['message_count'], 6)
+        self.assertEqual([m.id for m in recall.iter_messages("s1", include_archived=True)], ids)
+
+        recall.clear_session("s1")
+        self.assertEqual(recall.get_session_stats("s1", include_archived=True)['message_count'], 0)
+
+    def test_compact_session_background(self):
+        """測試後台壓縮"""
+        recall = RecallMemory(str(self.db_path), auto_compress_threshold=5, compress_window=3)
+        for i in range(12):
+            recall.add_message("s1", "user", f"message {i}")
+        recall.wait_for_compression()
+
+        self.assertLessEqual(recall.get_session_stats("s1", include_archived=False)['message_count'], 5)
+        self.assertEqual(recall.get_session_stats("s1", include_archived=True)['message_count'], 12)
+        self.assertIsNotNone(recall.get_summary("s1"))
+
+    def test_compacted_messages_stay_visible(self):
+        """測試默認的後台壓縮後搜索、統計與會話列表仍包含冷存儲"""
+        for i in range(120):
+            content = "I fixed the zebrafish tank." if i == 0 else f"Please fix issue {i}."
+            self.recall.add_message("s1", "user", content)
+        self.recall.wait_for_compression()
+
+        self.assertEqual([m.content for m in self.recall.search("zebrafish")], ["I fixed the zebrafish tank."])
+        self.assertEqual(self.recall.search("zebrafish", include_archived=False), [])
+        self.assertEqual(self.recall.get_session_stats("s1")['message_count'], 120)
+        self.assertEqual(self.recall.list_sessions()[0]['message_count'], 120)
+
+        # 多次壓縮後摘要文本重新生成，不逐段拼接
+        summary = self.recall.get_summary("s1").summary
+        self.assertEqual(summary.count("Session involved"), 1)
+
+    def test_session_stats_table(self):
+        """測試會話統計表與 messages 聚合一致"""
+        def aggregate(session_id):
+            row = self.recall._get_conn().execute(
+                """SELECT COUNT(*), MIN(timestamp), MAX(timestamp), SUM(LENGTH(content))
+                   FROM messages WHERE session_id = ?""", (session_id,)
+            ).fetchone()
+            return dict(zip(['message_count', 'start_time', 'end_time', 'total_chars'], row),
+                        session_id=session_id)
+
+        self.recall.add_message("s1", "user", "Hello")
+        self.recall.add_messages([
+            {'session_id': "s1", 'role': "assistant", 'content': "Hi there"},
+            {'session_id': "s2", 'role': "user", 'content': "Other"},
+        ])
+        conn = self.recall._get_conn()
+        conn.execute("DELETE FROM messages WHERE id = 1")
+        conn.commit()
+
+        for session_id in ("s1", "s2", "missing"):
+            self.assertEqual(self.recall.get_session_stats(session_id), aggregate(session_id))
+        self.assertEqual({s['session_id'] for s in self.recall.list_sessions()}, {"s1", "s2"})
+
+        self.recall.clear_session("s2")
+        self.assertEqual([s['session_id'] for s in self.recall.list_sessions()], ["s1"])
+
+    def test_session_stats_backfill(self):
+        """測試舊數據庫首次開啟時回填會話統計"""
+        self.recall.add_message("s1", "user", "Hello")
+        conn = self.recall._get_conn()
+        conn.executescript("""
+            DROP TRIGGER session_stats_ai;
+            DROP TRIGGER session_stats_ad;
+            DROP TRIGGER session_stats_au;
+            DROP TABLE session_stats;
+        """)
+
+        reopened = RecallMemory(str(self.db_path))
+
+        self.assertEqual(reopened.get_session_stats("s1")['message_count'], 1)
+
+    def test_context_packs_newest_first(self):
+        """測試上下文從最新消息往回裝到預算為止"""
+        self.recall.add_message("s1", "user", "a" * 400)
+        self.recall.add_message("s1", "assistant", "b" * 40)
+        self.recall.add_message("s1", "user", "c" * 40)
+
+        context = self.recall.get_messages_for_context("s1", max_tokens=50)
+
+        self.assertEqual([m['content'][0] for m in context], ["b", "c"])
+
+    def test_context_token_count_cache(self):
+        """測試 token 數快取在消息行上，換分詞器後重算"""
+        class WordTokenizer(Tokenizer):
+            name = "words"
+            calls = 0
+
+            def count(self, text):
+                WordTokenizer.calls += 1
+                return len(text.split())
+
+        self.recall.add_message("s1", "user", "one two three")
+        self.recall.add_message("s1", "assistant", "four five")
+        recall = RecallMemory(str(self.db_path), tokenizer=WordTokenizer())
+
+        self.assertEqual(len(recall.get_messages_for_context("s1", max_tokens=5)), 2)
+        self.assertEqual(WordTokenizer.calls, 2)
+        self.assertEqual(len(recall.get_messages_for_context("s1", max_tokens=4)), 1)
+        self.assertEqual(WordTokenizer.calls, 2)
+
+        row = recall._get_conn().execute(
+            "SELECT token_count, token_model FROM messages WHERE content = 'one two three'"
+        ).fetchone()
+        self.assertEqual(tuple(row), (3, "words"))
+
+        self.recall.get_messages_for_context("s1")
+        row = recall._get_conn().execute(
+            "SELECT token_model FROM messages WHERE content = 'one two three'"
+        ).fetchone()
+        self.assertEqual(row[0], self.recall.tokenizer.name)
+
+    def test_context_token_cache_skips_when_locked(self):
+        """測試其他連接持有寫鎖時不等待寫回 token 快取"""
+        self.recall.add_message("s1", "user", "hello")
+        self.recall._get_conn().execute("UPDATE messages SET token_count = NULL")
+        self.recall._get_conn().commit()
+
+        writer = sqlite3.connect(str(self.db_path))
+        writer.execute("BEGIN IMMEDIATE")
+        try:
+            start = time.monotonic()
+            context = self.recall.get_messages_for_context("s1")
+            self.assertLess(time.monotonic() - start, 1)
+        finally:
+            writer.rollback()
+            writer.close()
+
+        self.assertEqual([m['content'] for m in context], ["hello"])
+        row = self.recall._get_conn().execute("SELECT token_count FROM messages").fetchone()
+        self.assertIsNone(row[0])
+
+    def test_context_summary_replaces_overflow(self):
+        """測試摘要用剩餘預算並放在最前面"""
+        self.recall.save_summary(ConversationSummary(
+            session_id="s1", summary="earlier", key_points=[],
+            start_time="", end_time="", message_count=5
+        ))
+        self.recall.add_message("s1", "user", "x" * 200)
+        self.recall.add_message("s1", "user", "y" * 40)
+
+        context = self.recall.get_messages_for_context("s1", max_tokens=30)
+        self.assertEqual(context[0]['role'], "system")
+        self.assertIn("earlier", context[0]['content'])
+        self.assertEqual([m['content'][0] for m in context[1:]], ["y"])
+
+        context = self.recall.get_messages_for_context("s1", max_tokens=30, include_summary=False)
+        self.assertEqual([m['content'][0] for m in context], ["y"])
+
+    def test_context_summary_never_drops_newest(self):
+        """測試摘要接近預算時仍保留最新消息"""
+        self.recall.save_summary(ConversationSummary(
+            session_id="s1", summary="s" * 360, key_points=[],
+            start_time="", end_time="", message_count=59
+        ))
+        for i in range(60):
+            self.recall.add_message("s1", "user", f"msg {i}")
+        summary_tokens = self.recall.tokenizer.count(
+            "[Previous conversation summary]: " + "s" * 360
+        )
+
+        context = self.recall.get_messages_for_context("s1", max_tokens=summary_tokens + 1)
+        self.assertEqual(context[-1]['content'], "msg 59")
+        self.assertNotEqual(context[0]['role'], "system")
+
     def test_save_and_get_summary(self):
         """測試保存和獲取摘要"""
         summary = ConversationSummary(
@@ -176,6 +491,67 @@ class TestArchivalMemory(unittest.TestCase):
         self.assertIsInstance(results, list)
         # 可能有結果也可能沒有（取決於嵌入質量）
     
+    def test_search_filters_and_delete(self):
+        """測試按類型、來源過濾與刪除後搜索"""
+        kept = self.archival.insert("Python tips", "fact", "s1")
+        self.archival.insert("Python tips", "preference", "s1")
+        gone = self.archival.insert("Python tips", "fact", "s2")
+
+        results = self.archival.search("Python tips", limit=5, memory_type="fact")
+        self.assertEqual({r['id'] for r in results}, {kept, gone})
+
+        self.assertTrue(self.archival.delete(gone))
+        results = self.archival.search("Python tips", limit=5, memory_type="fact")
+        self.assertEqual([r['id'] for r in results], [kept])
+        self.assertEqual(self.archival.search("Python", source="missing"), [])
+        self.assertEqual(len(self.archival.get_by_id(kept).embedding), 384)
+
+    def test_insert_many(self):
+        """測試批量插入：相同條目去重，不同來源各自保存"""
+        ids = self.archival.insert_many([
+            {'content': "Python tips", 'source': "s1"},
+            {'content': "Rust tips", 'memory_type': "key_point"},
+            {'content': "Python tips", 'source': "s1"},
+            {'content': "Python tips", 'source': "s2", 'metadata': {'k': 2}},
+        ])
+
+        self.assertEqual(len(ids), 4)
+        self.assertEqual(ids[0], ids[2])
+        self.assertNotEqual(ids[0], ids[3])
+        self.assertEqual(self.archival.get_stats()['total_entries'], 3)
+        self.assertEqual(self.archival.get_by_id(ids[0]).source, "s1")
+        self.assertEqual(self.archival.get_by_id(ids[3]).metadata, {'k': 2})
+
+        again = self.archival.insert_many([
+            {'content': "Rust tips", 'memory_type': "key_point"},
+            {'content': "Go tips"},
+        ])
+        self.assertEqual(again[0], ids[1])
+        self.assertEqual(self.archival.get_stats()['total_entries'], 4)
+        self.assertEqual(self.archival.search("Go tips", limit=1)[0]['id'], again[1])
+
+    def test_insert_many_explicit_id_replaces(self):
+        """測試指定 memory_id 時與 insert 一樣替換已有條目"""
+        self.archival.insert("old text", "fact", "s1", memory_id="m1")
+
+        ids = self.archival.insert_many([{'content': "new text", 'source': "s2", 'memory_id': "m1"}])
+
+        self.assertEqual(ids, ["m1"])
+        entry = self.archival.get_by_id("m1")
+        self.assertEqual((entry.content, entry.source), ("new text", "s2"))
+        self.assertEqual(self.archival.get_stats()['total_entries'], 1)
+
+    def test_reopen_keeps_entries(self):
+        """測試重新打開後記憶仍在"""
+        memory_id = self.archival.insert("Python tips", "fact", "s1", metadata={"k": 1})
+
+        reopened = ArchivalMemory(str(self.db_path))
+
+        entry = reopened.get_by_id(memory_id)
+        self.assertIsNotNone(entry)
+        self.assertEqual(entry.metadata, {"k": 1})
+        self.assertEqual(reopened.search("Python tips", limit=1)[0]['id'], memory_id)
+
     def test_get_stats(self):
         """測試統計"""
         stats = self.archival.get_stats()
@@ -193,6 +569,110 @@ class TestArchivalMemory(unittest.TestCase):
         self.assertIsInstance(results, list)
 
 
+class TestVectorIndex(unittest.TestCase):
+    """測試內存向量索引"""
+
+    def test_top_k(self):
+        """測試 top-k 排序與過濾"""
+        index = VectorIndex(dim=2, capacity=2)
+        index.add("a", [1.0, 0.0], "fact", "s1")
+        index.add("b", [0.6, 0.8], "fact", "s2")
+        index.add("c", [0.0, 1.0], "event", "s1")
+
+        self.assertEqual([i for i, _ in index.search([1.0, 0.0], limit=2)], ["a", "b"])
+        self.assertEqual([i for i, _ in index.search([1.0, 0.0], source="s1")], ["a", "c"])
+        self.assertEqual(index.search([1.0, 0.0], memory_type="event", source="s2"), [])
+
+    def test_ties_in_insertion_order(self):
+        """測試同分時按插入順序取前 k 個"""
+        index = VectorIndex(dim=2)
+        for i in range(50):
+            index.add(f"m{i}", [1.0, 0.0] if i % 7 else [2.0, 0.0])
+
+        hits = [i for i, _ in index.search([1.0, 0.0], limit=10)]
+        self.assertEqual(hits, ["m0", "m7", "m14", "m21", "m28", "m35", "m42", "m49", "m1", "m2"])
+
+    def test_tombstones_compact(self):
+        """測試刪除打墓碑，墓碑過多時壓縮"""
+        index = VectorIndex(dim=2)
+        index.MIN_COMPACT = 2
+        for i in range(4):
+            index.add(f"m{i}", [1.0, float(i)])
+        index.add("m0", [0.0, 1.0])  # 重複 id 覆蓋舊行
+        index.remove("m1")
+        index.remove("m2")
+
+        self.assertEqual(len(index), 2)
+        self.assertEqual(len(index._ids), 2)
+        self.assertEqual([i for i, _ in index.search([0.0, 1.0])], ["m3", "m0"])
+        self.assertEqual(index.get("m0").tolist(), [0.0, 1.0])
+
+
+class TestMappedVectorIndex(unittest.TestCase):
+    """測試檔案持久化的向量索引"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = Path(self.temp_dir) / "index"
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_shared_and_persistent(self):
+        """測試兩個實例共享同一存檔，重新打開後數據仍在"""
+        writer = MappedVectorIndex(self.path, dim=2)
+        reader = MappedVectorIndex(self.path, dim=2)
+        entry = MemoryEntry(id="a", content="alpha", memory_type="fact", source="s1")
+        writer.add("a", [1.0, 0.0], "fact", "s1", entry)
+        writer.add("b", [0.0, 1.0], "event", "s1")
+
+        reader.refresh()
+        self.assertEqual([i for i, _ in reader.search([1.0, 0.0])], ["a", "b"])
+        self.assertEqual(reader.get_entry("a").content, "alpha")
+
+        reopened = MappedVectorIndex(self.path, dim=2)
+        reopened.refresh()
+        self.assertEqual(len(reopened), 2)
+        self.assertEqual(reopened.get("b").tolist(), [0.0, 1.0])
+
+    def test_compact_rewrites_files(self):
+        """測試壓縮後其他實例重新載入"""
+        writer = MappedVectorIndex(self.path, dim=2)
+        reader = MappedVectorIndex(self.path, dim=2)
+        for i in range(4):
+            writer.add(f"m{i}", [1.0, float(i)])
+        reader.refresh()
+        for i in range(3):
+            writer.remove(f"m{i}")
+        writer.compact()
+
+        reader.refresh()
+        self.assertEqual(len(reader), 1)
+        self.assertEqual(reader._n, 1)
+        self.assertEqual(reader.search([0.0, 1.0]), [("m3", 3.0)])
+        self.assertEqual(len(list(Path(self.temp_dir).glob("*.vec"))), 1)
+        self.assertEqual(reader.get_entry("m3").id, "m3")
+
+    def test_open_reads_only_hits(self):
+        """測試打開大存檔不讀取條目記錄，搜索只讀 top-k 命中"""
+        writer = MappedVectorIndex(self.path, dim=2)
+        entries = [MemoryEntry(id=f"m{i}", content=f"c{i}", source="s") for i in range(5000)]
+        writer.add_many(entries, [[1.0, float(i)] for i in range(5000)])
+
+        reads = []
+        reopened = MappedVectorIndex(self.path, dim=2)
+        read_record = reopened._read_record
+        reopened._read_record = lambda row: reads.append(row) or read_record(row)
+        reopened.refresh()
+        self.assertEqual(len(reopened), 5000)
+        self.assertEqual(reads, [])
+
+        hits = reopened.search_entries([0.0, 1.0], limit=3)
+        self.assertEqual([e.content for e, _ in hits], ["c4999", "c4998", "c4997"])
+        self.assertEqual(len(reads), 3)
+        self.assertEqual(list(Path(self.temp_dir).glob("*.log")), [])
+
+
 class TestSimpleEmbedding(unittest.TestCase):
     """測試簡單嵌入"""
     
@@ -216,6 +696,21 @@ class TestSimpleEmbedding(unittest.TestCase):
         
         self.assertNotEqual(vec1, vec2)
 
+    def test_embed_batch(self):
+        """測試批量嵌入與逐條結果一致，相似文本更接近"""
+        embedder = SimpleEmbedding()
+        texts = ["python is great", "python is good", "weather today", ""]
+
+        batch = embedder.embed_batch(texts)
+
+        self.assertEqual(batch.shape, (4, 384))
+        for text, row in zip(texts, batch):
+            self.assertEqual(embedder.embed(text), row.tolist())
+        self.assertGreater(batch[0] @ batch[1], batch[0] @ batch[2])
+        self.assertEqual(float(abs(batch[3]).sum()), 0.0)
+        # 特徵分散到全部維度
+        self.assertGreater(int(batch[:3].any(axis=0).sum()), 32)
+
 
 class TestAutoSummarizer(unittest.TestCase):
     """測試自動摘要"""
@@ -254,6 +749,24 @@ class TestAutoSummarizer(unittest.TestCase):
         
         self.assertIsInstance(facts, list)
 
+    def test_summarize_session_streaming(self):
+        """測試流式摘要與整批摘要結果一致"""
+        contents = [
+            ("user", "I like Python."),
+            ("user", "My name is John."),
+            ("assistant", "I created the script. It works."),
+            ("user", "I love tests!"),
+        ] * 3
+        for role, content in contents:
+            self.recall.add_message("s1", role, content)
+        messages = self.recall.get_recent_messages("s1", limit=100, include_summary=False)
+
+        summary = self.summarizer.summarize_session("s1", store_to_archival=False)
+
+        self.assertEqual(summary.key_points, self.summarizer._extract_key_points(messages))
+        self.assertEqual(summary.summary, self.summarizer._generate_summary(messages))
+        self.assertEqual(summary.message_count, len(contents))
+
 
 class TestMemoryManager(unittest.TestCase):
     """測試記憶管理器"""
@@ -296,6 +809,20 @@ class TestMemoryManager(unittest.TestCase):
         self.assertIsInstance(context, MemoryContext)
         self.assertIn("CORE MEMORY", context.core_prompt)
     
+    def test_summarizer_reuses_archival(self):
+        """測試摘要寫入管理器自己的存檔記憶"""
+        manager = MemoryManager(
+            workspace_path=str(self.workspace),
+            recall_db_path=str(self.workspace / "recall.db"),
+            archival_db_path=str(self.workspace / "archival.lance")
+        )
+        self.assertIs(manager.summarizer.archival, manager.archival)
+
+        manager.add_message("s1", "user", "I like green tea.")
+        manager.summarizer.summarize_session("s1")
+        results = manager.archival.search("green tea", memory_type="key_point")
+        self.assertEqual(results[0]["source"], "s1")
+
     def test_format_context_for_llm(self):
         """測試格式化上下文"""
         manager = MemoryManager(workspace_path=str(self.workspace))